@@ -0,0 +1,196 @@
+# brain_tumor/batching.py
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+_LIVENESS_CHECK = 1.0  # seconds between checks that the batching thread is still running
+
+
+class BatchTimeout(TimeoutError):
+    pass
+
+
+class MicroBatcher:
+    """
+    Collects single-scan tensors from concurrent requests and runs them
+    through the model as one batched forward pass.
+
+    A request waits at most `max_wait_ms` for company; as soon as
+    `max_batch_size` tensors are queued the batch is dispatched right away.
+    `predict` gives up after `timeout` seconds (None = wait forever).
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10, stats_window=1000, timeout=60):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._buffer = None  # reused batch array, only touched by the worker thread
+        self._worker = None
+        self._worker_pid = None
+
+        # Rolling windows used for tuning throughput vs. tail latency
+        self._batches = deque(maxlen=stats_window)
+        self._latencies = deque(maxlen=stats_window)
+        self._total_batches = 0
+        self._total_items = 0
+        self._restarts = 0
+
+    # 🧩 Public API
+    def submit(self, tensor):
+        """Queue one (H, W, C) tensor and return a Future for its (H, W, K) prediction."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((np.asarray(tensor), future, time.perf_counter()))
+        return future
+
+    def predict(self, tensor, timeout=None):
+        """Blocking helper used by request handlers; waits at most `timeout` seconds (default: the batcher's)."""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(tensor)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = _LIVENESS_CHECK if deadline is None else min(_LIVENESS_CHECK, max(0.0, deadline - time.monotonic()))
+            try:
+                return future.result(timeout=wait)
+            except FutureTimeout:
+                if deadline is not None and time.monotonic() >= deadline:
+                    future.cancel()  # still queued: the worker drops it
+                    raise BatchTimeout(f"No prediction within {timeout:g}s ({self._queue.qsize()} scans queued)")
+                self._ensure_worker()  # a dead batching thread is replaced; the queued scans carry on
+
+    def stats(self):
+        """Summary of recent batches: sizes, queue wait and end-to-end latency percentiles."""
+        with self._lock:
+            batches = list(self._batches)
+            latencies = list(self._latencies)
+            total_batches = self._total_batches
+            total_items = self._total_items
+
+        sizes = [b["size"] for b in batches]
+        inference = [b["inference_ms"] for b in batches]
+        waits = [b["queue_wait_ms"] for b in batches]
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize(),
+            "total_batches": total_batches,
+            "total_items": total_items,
+            "worker_restarts": self._restarts,
+            "window": len(batches),
+            "batch_size": _summarize(sizes),
+            "queue_wait_ms": _summarize(waits),
+            "inference_ms": _summarize(inference),
+            "request_latency_ms": _summarize(latencies),
+            "recent_batches": batches[-20:],
+        }
+
+    # 🧩 Worker thread
+    def _ensure_worker(self):
+        # The worker is started lazily (and restarted after a fork) so that
+        # importing this module never spawns threads in the parent process.
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self._queue = queue.Queue()
+            elif self._worker is not None:
+                self._restarts += 1
+                print("[WARN] Brain tumor batching thread died, restarting 🔄")
+            self._worker = threading.Thread(target=self._run, name="brain-tumor-batcher", daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def _collect(self):
+        """Block for the first item, then gather more until the batch is full or the window closes."""
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Drain anything that is already waiting without extending the window
+        while len(items) < self.max_batch_size:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            # Requests that timed out while queued were cancelled: don't spend inference on them
+            items = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not items:
+                continue
+            try:
+                self._dispatch(items)
+            except BaseException as e:
+                # Whatever happens, no caller is left waiting on a batch this thread took
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+
+    def _dispatch(self, items):
+        tensors, futures, enqueued = zip(*items)
+        started = time.perf_counter()
+        batch = self._stack(tensors)
+        outputs = np.asarray(self.predict_fn(batch))
+        if len(outputs) != len(items):
+            raise ValueError(f"Model returned {len(outputs)} predictions for a batch of {len(items)}")
+        finished = time.perf_counter()
+
+        for i, future in enumerate(futures):
+            future.set_result(outputs[i])
+
+        with self._lock:
+            self._total_batches += 1
+            self._total_items += len(items)
+            self._batches.append({
+                "size": len(items),
+                "queue_wait_ms": round((started - min(enqueued)) * 1000.0, 3),
+                "inference_ms": round((finished - started) * 1000.0, 3),
+            })
+            self._latencies.extend((finished - t) * 1000.0 for t in enqueued)
+
+    def _stack(self, tensors):
+        """Copy the batch into the preallocated buffer instead of allocating a new one per dispatch."""
+        first = tensors[0]
+        if self._buffer is None or self._buffer.shape[1:] != first.shape or self._buffer.dtype != first.dtype:
+            self._buffer = np.empty((self.max_batch_size, *first.shape), dtype=first.dtype)
+        batch = self._buffer[:len(tensors)]
+        for i, tensor in enumerate(tensors):
+            batch[i] = tensor
+        return batch
+
+
+def _summarize(values):
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(arr.size),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
@@ -0,0 +1,93 @@
+# brain_tumor/cache.py
+"""
+Content-addressed storage + result cache for MRI uploads.
+
+Uploads are hashed (SHA-256 of the bytes) and stored once under
+`uploads/mri_scans/<hash><ext>`; the U-Net result for a (hash, model version)
+pair is kept in ScanResultCache so a re-upload skips inference entirely.
+The result is the score plus the `detected_region` JSON (regions + compact
+mask, see regions.py); mask PNGs are no longer written per result. Entries
+from before that still point at a shared mask file under MASK_DIR.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BrainTumorAnalysis, ScanResultCache
+
+SCAN_DIR = "uploads/mri_scans/"
+MASK_DIR = "uploads/masked_results/"
+
+
+def cache_enabled():
+    return getattr(settings, "BRAIN_TUMOR_CACHE_ENABLED", True)
+
+
+def hash_upload(image_file):
+    """SHA-256 of an uploaded file, read in chunks; leaves the file rewound.
+
+    Uploads received by uploads.StreamingUploadHandler were hashed while streaming in and are not read again.
+    """
+    if getattr(image_file, "sha256", None):
+        return image_file.sha256
+    digest = hashlib.sha256()
+    image_file.seek(0)
+    for chunk in image_file.chunks():
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def store_scan(image_file, image_hash):
+    """Store the upload once per content hash and return its storage name."""
+    ext = os.path.splitext(image_file.name or "")[1].lower() or ".jpg"
+    name = f"{SCAN_DIR}{image_hash}{ext}"
+    if not default_storage.exists(name):
+        image_file.seek(0)
+        name = default_storage.save(name, image_file)
+    return name
+
+
+def lookup(image_hash, model_version):
+    """Cached (confidence_score, mask storage name or None, detected_region JSON) for this content + model, or None."""
+    entry = ScanResultCache.objects.filter(image_hash=image_hash, model_version=model_version).first()
+    if entry is None:
+        return None
+    if not entry.detected_region and not (entry.masked_image and default_storage.exists(entry.masked_image.name)):
+        entry.delete()  # legacy entry whose mask was removed from disk; treat as a miss
+        return None
+    ScanResultCache.objects.filter(pk=entry.pk).update(hit_count=F("hit_count") + 1, last_used_at=timezone.now())
+    return entry.confidence_score, entry.masked_image.name or None, entry.detected_region
+
+
+def store_result(image_hash, model_version, confidence_score, detected_region):
+    """Record the result (score + detected_region JSON) for this content + model."""
+    try:
+        ScanResultCache.objects.update_or_create(
+            image_hash=image_hash,
+            model_version=model_version,
+            defaults={"confidence_score": confidence_score, "detected_region": detected_region},
+        )
+    except IntegrityError:
+        pass  # a concurrent request cached the same scan first
+    evict()
+
+
+def evict():
+    """LRU eviction down to BRAIN_TUMOR_CACHE_MAX_ENTRIES; mask files still used by an analysis are kept."""
+    max_entries = getattr(settings, "BRAIN_TUMOR_CACHE_MAX_ENTRIES", 10000)
+    excess = ScanResultCache.objects.count() - max_entries
+    if excess <= 0:
+        return 0
+
+    stale = list(ScanResultCache.objects.order_by("last_used_at").values_list("pk", "masked_image")[:excess])
+    ScanResultCache.objects.filter(pk__in=[pk for pk, _ in stale]).delete()
+    for _, mask_name in stale:
+        if mask_name and not BrainTumorAnalysis.objects.filter(masked_image=mask_name).exists():
+            default_storage.delete(mask_name)
+    return len(stale)
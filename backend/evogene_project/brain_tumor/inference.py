@@ -0,0 +1,150 @@
+# brain_tumor/inference.py
+"""
+U-Net inference runtimes for CPU-only nodes.
+
+BRAIN_TUMOR_INFERENCE picks one per deployment (settings.ML_MODELS points the
+registry at the matching file and loader):
+
+* "keras" (default) — the .h5 model through `predict_on_batch`.
+* "graph" — the same model traced once into a `tf.function` with a fixed
+  (None, 128, 128, 2) float32 signature, so no per-call Python dispatch or
+  retracing; BRAIN_TUMOR_XLA=1 also compiles it with XLA.
+* "tflite" — a converted artifact (float16, dynamic-range or int8), built at
+  build time with `manage.py export_unet` and run on the TFLite interpreter
+  (ai-edge-litert / tflite-runtime when installed, else tf.lite).
+
+Every runtime exposes `predict_on_batch(batch) -> np.ndarray`, so the
+micro-batcher and the bulk endpoint don't care which one is loaded. Use
+`manage.py bench_unet_inference` to check Dice/IoU against Keras before
+switching a deployment over.
+"""
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+QUANTIZATIONS = ("float16", "dynamic", "int8", "none")
+
+
+def load_graph(path):
+    from .utils import load_unet
+    return GraphUNet(load_unet(path), jit_compile=getattr(settings, "BRAIN_TUMOR_XLA", False))
+
+
+def load_tflite(path):
+    threads = getattr(settings, "BRAIN_TUMOR_TFLITE_THREADS", 0) or os.cpu_count()
+    return TFLiteUNet(path, num_threads=threads)
+
+
+def tflite_path(source, quantize):
+    """Where `export_unet` puts the artifact for `source`: models/<stem>.<quantize>.tflite."""
+    stem, _ = os.path.splitext(str(source))
+    return f"{stem}.{quantize}.tflite"
+
+
+def load_samples(directory, limit=None):
+    """(N, 128, 128, 2) batch of the images in `directory`, preprocessed like uploads."""
+    from .utils import IMAGE_EXTENSIONS, preprocess_scan
+
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    if not names:
+        raise ValueError(f"No images in {directory}")
+    batch = np.empty((len(names), 128, 128, 2), dtype=np.float32)
+    for i, name in enumerate(names):
+        preprocess_scan(os.path.join(directory, name), out=batch[i])
+    return batch
+
+
+def synthetic_samples(n, seed=0):
+    """Noisy phantom slices with bright elliptical blobs (smoke tests only, not real MRI)."""
+    from io import BytesIO
+    from PIL import Image
+    from .utils import preprocess_scan
+
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:256, :256]
+    tensors = []
+    for _ in range(n):
+        img = rng.normal(60, 15, (256, 256))
+        img[(yy - 128) ** 2 / 100 ** 2 + (xx - 128) ** 2 / 80 ** 2 <= 1] += 50  # "brain"
+        for _ in range(rng.integers(0, 3)):
+            cy, cx, ry, rx = rng.integers(70, 186, 2).tolist() + rng.integers(6, 25, 2).tolist()
+            img[(yy - cy) ** 2 / ry ** 2 + (xx - cx) ** 2 / rx ** 2 <= 1] += 90  # "lesion"
+        buffer = BytesIO()
+        Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(buffer, format="PNG")
+        buffer.seek(0)
+        tensors.append(preprocess_scan(buffer))
+    return np.stack(tensors)
+
+
+class GraphUNet:
+    """Keras model traced into a single concrete function."""
+
+    def __init__(self, model, jit_compile=False):
+        import tensorflow as tf
+
+        spec = tf.TensorSpec([None, *model.input_shape[1:]], tf.float32)
+        self._fn = tf.function(lambda x: model(x, training=False), input_signature=[spec], jit_compile=jit_compile)
+        self._fn.get_concrete_function()  # trace now, not on the first request
+        self.input_shape = model.input_shape
+
+    def predict_on_batch(self, batch):
+        return self._fn(np.asarray(batch, dtype=np.float32)).numpy()
+
+
+class TFLiteUNet:
+    """TFLite interpreter behind a lock (interpreters are not thread-safe).
+
+    The batch dimension is resized on demand; tensors are only reallocated when
+    the batch size changes. Quantized (int8/uint8) inputs and outputs are
+    (de)quantized here, so callers always pass and get float32.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.interpreter = _interpreter_class()(model_path=str(path), num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(self._input["shape_signature"])
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def predict_on_batch(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input["index"], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input["index"], _quantize(batch, self._input))
+            self.interpreter.invoke()
+            return _dequantize(self.interpreter.get_tensor(self._output["index"]), self._output)
+
+
+def _interpreter_class():
+    # The standalone runtimes are a few MB instead of all of TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def _quantize(x, detail):
+    dtype = np.dtype(detail["dtype"])
+    if dtype == np.float32:
+        return x
+    scale, zero_point = detail["quantization"]
+    info = np.iinfo(dtype)
+    return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(x, detail):
+    if np.dtype(detail["dtype"]) == np.float32:
+        return x
+    scale, zero_point = detail["quantization"]
+    return (x.astype(np.float32) - zero_point) * scale
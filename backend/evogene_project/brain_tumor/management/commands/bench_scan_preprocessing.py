@@ -0,0 +1,162 @@
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from brain_tumor import regions
+from brain_tumor.utils import IMAGE_EXTENSIONS, INPUT_CHANNELS, INPUT_SIZE, encode_mask, postprocess_mask, preprocess_scan
+
+
+# The pre-rework pipeline, kept verbatim as the baseline
+def legacy_preprocess(image_file):
+    img = Image.open(image_file)
+    img = img.convert("L")
+    img = img.resize((128, 128))
+    img_array = np.array(img)
+    if len(img_array.shape) == 2:
+        img_array = np.stack([img_array, img_array], axis=-1)
+    return img_array / 255.0
+
+
+def legacy_postprocess(mask_output):
+    tumor_score = float(np.mean(mask_output))
+    mask_img = Image.fromarray((mask_output[:, :, 0] * 255).astype(np.uint8))
+    mask_img = mask_img.resize((256, 256))
+    mask_buffer = BytesIO()
+    mask_img.save(mask_buffer, format="PNG")
+    mask_buffer.seek(0)
+    return tumor_score, mask_buffer
+
+
+def synthetic_uploads(n, size, seed=0):
+    """Alternating JPEG / PNG phantom slices of `size` x `size` pixels, as upload bytes."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size] / size
+    uploads = []
+    for i in range(n):
+        img = rng.normal(50, 12, (size, size)) + 70 * (((yy - 0.5) / 0.4) ** 2 + ((xx - 0.5) / 0.32) ** 2 <= 1)
+        cy, cx = rng.uniform(0.3, 0.7, 2)
+        img += 90 * (((yy - cy) / 0.06) ** 2 + ((xx - cx) / 0.08) ** 2 <= 1)
+        pil = Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).convert("RGB")  # scanners export RGB
+        buffer = BytesIO()
+        pil.save(buffer, format="JPEG" if i % 2 == 0 else "PNG", quality=92)
+        uploads.append((f"synthetic_{i}.{'jpg' if i % 2 == 0 else 'png'}", buffer.getvalue()))
+    return uploads
+
+
+def synthetic_masks(n, seed=0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:128, :128]
+    masks = []
+    for _ in range(n):
+        cy, cx, r = rng.integers(30, 98), rng.integers(30, 98), rng.integers(5, 20)
+        logits = (r ** 2 - (yy - cy) ** 2 - (xx - cx) ** 2) / 40.0
+        masks.append((1 / (1 + np.exp(-logits)))[:, :, None].astype(np.float32))
+    return masks
+
+
+class Command(BaseCommand):
+    help = "Per-image CPU time and peak (NumPy/Python) memory of MRI pre/postprocessing: legacy vs. current."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", default=None, help="Directory of real uploads (default: synthetic)")
+        parser.add_argument("--count", type=int, default=40, help="Synthetic uploads to generate")
+        parser.add_argument("--size", type=int, default=1024, help="Synthetic upload edge length in pixels")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options["samples"]:
+            names = sorted(n for n in os.listdir(options["samples"]) if n.lower().endswith(IMAGE_EXTENSIONS))
+            if not names:
+                raise CommandError(f"No images in {options['samples']}")
+            uploads = []
+            for name in names:
+                with open(os.path.join(options["samples"], name), "rb") as f:
+                    uploads.append((name, f.read()))
+        else:
+            uploads = synthetic_uploads(options["count"], options["size"])
+        masks = synthetic_masks(len(uploads))
+        self.stdout.write(f"{len(uploads)} uploads, {options['repeat']} passes each "
+                          f"(peak memory = tracemalloc, i.e. NumPy/Python buffers; Pillow's own buffers are not counted)")
+
+        batch = np.empty((len(uploads), *INPUT_SIZE, INPUT_CHANNELS), dtype=np.float32)
+        stages = {
+            "pre  legacy": lambda i: legacy_preprocess(BytesIO(uploads[i][1])),
+            "pre  current": lambda i: preprocess_scan(BytesIO(uploads[i][1])),
+            "pre  current+buffer": lambda i: preprocess_scan(BytesIO(uploads[i][1]), out=batch[i]),
+            "post legacy": lambda i: legacy_postprocess(masks[i]),
+            "post png": lambda i: (float(np.mean(masks[i])), encode_mask(masks[i])),
+            "post current": lambda i: postprocess_mask(masks[i]),
+        }
+        is_jpeg = np.tile([name.lower().endswith((".jpg", ".jpeg")) for name, _ in uploads], options["repeat"])
+        results = {}
+        for name, fn in stages.items():
+            cpu_ms, peak_kb, outputs = self._measure(fn, len(uploads), options["repeat"])
+            results[name] = outputs
+            by_format = ""
+            if name.startswith("pre"):
+                by_format = " | " + ", ".join(
+                    f"{label} {cpu_ms[mask].mean():7.3f} ms" for label, mask in (("jpeg", is_jpeg), ("other", ~is_jpeg))
+                    if mask.any()
+                )
+            self.stdout.write(
+                f"{name:>20}: cpu/image mean {cpu_ms.mean():7.3f} ms p50 {np.percentile(cpu_ms, 50):7.3f} ms "
+                f"p95 {np.percentile(cpu_ms, 95):7.3f} ms | peak {peak_kb.max():8.1f} KiB/image{by_format}"
+            )
+
+        # Parity: how far the new path moves the model input and the mask
+        diffs = [np.abs(np.asarray(new, dtype=np.float64) - old).max()
+                 for new, old in zip(results["pre  current"], results["pre  legacy"])]
+        jpeg = [d for (name, _), d in zip(uploads, diffs) if name.lower().endswith((".jpg", ".jpeg"))]
+        other = [d for (name, _), d in zip(uploads, diffs) if not name.lower().endswith((".jpg", ".jpeg"))]
+        self.stdout.write(
+            f"input max |Δ|: JPEG (draft decode) {max(jpeg, default=0):.4f}, other formats {max(other, default=0):.2e}"
+        )
+        same_pixels = all(
+            np.array_equal(np.asarray(Image.open(new[1])), np.asarray(Image.open(old[1])))
+            for new, old in zip(results["post png"], results["post legacy"])
+        )
+        png_bytes = sum(len(out[1].getvalue()) for out in results["post png"])
+        old_bytes = sum(len(out[1].getvalue()) for out in results["post legacy"])
+        self.stdout.write(f"mask PNGs: identical pixels {same_pixels}, size {png_bytes / max(old_bytes, 1):.2f}x legacy")
+
+        # What is stored now: regions + compact mask JSON; the decoded mask must be the thresholded prediction
+        threshold = regions.mask_threshold()
+        stored = [regions.dumps(out[1]) for out in results["post current"]]
+        exact = all(
+            np.array_equal(regions.decode_binary_mask(out[1]["mask"]), masks[i][:, :, 0] > threshold)
+            for i, out in enumerate(results["post current"]) if out[1]["region_count"] == len(out[1]["regions"])
+        )
+        encodings = {}
+        for out in results["post current"]:
+            encodings[out[1]["mask"]["encoding"]] = encodings.get(out[1]["mask"]["encoding"], 0) + 1
+        self.stdout.write(
+            f"detected_region JSON: {np.mean([len(t) for t in stored]):.0f} B/scan mean "
+            f"({sum(map(len, stored)) / max(old_bytes, 1):.3f}x legacy PNG bytes), encodings {encodings}, "
+            f"mask == prediction > {threshold}: {exact}"
+        )
+
+    @staticmethod
+    def _measure(fn, n, repeat):
+        """(per-image CPU ms over all passes, per-image peak KiB, outputs of the last pass)."""
+        for i in range(min(n, 3)):
+            fn(i)  # warm-up (codec tables, allocator)
+        cpu_ms, peaks, outputs = [], [], []
+        for r in range(repeat):
+            last = r == repeat - 1
+            for i in range(n):
+                t0 = time.process_time()
+                out = fn(i)
+                cpu_ms.append((time.process_time() - t0) * 1000)
+                if last:
+                    outputs.append(out)
+        for i in range(n):
+            tracemalloc.start()
+            fn(i)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+        return np.asarray(cpu_ms), np.asarray(peaks), outputs
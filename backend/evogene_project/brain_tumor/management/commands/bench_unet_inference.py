@@ -0,0 +1,118 @@
+import glob
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from brain_tumor.inference import GraphUNet, load_samples, load_tflite, synthetic_samples
+from brain_tumor.utils import load_unet
+
+
+def mask_agreement(reference, candidate, threshold=0.5):
+    """Mean Dice and IoU of thresholded first-channel masks (two empty masks agree perfectly)."""
+    ref = reference[..., 0] > threshold
+    cand = candidate[..., 0] > threshold
+    axes = (1, 2)
+    inter = np.logical_and(ref, cand).sum(axis=axes)
+    ref_area, cand_area = ref.sum(axis=axes), cand.sum(axis=axes)
+    union = ref_area + cand_area - inter
+    empty = union == 0
+    dice = np.where(empty, 1.0, 2 * inter / np.maximum(ref_area + cand_area, 1))
+    iou = np.where(empty, 1.0, inter / np.maximum(union, 1))
+    return float(dice.mean()), float(iou.mean()), float(dice.min())
+
+
+class Command(BaseCommand):
+    help = "Accuracy vs. latency of the U-Net runtimes (keras, graph, tflite artifacts) against the Keras model."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", default=None, help="Directory of MRI slices (default: synthetic phantoms)")
+        parser.add_argument("--limit", type=int, default=64)
+        parser.add_argument("--modes", default="keras,graph,tflite")
+        parser.add_argument("--tflite", default=None,
+                            help="Comma-separated .tflite files (default: every models/<stem>.*.tflite)")
+        parser.add_argument("--batch-size", type=int, default=settings.BRAIN_TUMOR_BATCH_MAX_SIZE)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--threshold", type=float, default=0.5, help="Mask threshold for Dice/IoU")
+
+    def handle(self, *args, **options):
+        source = settings.BRAIN_TUMOR_UNET_PATH
+        if options["samples"]:
+            try:
+                samples = load_samples(options["samples"], options["limit"])
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+        else:
+            self.stderr.write("[WARN] No --samples: using synthetic phantoms, accuracy numbers are a smoke test only")
+            samples = synthetic_samples(options["limit"])
+
+        started = time.perf_counter()
+        keras_model = load_unet(source)
+        keras_load = time.perf_counter() - started
+        reference = self._predict_all(keras_model, samples, options["batch_size"])
+        ref_scores = reference.mean(axis=(1, 2, 3))
+
+        runners = []
+        for mode in options["modes"].split(","):
+            if mode == "keras":
+                runners.append(("keras", lambda: keras_model, keras_load, os.path.getsize(source)))
+            elif mode == "graph":
+                runners.append(("graph", lambda: GraphUNet(keras_model, settings.BRAIN_TUMOR_XLA), None,
+                                os.path.getsize(source)))
+            elif mode == "tflite":
+                paths = options["tflite"].split(",") if options["tflite"] else \
+                    sorted(glob.glob(f"{os.path.splitext(source)[0]}.*.tflite"))
+                if not paths:
+                    self.stderr.write("[WARN] No .tflite artifacts found; build one with `manage.py export_unet`")
+                for path in paths:
+                    name = "tflite:" + os.path.basename(path).split(".")[-2]
+                    runners.append((name, lambda path=path: load_tflite(path), None, os.path.getsize(path)))
+            else:
+                raise CommandError(f"Unknown mode '{mode}' (expected keras, graph or tflite)")
+
+        self.stdout.write(f"{len(samples)} samples, batch size {options['batch_size']}, "
+                          f"threshold {options['threshold']}, reference = keras ({source})")
+        for name, build, load_seconds, size in runners:
+            if load_seconds is None:
+                t0 = time.perf_counter()
+                runner = build()
+                load_seconds = time.perf_counter() - t0
+            else:
+                runner = build()
+
+            outputs = self._predict_all(runner, samples, options["batch_size"])
+            dice, iou, worst = mask_agreement(reference, outputs, options["threshold"])
+            scores = outputs.mean(axis=(1, 2, 3))
+            score_err = float(np.abs(scores - ref_scores).max())
+            labels = int(((scores > 0.5) == (ref_scores > 0.5)).sum())
+
+            single = self._latencies(runner, samples[:1], options["iterations"])
+            batched = self._latencies(runner, samples[:options["batch_size"]], options["iterations"])
+            batch_n = min(options["batch_size"], len(samples))
+            self.stdout.write(
+                f"{name:>16}: load {load_seconds:5.1f}s | size {size / 2 ** 20:6.1f} MB | "
+                f"1 scan p50 {np.percentile(single, 50):7.1f} ms p95 {np.percentile(single, 95):7.1f} ms | "
+                f"batch {batch_n} p50 {np.percentile(batched, 50):7.1f} ms "
+                f"({batch_n / np.percentile(batched, 50) * 1000:6.1f} scans/s) | "
+                f"dice {dice:.4f} (min {worst:.4f}) iou {iou:.4f} | "
+                f"score Δmax {score_err:.4f} | labels {labels}/{len(samples)}"
+            )
+
+    @staticmethod
+    def _predict_all(runner, samples, batch_size):
+        return np.concatenate([
+            np.asarray(runner.predict_on_batch(samples[start:start + batch_size]), dtype=np.float32)
+            for start in range(0, len(samples), batch_size)
+        ])
+
+    @staticmethod
+    def _latencies(runner, batch, iterations):
+        runner.predict_on_batch(batch)  # warm-up (allocation, tracing)
+        timings = np.empty(iterations)
+        for i in range(iterations):
+            t0 = time.perf_counter()
+            runner.predict_on_batch(batch)
+            timings[i] = (time.perf_counter() - t0) * 1000
+        return timings
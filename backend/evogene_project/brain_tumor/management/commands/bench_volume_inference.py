@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from brain_tumor.utils import predict_batch
+from brain_tumor.volumes import NiftiVolume, NiftiWriter, analyze_volume, nifti_on_disk
+
+
+def write_synthetic_volume(path, rows, cols, slices, compress=False, seed=0):
+    """int16 head phantom (ellipsoid 'brain' + one bright ellipsoid 'tumor'), written slice by slice.
+
+    The tumor spans the same share of the volume at any slice count; returns its (center, slice radius).
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:rows, :cols]
+    center = np.array([rows * 0.55, cols * 0.4, slices * 0.5])
+    radius, z_radius = 0.12 * min(rows, cols), 0.12 * slices
+    with open(path, "wb") as f:
+        writer = NiftiWriter(f, rows, cols, slices, np.int16, spacing=(1.0, 1.0, 1.0), compress=compress)
+        for k in range(slices):
+            z = (k - slices / 2) / (slices * 0.45)
+            brain = ((yy - rows / 2) / (rows * 0.4)) ** 2 + ((xx - cols / 2) / (cols * 0.33)) ** 2 + z ** 2 <= 1
+            tumor = ((yy - center[0]) ** 2 + (xx - center[1]) ** 2) / radius ** 2 + ((k - center[2]) / z_radius) ** 2 <= 1
+            pixels = rng.normal(40, 10, (rows, cols)) + 360 * brain + 500 * tumor
+            writer.write(pixels.astype(np.int16))
+        writer.close()
+    return center, z_radius
+
+
+def stub_predict(batch):
+    """Bright-region detector standing in for the U-Net (no TensorFlow needed)."""
+    return 1 / (1 + np.exp(-(batch[..., :1] - 0.9) * 40))
+
+
+class _RssSampler:
+    """Peak anonymous RSS (heap, not file-backed mmap pages) while the block runs; Linux only."""
+
+    def __init__(self):
+        self.peak_kb = None
+        self._done = threading.Event()
+
+    @staticmethod
+    def _anon_kb():
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("RssAnon:"):
+                        return int(line.split()[1])
+        except OSError:
+            return None
+
+    def __enter__(self):
+        base = self._anon_kb()
+        if base is None:
+            return self
+        self.base, self.peak_kb = base, 0
+
+        def sample():
+            while not self._done.wait(0.005):
+                self.peak_kb = max(self.peak_kb, self._anon_kb() - self.base)
+
+        self._thread = threading.Thread(target=sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        if self.peak_kb is not None:
+            self._thread.join()
+
+
+class Command(BaseCommand):
+    help = "Streamed volume inference on synthetic NIfTI studies: throughput and peak memory vs. slice count."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slices", default="64,256,1024", help="Comma-separated slice counts to test")
+        parser.add_argument("--size", type=int, default=256, help="Rows/cols per slice")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--gzip", action="store_true", help="Benchmark .nii.gz uploads (decompressed to disk first)")
+        parser.add_argument("--unet", action="store_true", help="Use the real U-Net instead of the stub detector")
+
+    def handle(self, *args, **options):
+        predict = predict_batch if options["unet"] else stub_predict
+        size = options["size"]
+        self.stdout.write(f"{size}x{size} slices, {'U-Net' if options['unet'] else 'stub detector'}, "
+                          f"{'.nii.gz' if options['gzip'] else '.nii'} input")
+
+        with tempfile.TemporaryDirectory(prefix="bench_volumes_") as workdir:
+            for count in (int(n) for n in options["slices"].split(",")):
+                path = os.path.join(workdir, f"synthetic_{count}.nii{'.gz' if options['gzip'] else ''}")
+                center, radius = write_synthetic_volume(path, size, size, count, compress=options["gzip"])
+                file_mb = os.path.getsize(path) / 2 ** 20
+
+                tracemalloc.start()
+                with _RssSampler() as rss:
+                    started = time.perf_counter()
+                    if options["gzip"]:
+                        with open(path, "rb") as upload:
+                            volume = NiftiVolume(nifti_on_disk(upload, workdir))
+                    else:
+                        volume = NiftiVolume(path)
+                    with tempfile.TemporaryFile() as mask_file:
+                        summary = analyze_volume(volume, mask_file=mask_file, predict=predict,
+                                                 batch_size=options["batch_size"])
+                        mask_mb = mask_file.tell() / 2 ** 20
+                    volume.close()
+                    elapsed = time.perf_counter() - started
+                traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+
+                in_ram_mb = size * size * count * 4 / 2 ** 20
+                hit = abs(summary["peak_slice"] - center[2]) <= radius
+                self.stdout.write(
+                    f"{count:>5} slices ({file_mb:7.1f} MB file, {in_ram_mb:7.1f} MB as float32): "
+                    f"{count / elapsed:7.1f} slices/s | peak numpy {traced_peak:6.1f} MB"
+                    f"{f' | peak anon RSS +{rss.peak_kb / 1024:6.1f} MB' if rss.peak_kb is not None else ''} | "
+                    f"mask {mask_mb:5.2f} MB | score {summary['volume_score']:.3f} "
+                    f"peak slice {summary['peak_slice']} ({'on' if hit else 'OFF'} tumor) "
+                    f"{summary['tumor_volume_ml']:.1f} ml"
+                )
@@ -0,0 +1,67 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from brain_tumor.inference import QUANTIZATIONS, load_samples, synthetic_samples, tflite_path
+from brain_tumor.utils import load_unet
+
+
+class Command(BaseCommand):
+    help = "Convert the Keras U-Net into a TFLite artifact for BRAIN_TUMOR_INFERENCE=tflite (run at build time)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quantize", choices=QUANTIZATIONS, default="float16",
+                            help="float16 (half-size weights), dynamic (int8 weights), int8 (calibrated "
+                                 "weights + activations) or none (plain float32)")
+        parser.add_argument("--source", default=settings.BRAIN_TUMOR_UNET_PATH)
+        parser.add_argument("--output", default=None, help="Defaults to models/<stem>.<quantize>.tflite")
+        parser.add_argument("--calibration-dir", default=None,
+                            help="Representative MRI slices for --quantize int8 (required for a usable model)")
+        parser.add_argument("--calibration-samples", type=int, default=200)
+        parser.add_argument("--synthetic-calibration", action="store_true",
+                            help="Calibrate int8 on synthetic phantoms instead (smoke tests only)")
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        quantize, source = options["quantize"], options["source"]
+        output = options["output"] or tflite_path(source, quantize)
+
+        started = time.perf_counter()
+        model = load_unet(source)
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if quantize != "none":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantize == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantize == "int8":
+            samples = self._calibration_set(options)
+            # Float I/O stays; ops without an int8 kernel fall back to float
+            converter.representative_dataset = lambda: ([sample[None]] for sample in samples)
+
+        flatbuffer = converter.convert()
+        tmp_path = f"{output}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(flatbuffer)
+        os.replace(tmp_path, output)  # a running server never sees half a file (it hot-reloads on change)
+
+        source_mb, output_mb = os.path.getsize(source) / 2 ** 20, len(flatbuffer) / 2 ** 20
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {quantize} artifact written to {output}: {source_mb:.1f} MB -> {output_mb:.1f} MB "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
+        self.stdout.write(f"Serve it with BRAIN_TUMOR_INFERENCE=tflite BRAIN_TUMOR_TFLITE_PATH={output}, "
+                          f"after checking it with `manage.py bench_unet_inference`.")
+
+    def _calibration_set(self, options):
+        if options["calibration_dir"]:
+            try:
+                return load_samples(options["calibration_dir"], options["calibration_samples"])
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+        if options["synthetic_calibration"]:
+            self.stderr.write("[WARN] Calibrating on synthetic phantoms; activation ranges may not match real scans")
+            return synthetic_samples(options["calibration_samples"])
+        raise CommandError("--quantize int8 needs --calibration-dir (or --synthetic-calibration for a smoke test)")
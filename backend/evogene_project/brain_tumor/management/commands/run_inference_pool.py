@@ -0,0 +1,46 @@
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from brain_tumor.workers import InferencePool, parse_cpus
+
+
+class Command(BaseCommand):
+    help = "Run the out-of-process U-Net inference tier that web workers use when BRAIN_TUMOR_INFERENCE_WORKERS > 0."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.BRAIN_TUMOR_INFERENCE_WORKERS or 1)
+        parser.add_argument("--intra-threads", type=int, default=settings.BRAIN_TUMOR_INFERENCE_INTRA_THREADS,
+                            help="Intra-op threads per worker (0 = cores / workers)")
+        parser.add_argument("--inter-threads", type=int, default=settings.BRAIN_TUMOR_INFERENCE_INTER_THREADS)
+        parser.add_argument("--cpus", default=settings.BRAIN_TUMOR_INFERENCE_CPUS,
+                            help="Pin the workers to these cores, e.g. 4-7 (leave the rest to the web tier)")
+        parser.add_argument("--socket", default=settings.BRAIN_TUMOR_INFERENCE_SOCKET)
+
+    def handle(self, *args, **options):
+        cpus = parse_cpus(options["cpus"])
+        workers = options["workers"]
+        intra = options["intra_threads"] or max(1, len(cpus or os.sched_getaffinity(0)) // workers)
+
+        pool = InferencePool(workers, intra_threads=intra, inter_threads=options["inter_threads"],
+                             cpus=cpus, address=options["socket"])
+        self.stdout.write(f"Starting {workers} inference worker(s), {intra} intra-op thread(s) each"
+                          f"{f', pinned to CPUs {sorted(cpus)}' if cpus else ''} ...")
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Serving {pool.info['runtime']} U-Net (version {pool.info['version']}) on {pool.address}"
+        ))
+
+        def shutdown(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            pool.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write("Stopping inference workers ...")
+            pool.stop()
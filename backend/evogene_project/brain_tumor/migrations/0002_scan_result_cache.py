@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brain_tumor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='braintumoranalysis',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the uploaded image bytes', max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScanResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_hash', models.CharField(help_text='SHA-256 of the image bytes', max_length=64)),
+                ('model_version', models.CharField(help_text='Content hash of the model file', max_length=32)),
+                ('confidence_score', models.FloatField(help_text='Cached confidence score (0-1)')),
+                ('masked_image', models.ImageField(blank=True, help_text='Shared mask file', null=True, upload_to='uploads/masked_results/')),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('image_hash', 'model_version'), name='unique_scan_result_per_model')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brain_tumor', '0002_scan_result_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrainTumorVolumeAnalysis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(help_text='Uploaded file name (or DICOM file count)', max_length=255)),
+                ('source_format', models.CharField(choices=[('nifti', 'NIfTI'), ('dicom', 'DICOM series')], max_length=8)),
+                ('shape', models.CharField(help_text='rows x cols x slices', max_length=32)),
+                ('slice_count', models.PositiveIntegerField()),
+                ('mask_volume', models.FileField(blank=True, help_text='3-D probability mask (NIfTI)', null=True, upload_to='uploads/masked_volumes/')),
+                ('prediction_label', models.CharField(blank=True, help_text='Result (Tumor / No Tumor)', max_length=100, null=True)),
+                ('confidence_score', models.FloatField(blank=True, help_text='Highest per-slice score (0-1)', null=True)),
+                ('peak_slice', models.PositiveIntegerField(blank=True, help_text='Index of the highest-scoring slice', null=True)),
+                ('tumor_volume_ml', models.FloatField(blank=True, help_text='Mask voxels above threshold, in ml', null=True)),
+                ('slice_scores', models.JSONField(blank=True, default=list, help_text='Per-slice scores in slice order')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bt_volume_analysis', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brain_tumor', '0003_volume_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresultcache',
+            name='detected_region',
+            field=models.TextField(blank=True, help_text='Cached regions + compact mask JSON', null=True),
+        ),
+        migrations.AlterField(
+            model_name='braintumoranalysis',
+            name='detected_region',
+            field=models.TextField(blank=True, help_text='JSON: tumor regions (bounding boxes, areas) + compact mask', null=True),
+        ),
+        migrations.AlterField(
+            model_name='scanresultcache',
+            name='masked_image',
+            field=models.ImageField(blank=True, help_text='Shared mask file (older entries)', null=True, upload_to='uploads/masked_results/'),
+        ),
+    ]
@@ -9,8 +9,50 @@ class BrainTumorAnalysis(models.Model):
     masked_image = models.ImageField(upload_to='uploads/masked_results/', null=True, blank=True, help_text="Generated segmentation mask")
     prediction_label = models.CharField(max_length=100, null=True, blank=True, help_text="Result (Tumor / No Tumor)")
     confidence_score = models.FloatField(null=True, blank=True, help_text="Confidence score (0-1)")
-    detected_region = models.TextField(null=True, blank=True, help_text="Optional details like bounding boxes")
+    detected_region = models.TextField(null=True, blank=True, help_text="JSON: tumor regions (bounding boxes, areas) + compact mask")
+    image_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True, help_text="SHA-256 of the uploaded image bytes")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"BrainTumorAnalysis - {self.user or 'Guest'} ({self.prediction_label or 'Pending'})"
+
+
+class ScanResultCache(models.Model):
+    """U-Net result for one image content hash under one model version."""
+    image_hash = models.CharField(max_length=64, help_text="SHA-256 of the image bytes")
+    model_version = models.CharField(max_length=32, help_text="Content hash of the model file")
+    confidence_score = models.FloatField(help_text="Cached confidence score (0-1)")
+    masked_image = models.ImageField(upload_to='uploads/masked_results/', null=True, blank=True, help_text="Shared mask file (older entries)")
+    detected_region = models.TextField(null=True, blank=True, help_text="Cached regions + compact mask JSON")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image_hash', 'model_version'], name='unique_scan_result_per_model'),
+        ]
+
+    def __str__(self):
+        return f"ScanResultCache - {self.image_hash[:12]} @ {self.model_version} ({self.hit_count} hits)"
+
+
+class BrainTumorVolumeAnalysis(models.Model):
+    """U-Net result for a whole 3-D study (NIfTI volume or DICOM series), slice by slice."""
+    SOURCE_CHOICES = [('nifti', 'NIfTI'), ('dicom', 'DICOM series')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bt_volume_analysis', null=True, blank=True)
+    source_name = models.CharField(max_length=255, help_text="Uploaded file name (or DICOM file count)")
+    source_format = models.CharField(max_length=8, choices=SOURCE_CHOICES)
+    shape = models.CharField(max_length=32, help_text="rows x cols x slices")
+    slice_count = models.PositiveIntegerField()
+    mask_volume = models.FileField(upload_to='uploads/masked_volumes/', null=True, blank=True, help_text="3-D probability mask (NIfTI)")
+    prediction_label = models.CharField(max_length=100, null=True, blank=True, help_text="Result (Tumor / No Tumor)")
+    confidence_score = models.FloatField(null=True, blank=True, help_text="Highest per-slice score (0-1)")
+    peak_slice = models.PositiveIntegerField(null=True, blank=True, help_text="Index of the highest-scoring slice")
+    tumor_volume_ml = models.FloatField(null=True, blank=True, help_text="Mask voxels above threshold, in ml")
+    slice_scores = models.JSONField(default=list, blank=True, help_text="Per-slice scores in slice order")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"BrainTumorVolumeAnalysis - {self.user or 'Guest'} {self.shape} ({self.prediction_label or 'Pending'})"
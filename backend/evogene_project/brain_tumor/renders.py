@@ -0,0 +1,320 @@
+# brain_tumor/renders.py
+"""
+Mask / overlay images for one analysis, rendered when a client asks for them.
+
+Analyses only store a compact binary mask (regions.py); this module turns it
+into a PNG at the requested size and style:
+
+* "mask"    — the mask alone, grayscale (what masked_image used to hold)
+* "overlay" — the mask tinted onto the original MRI, `color` at `alpha`
+* "outline" — the mask's contour drawn onto the original MRI
+
+Rendered PNGs go into a two-level cache keyed on (analysis, size, style):
+an in-process LRU bounded by BRAIN_TUMOR_RENDER_CACHE_MEMORY_MB, backed by
+a directory bounded by BRAIN_TUMOR_RENDER_CACHE_DISK_MB (oldest files go
+first). The key is also the response ETag; it includes the stored mask and
+scan, so a changed analysis never serves an old image.
+
+Renders are served to the analysis owner, or to whoever holds the signed
+`token` that the analysis responses put in the image URLs (an <img> tag
+sends no Authorization header, and guest analyses have no owner).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core import signing
+from PIL import Image
+
+from . import regions
+from .utils import MASK_SIZE, encode_png
+
+STYLES = ("mask", "overlay", "outline")
+COLORS = {
+    "red": (255, 48, 48),
+    "green": (40, 220, 90),
+    "yellow": (255, 214, 0),
+    "cyan": (0, 210, 255),
+    "magenta": (255, 0, 200),
+}
+RENDER_VERSION = 1  # bump when the drawing changes so old cache entries are not served
+
+
+class RenderError(ValueError):
+    pass
+
+
+def link_token(pk):
+    """Signature granting access to the renders of analysis `pk` (and nothing else)."""
+    return signing.Signer(salt="brain_tumor.renders").sign(str(pk)).rsplit(":", 1)[1]
+
+
+def check_link_token(pk, token):
+    if not token:
+        return False
+    try:
+        return signing.Signer(salt="brain_tumor.renders").unsign(f"{pk}:{token}") == str(pk)
+    except signing.BadSignature:
+        return False
+
+
+def parse_options(params, default_style="mask"):
+    """Query params -> {"size": (w, h), "style", "color", "alpha"}; `size` is "256" or "320x240"."""
+    max_edge = getattr(settings, "BRAIN_TUMOR_RENDER_MAX_SIZE", 1024)
+    raw = params.get("size")
+    if raw:
+        try:
+            parts = [int(p) for p in str(raw).lower().split("x")]
+        except ValueError:
+            raise RenderError(f"Invalid size '{raw}' (expected e.g. 256 or 320x240)")
+        if len(parts) not in (1, 2):
+            raise RenderError(f"Invalid size '{raw}' (expected e.g. 256 or 320x240)")
+        size = (parts[0], parts[-1])
+        if not all(16 <= edge <= max_edge for edge in size):
+            raise RenderError(f"Size must be between 16 and {max_edge} pixels per edge")
+    else:
+        size = tuple(MASK_SIZE)
+
+    style = params.get("style") or default_style
+    if style not in STYLES:
+        raise RenderError(f"Unknown style '{style}' (expected one of {', '.join(STYLES)})")
+    color = params.get("color") or "red"
+    if color not in COLORS:
+        raise RenderError(f"Unknown color '{color}' (expected one of {', '.join(COLORS)})")
+    try:
+        alpha = round(min(max(float(params.get("alpha", 0.45)), 0.0), 1.0), 2)  # 2 decimals keeps the key space small
+    except ValueError:
+        raise RenderError("alpha must be a number between 0 and 1")
+    return {"size": size, "style": style, "color": color, "alpha": alpha}
+
+
+def style_key(options):
+    if options["style"] == "mask":
+        return "mask"
+    if options["style"] == "outline":
+        return f"outline-{options['color']}"
+    return f"overlay-{options['color']}-{options['alpha']:.2f}"
+
+
+def etag(analysis, options):
+    """Cache key and ETag: analysis + its stored mask/scan + size + style."""
+    w, h = options["size"]
+    parts = [
+        str(RENDER_VERSION), str(analysis.pk),
+        hashlib.sha256((analysis.detected_region or "").encode()).hexdigest(),
+        analysis.masked_image.name or "", analysis.mri_image.name or "",
+        f"{w}x{h}", style_key(options),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()[:32]
+
+
+def load_mask(analysis):
+    """Binary mask on the model grid: the compact mask, or the stored PNG of an older analysis, thresholded."""
+    payload = regions.loads(analysis.detected_region)
+    if payload is not None:
+        return regions.decode_binary_mask(payload["mask"])
+    if analysis.masked_image:
+        try:
+            with analysis.masked_image.open("rb") as f:
+                pixels = np.asarray(Image.open(f).convert("L"))
+        except (OSError, ValueError):
+            return None
+        return pixels > regions.mask_threshold() * 255
+    return None
+
+
+def load_scan(analysis, size):
+    """The original MRI as (h, w) uint8 grayscale at `size`, or None if it is gone."""
+    if not analysis.mri_image:
+        return None
+    try:
+        with analysis.mri_image.open("rb") as f:
+            img = Image.open(f)
+            if img.format == "JPEG":
+                img.draft("L", size)  # decode near the target size
+            if img.mode != "L":
+                img = img.convert("L")
+            if img.size != size:
+                img = img.resize(size)
+            return np.asarray(img)
+    except (OSError, ValueError):
+        return None
+
+
+def _outline(mask, width):
+    """Pixels of `mask` within `width` px of its border (4-neighbour erosion, repeated)."""
+    inner = mask.copy()
+    for _ in range(width):
+        eroded = inner.copy()
+        eroded[1:, :] &= inner[:-1, :]
+        eroded[:-1, :] &= inner[1:, :]
+        eroded[:, 1:] &= inner[:, :-1]
+        eroded[:, :-1] &= inner[:, 1:]
+        inner = eroded
+    return mask & ~inner
+
+
+def render(analysis, options):
+    """PNG bytes for one analysis at options["size"] / style; LookupError if the mask or scan is missing."""
+    binary = load_mask(analysis)
+    if binary is None:
+        raise LookupError("No mask for this analysis")
+    size = options["size"]
+    if options["style"] == "mask":
+        return encode_png(np.multiply(binary, 255, dtype=np.uint8), size).getvalue()
+
+    gray = load_scan(analysis, size)
+    if gray is None:
+        raise LookupError("Original scan is not available")
+    # Bilinear upscaling gives the coarse model-grid mask smooth edges
+    soft = np.asarray(Image.fromarray(np.multiply(binary, 255, dtype=np.uint8)).resize(size, Image.BILINEAR))
+    color = np.asarray(COLORS[options["color"]], dtype=np.float32)
+    rgb = np.repeat(gray[:, :, None], 3, axis=2)
+
+    if options["style"] == "overlay":
+        weight = soft[:, :, None] * np.float32(options["alpha"] / 255)
+        blended = rgb * (1 - weight) + color * weight
+        np.copyto(rgb, blended, casting="unsafe")
+    else:
+        rgb[_outline(soft >= 128, max(1, round(min(size) / 256)))] = COLORS[options["color"]]
+
+    return encode_png(rgb, size).getvalue()
+
+
+# 🗄️ Two-level render cache
+class RenderCache:
+    """Bounded in-memory LRU in front of a bounded directory of PNGs, both keyed on etag()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> PNG bytes, most recently used last
+        self._memory_bytes = 0
+        self._disk_bytes = None  # measured on first write
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.evictions = {"memory": 0, "disk": 0}
+
+    @staticmethod
+    def _directory():
+        return getattr(settings, "BRAIN_TUMOR_RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "evogene-renders"))
+
+    def _path(self, key):
+        return os.path.join(self._directory(), f"{key}.png")
+
+    def get(self, key):
+        """(PNG bytes, "memory" | "disk") or (None, None)."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return data, "memory"
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as last-used time for disk eviction
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        self._remember(key, data)
+        with self._lock:
+            self.hits["disk"] += 1
+        return data, "disk"
+
+    def put(self, key, data):
+        self._remember(key, data)
+        limit = getattr(settings, "BRAIN_TUMOR_RENDER_CACHE_DISK_MB", 256) * 2 ** 20
+        if limit <= 0:
+            return
+        directory = self._directory()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))  # readers never see a half-written file
+        except OSError as e:
+            print(f"[WARN] Render cache write failed: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            over = self._disk_bytes is None or self._disk_bytes > limit
+        if over:
+            self._trim_disk(limit)
+
+    def _remember(self, key, data):
+        limit = getattr(settings, "BRAIN_TUMOR_RENDER_CACHE_MEMORY_MB", 32) * 2 ** 20
+        if len(data) > limit:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > limit:
+                _, dropped = self._memory.popitem(last=False)
+                self._memory_bytes -= len(dropped)
+                self.evictions["memory"] += 1
+
+    def _trim_disk(self, limit):
+        """Re-measure the directory (other processes write to it too) and drop the oldest files down to 90%."""
+        entries = []
+        try:
+            with os.scandir(self._directory()) as it:
+                for entry in it:
+                    if entry.name.endswith(".png"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if total > limit:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= limit * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.evictions["disk"] += removed
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else None,
+                "evictions": dict(self.evictions),
+            }
+
+
+cache = RenderCache()
@@ -1,3 +1,475 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from evogene_project.model_registry import ModelNotAvailable
+
+from . import cache, regions, renders
+from .uploads import StreamingUploadHandler
+from .batching import BatchTimeout, MicroBatcher
+from .workers import PoolClient, _ClientState
+from .volumes import NiftiVolume, VolumeError, intensity_window, nifti_header
+from .utils import ArchiveError, _read_member, iter_archive_images
+from .models import BrainTumorAnalysis, ScanResultCache
+
+User = get_user_model()
+
+
+# 🧪 /api/brain-tumor/analysis/<pk>/mask/ and /overlay/
+@override_settings(BRAIN_TUMOR_RENDER_CACHE_DIR=tempfile.mkdtemp())
+class RenderAccessTests(TestCase):
+
+    def setUp(self):
+        renders.cache.clear_memory()
+        self.owner = User.objects.create_user(email="owner@example.com", password="x", name="Owner")
+        self.other = User.objects.create_user(email="other@example.com", password="x", name="Other")
+        mask = np.zeros((256, 256, 1), dtype=np.float32)
+        mask[40:80, 50:90] = 0.9
+        self.analysis = BrainTumorAnalysis.objects.create(
+            user=self.owner, mri_image="uploads/mri_scans/scan.png", prediction_label="Tumor Detected",
+            confidence_score=0.9, detected_region=regions.dumps(regions.describe_mask(mask)),
+        )
+        self.url = f"/api/brain-tumor/analysis/{self.analysis.pk}/mask/"
+        self.client = APIClient()
+
+    def test_owner_gets_the_mask(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+
+    def test_other_users_get_404(self):
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_signed_token_grants_only_its_analysis(self):
+        token = renders.link_token(self.analysis.pk)
+        self.assertEqual(self.client.get(f"{self.url}?token={token}").status_code, 200)
+        other = f"/api/brain-tumor/analysis/{self.analysis.pk + 1}/mask/?token={token}"
+        self.assertEqual(self.client.get(other).status_code, 401)
+        self.assertEqual(self.client.get(f"{self.url}?token=forged").status_code, 401)
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def _tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+# 🧪 Bulk archive unpacking limits
+@override_settings(BRAIN_TUMOR_UPLOAD_MAX_BYTES=1024, BRAIN_TUMOR_ARCHIVE_UNPACKED_MAX_BYTES=2048)
+class ArchiveLimitTests(SimpleTestCase):
+
+    def test_images_within_the_limits_are_yielded(self):
+        for build in (_zip, _tar):
+            files = list(iter_archive_images(build({"a.png": b"x" * 1000, "notes.txt": b"y" * 5000, "b.jpg": b"z" * 10})))
+            self.assertEqual([(f.name, f.size) for f in files], [("a.png", 1000), ("b.jpg", 10)])
+
+    def test_an_oversized_member_is_refused_before_it_is_inflated(self):
+        for build in (_zip, _tar):
+            with self.assertRaisesRegex(ArchiveError, "'bomb.png' in the archive is larger"):
+                list(iter_archive_images(build({"bomb.png": b"\0" * 10 ** 6})))
+
+    def test_the_unpacked_total_is_capped(self):
+        for build in (_zip, _tar):
+            scans = iter_archive_images(build({f"{i}.png": b"\0" * 1000 for i in range(3)}))
+            self.assertEqual(len([next(scans), next(scans)]), 2)
+            with self.assertRaisesRegex(ArchiveError, "unpacks to more than"):
+                next(scans)
+
+    def test_a_member_lying_about_its_size_is_read_no_further_than_the_limit(self):
+        member = io.BytesIO(b"\0" * 10 ** 6)
+        with self.assertRaises(ArchiveError):
+            _read_member(member, "liar.png", 10, {"member": 1024, "unpacked": 2048, "left": 2048})
+        self.assertEqual(member.tell(), 1025)
+
+
+class _ScriptedPoolClient(PoolClient):
+    """PoolClient whose round trips raise the scripted errors in turn (None = answer)."""
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.connections = 0
+        self.calls = 0
+
+    def _state(self):
+        state = getattr(self._local, "state", None)
+        if state is None:
+            self.connections += 1
+            state = self._local.state = _ClientState(io.BytesIO())
+        return state
+
+    def _predict(self, state, batch):
+        self.calls += 1
+        error = self.script.pop(0)
+        if error is not None:
+            raise error
+        return batch * 2
+
+
+# 🧪 Inference pool client retries
+class PoolClientTests(SimpleTestCase):
+
+    def test_a_timeout_is_not_retried(self):
+        client = _ScriptedPoolClient([TimeoutError("Inference pool did not answer within 60s"), None])
+        with self.assertRaisesRegex(ModelNotAvailable, "did not answer"):
+            client.predict_on_batch(np.ones((1, 2)))
+        self.assertEqual(client.calls, 1)
+
+    def test_a_dropped_connection_is_retried_once_on_a_new_connection(self):
+        for error in (EOFError(), ConnectionResetError(), BrokenPipeError()):
+            client = _ScriptedPoolClient([error, None])
+            np.testing.assert_array_equal(client.predict_on_batch(np.ones((1, 2))), np.full((1, 2), 2.0))
+            self.assertEqual((client.calls, client.connections), (2, 2))
+
+    def test_a_second_connection_failure_gives_up(self):
+        client = _ScriptedPoolClient([EOFError(), BrokenPipeError("gone")])
+        with self.assertRaisesRegex(ModelNotAvailable, "unavailable: gone"):
+            client.predict_on_batch(np.ones((1, 2)))
+        self.assertEqual(client.calls, 2)
+
+    def test_other_os_errors_are_not_retried(self):
+        client = _ScriptedPoolClient([OSError(28, "No space left on device"), None])
+        with self.assertRaises(ModelNotAvailable):
+            client.predict_on_batch(np.ones((1, 2)))
+        self.assertEqual(client.calls, 1)
+
+
+def _nifti(shape_xyz, voxels=None, truncate=0):
+    """Bytes of a little-endian uint8 NIfTI-1 file; `voxels` defaults to the product of `shape_xyz`."""
+    header = nifti_header(shape_xyz, np.uint8, (1.0, 1.0, 1.0))
+    count = int(np.prod(shape_xyz)) if voxels is None else voxels
+    data = header + bytes(range(256)) * (count // 256) + bytes(count % 256)
+    return data[:len(data) - truncate]
+
+
+# 🧪 NIfTI header validation
+class NiftiVolumeTests(SimpleTestCase):
+
+    def open(self, data):
+        with tempfile.NamedTemporaryFile(suffix=".nii", delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.unlink, f.name)
+        return NiftiVolume(f.name)
+
+    def test_a_valid_volume_is_mapped(self):
+        volume = self.open(_nifti((4, 3, 2)))
+        self.addCleanup(volume.close)
+        self.assertEqual(volume.shape, (3, 4, 2))
+        self.assertEqual(volume.slice(1).shape, (3, 4))
+
+    def test_a_truncated_file_is_refused_before_mapping(self):
+        with self.assertRaisesRegex(VolumeError, "truncated"):
+            self.open(_nifti((64, 64, 8), truncate=1))
+
+    def test_non_positive_dimensions_are_refused(self):
+        for shape in ((4, 3, 0), (0, 3, 2), (4, -3, 2)):
+            with self.assertRaisesRegex(VolumeError, "must be positive"):
+                self.open(_nifti(shape, voxels=0))
+
+    def test_an_offset_inside_the_header_is_refused(self):
+        data = bytearray(_nifti((4, 3, 2)))
+        data[108:112] = np.float32(0.0).tobytes()
+        with self.assertRaisesRegex(VolumeError, "vox_offset"):
+            self.open(bytes(data))
+
+    def test_a_volume_without_slices_has_no_intensity_window(self):
+        empty = type("Empty", (), {"slice_count": 0})()
+        with self.assertRaisesRegex(VolumeError, "no slices"):
+            intensity_window(empty)
+
+    def test_the_volume_endpoint_answers_400(self):
+        upload = SimpleUploadedFile("scan.nii", _nifti((64, 64, 8), truncate=100))
+        response = self.client.post("/api/brain-tumor/analysis/volume/", {"volume": upload})
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn("truncated", response.json()["error"])
+
+
+class _Crash(BaseException):
+    """Escapes `except Exception`, like the errors that used to kill the batching thread."""
+
+
+# 🧪 Micro-batcher timeouts and worker restarts
+class MicroBatcherTests(SimpleTestCase):
+
+    def test_predictions_are_batched(self):
+        batcher = MicroBatcher(lambda batch: batch * 2, max_batch_size=4, max_wait_ms=1, timeout=5)
+        np.testing.assert_array_equal(batcher.predict(np.ones((2, 2))), np.full((2, 2), 2.0))
+
+    def test_predict_gives_up_after_the_default_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        batcher = MicroBatcher(lambda batch: release.wait(5) and batch, max_wait_ms=0, timeout=0.2)
+        started = time.monotonic()
+        with self.assertRaises(BatchTimeout):
+            batcher.predict(np.ones(2))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_requests_that_timed_out_in_the_queue_are_not_run(self):
+        release, seen = threading.Event(), []
+        self.addCleanup(release.set)
+
+        def predict_fn(batch):
+            seen.append(len(batch))
+            release.wait(5)
+            return batch
+
+        batcher = MicroBatcher(predict_fn, max_batch_size=1, max_wait_ms=0, timeout=0.2)
+        first = batcher.submit(np.ones(2))  # occupies the worker
+        with self.assertRaises(BatchTimeout):
+            batcher.predict(np.zeros(2))  # times out while still queued
+        release.set()
+        first.result(timeout=5)
+        np.testing.assert_array_equal(batcher.predict(np.full(2, 3.0), timeout=5), np.full(2, 3.0))
+        self.assertEqual(seen, [1, 1])
+
+    def test_a_dead_batching_thread_fails_its_batch_and_is_replaced(self):
+        calls = []
+
+        def predict_fn(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise _Crash()
+            return batch
+
+        batcher = MicroBatcher(predict_fn, max_wait_ms=0, timeout=5)
+        with self.assertRaises(_Crash):
+            batcher.predict(np.ones(2))
+        batcher._worker.join(timeout=5)
+        self.assertFalse(batcher._worker.is_alive())
+
+        np.testing.assert_array_equal(batcher.predict(np.ones(2)), np.ones(2))
+        self.assertEqual(batcher.stats()["worker_restarts"], 1)
+
+    def test_a_short_model_output_fails_the_whole_batch(self):
+        batcher = MicroBatcher(lambda batch: batch[:0], max_wait_ms=0, timeout=5)
+        with self.assertRaisesRegex(ValueError, "0 predictions for a batch of 1"):
+            batcher.predict(np.ones(2))
+        self.assertTrue(batcher._worker.is_alive())
+
+
+_PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 2000
+
+
+# 🧪 Streaming upload handler
+class UploadHandlerTests(SimpleTestCase):
+
+    def parse(self, files, on_error="skip", max_bytes=4096, max_request_bytes=None):
+        request = RequestFactory().post("/upload/", {
+            field: SimpleUploadedFile(name, data) for field, (name, data) in files.items()
+        })
+        handler = StreamingUploadHandler(request, {"scan": ("image", max_bytes, on_error)}, max_request_bytes)
+        request.upload_handlers = [handler]
+        return request, request.FILES
+
+    def test_an_accepted_file_carries_its_digest_and_format(self):
+        request, files = self.parse({"scan": ("scan.png", _PNG)})
+        upload = files["scan"]
+        self.assertEqual((upload.size, upload.detected_format), (len(_PNG), "png"))
+        self.assertEqual(upload.sha256, hashlib.sha256(_PNG).hexdigest())
+        self.assertEqual(upload.read(), _PNG)
+
+    def test_rejected_files_are_skipped_whatever_their_length(self):
+        for data in (b"not an image at all", b"x" * 2000):
+            request, files = self.parse({"scan": ("notes.png", data)})
+            self.assertNotIn("scan", files)
+            [skipped] = request.upload_skipped
+            self.assertEqual(skipped["file"], "notes.png")
+            self.assertIn("is not a supported image", skipped["error"])
+
+    def test_rejected_files_stop_the_upload_in_reject_mode(self):
+        for data in (b"not an image at all", b"x" * 2000):
+            request, files = self.parse({"scan": ("notes.png", data)}, on_error="reject")
+            self.assertNotIn("scan", files)
+            self.assertEqual(request.upload_rejection[0], 415)
+
+    def test_oversized_files_are_refused(self):
+        request, files = self.parse({"scan": ("big.png", _PNG)}, max_bytes=1024)
+        self.assertNotIn("scan", files)
+        self.assertIn("is larger than", request.upload_skipped[0]["error"])
+
+        request, files = self.parse({"scan": ("big.png", _PNG)}, on_error="reject", max_bytes=1024)
+        self.assertEqual(request.upload_rejection[0], 413)
+
+    def test_an_oversized_request_is_refused_before_the_body_is_read(self):
+        request, files = self.parse({"scan": ("scan.png", _PNG * 100)}, max_bytes=10 ** 6, max_request_bytes=1)
+        self.assertNotIn("scan", files)
+        self.assertEqual(request.upload_rejection[0], 413)
+
+    def test_other_fields_are_ignored(self):
+        request, files = self.parse({"scan": ("scan.png", _PNG), "other": ("x.png", _PNG)})
+        self.assertEqual(list(files), ["scan"])
+
+    def test_short_non_images_in_a_bulk_upload_are_reported_not_fatal(self):
+        upload = SimpleUploadedFile("notes.txt", b"eighteen bytes!!!\n")
+        response = self.client.post("/api/brain-tumor/analysis/bulk/", {"images": upload})
+        self.assertEqual(response.status_code, 200)
+        lines = _collect_ndjson(response)
+        self.assertEqual(lines[0]["file"], "notes.txt")
+        self.assertIn("is not a supported image", lines[0]["error"])
+        self.assertEqual((lines[-1]["total"], lines[-1]["failed"]), (1, 1))
+
+
+def _collect_ndjson(response):
+    return [json.loads(line) for line in b"".join(response.streaming_content).splitlines() if line]
+
+
+def _png(shade):
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((64, 64), shade, dtype=np.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# 🧪 /api/brain-tumor/analysis/bulk/
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BRAIN_TUMOR_BULK_MAX_FILES=3, BRAIN_TUMOR_BULK_BATCH_SIZE=2)
+class BulkAnalyzeTests(TestCase):
+    url = "/api/brain-tumor/analysis/bulk/"
+
+    def setUp(self):
+        patcher = mock.patch("brain_tumor.views.predict_batch",
+                             side_effect=lambda batch: np.zeros((len(batch), 128, 128, 1), np.float32))
+        self.predict = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def images(self, count):
+        return [SimpleUploadedFile(f"scan{i}.png", _png(i * 10)) for i in range(count)]
+
+    def test_scans_within_the_limit_are_analyzed(self):
+        lines = _collect_ndjson(self.client.post(self.url, {"images": self.images(3)}))
+        self.assertEqual([line.get("file") for line in lines[:-1]], ["scan0.png", "scan1.png", "scan2.png"])
+        self.assertEqual((lines[-1]["total"], lines[-1]["failed"]), (3, 0))
+        self.assertEqual(BrainTumorAnalysis.objects.count(), 3)
+
+    def test_too_many_images_are_refused_up_front(self):
+        response = self.client.post(self.url, {"images": self.images(4)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Too many files (4 > 3)", response.json()["error"])
+        self.predict.assert_not_called()
+
+    def test_an_archive_past_the_limit_ends_with_an_error_line(self):
+        archive = SimpleUploadedFile("scans.zip", _zip({f"{i}.png": _png(i) for i in range(5)}).getvalue())
+        lines = _collect_ndjson(self.client.post(self.url, {"images": self.images(1), "archive": archive}))
+        self.assertEqual([line.get("file") for line in lines[:3]], ["scan0.png", "0.png", "1.png"])
+        self.assertEqual(lines[3], {"index": None, "error": "More than 3 scans in the upload; the rest were not analyzed"})
+        self.assertEqual((lines[-1]["done"], lines[-1]["total"]), (True, 3))
+        self.assertEqual(BrainTumorAnalysis.objects.count(), 3)
+
+    def test_an_archive_error_keeps_the_scans_read_before_it(self):
+        with override_settings(BRAIN_TUMOR_BULK_MAX_FILES=10, BRAIN_TUMOR_BULK_BATCH_SIZE=32,
+                               BRAIN_TUMOR_UPLOAD_MAX_BYTES=1024):
+            members = {"a.png": _png(1), "b.png": _png(2), "bomb.png": b"\0" * 10 ** 5}
+            archive = SimpleUploadedFile("scans.zip", _zip(members).getvalue())
+            lines = _collect_ndjson(self.client.post(self.url, {"archive": archive}))
+        self.assertEqual([line.get("file") for line in lines[:2]], ["a.png", "b.png"])
+        self.assertIn("'bomb.png' in the archive is larger", lines[2]["error"])
+        self.assertEqual(BrainTumorAnalysis.objects.count(), 2)
+
+
+def _region_payload():
+    mask = np.zeros((128, 128, 1), dtype=np.float32)
+    mask[20:40, 30:50] = 0.9
+    return regions.describe_mask(mask)
+
+
+# 🧪 Content-addressed scan storage + result cache
+@override_settings(BRAIN_TUMOR_CACHE_ENABLED=True, BRAIN_TUMOR_CACHE_MAX_ENTRIES=100)
+class ScanCacheTests(TestCase):
+    url = "/api/brain-tumor/analysis/"
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for target, value in (("analyze_scan", (0.8, _region_payload())), ("model_version", "v1")):
+            patcher = mock.patch(f"brain_tumor.views.{target}", return_value=value)
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def test_hash_upload_reuses_the_streamed_digest(self):
+        upload = SimpleUploadedFile("scan.png", _png(1))
+        self.assertEqual(cache.hash_upload(upload), hashlib.sha256(_png(1)).hexdigest())
+        self.assertEqual(upload.tell(), 0)
+        upload.sha256 = "f" * 64  # set by StreamingUploadHandler: the bytes are not read again
+        with mock.patch.object(upload, "chunks", side_effect=AssertionError("re-read")):
+            self.assertEqual(cache.hash_upload(upload), "f" * 64)
+
+    def test_store_scan_keeps_one_file_per_content_hash(self):
+        image_hash = hashlib.sha256(_png(1)).hexdigest()
+        first = cache.store_scan(SimpleUploadedFile("a.PNG", _png(1)), image_hash)
+        second = cache.store_scan(SimpleUploadedFile("b.png", _png(1)), image_hash)
+        self.assertEqual(first, second)
+        self.assertEqual(first, f"{cache.SCAN_DIR}{image_hash}.png")
+        self.assertEqual(len(default_storage.listdir(cache.SCAN_DIR)[1]), 1)
+
+    def test_lookup_and_store_result(self):
+        self.assertIsNone(cache.lookup("h" * 64, "v1"))
+        cache.store_result("h" * 64, "v1", 0.7, '{"regions": []}')
+        cache.store_result("h" * 64, "v1", 0.6, '{"regions": []}')  # replaces, no duplicate
+        self.assertEqual(cache.lookup("h" * 64, "v1"), (0.6, None, '{"regions": []}'))
+        self.assertIsNone(cache.lookup("h" * 64, "v2"))  # another model version
+        self.assertEqual(ScanResultCache.objects.get().hit_count, 1)
+
+    @override_settings(BRAIN_TUMOR_CACHE_MAX_ENTRIES=2)
+    def test_evict_drops_the_least_recently_used(self):
+        for i in range(2):
+            cache.store_result(f"{i}" * 64, "v1", 0.1, "{}")
+            ScanResultCache.objects.filter(image_hash=f"{i}" * 64).update(
+                last_used_at=timezone.now() - timedelta(minutes=10 - i))
+        cache.lookup("0" * 64, "v1")  # "0" becomes the most recently used
+        cache.store_result("2" * 64, "v1", 0.1, "{}")
+        self.assertEqual(sorted(ScanResultCache.objects.values_list("image_hash", flat=True)), ["0" * 64, "2" * 64])
+
+    def test_a_reupload_is_served_from_the_cache(self):
+        first = self.client.post(self.url, {"image": SimpleUploadedFile("scan.png", _png(7))}).json()
+        second = self.client.post(self.url, {"image": SimpleUploadedFile("again.png", _png(7))}).json()
+        self.assertEqual((first["cached"], second["cached"]), (False, True))
+        self.assertEqual(self.analyze_scan.call_count, 1)
+        self.assertEqual(first["confidence_score"], second["confidence_score"])
+        self.assertEqual(first["regions"], second["regions"])
+        analyses = BrainTumorAnalysis.objects.order_by("pk")
+        self.assertEqual(len({a.mri_image.name for a in analyses}), 1)
+        self.assertEqual({a.image_hash for a in analyses}, {hashlib.sha256(_png(7)).hexdigest()})
+
+    def test_a_new_model_version_misses_the_cache(self):
+        self.client.post(self.url, {"image": SimpleUploadedFile("scan.png", _png(7))})
+        self.model_version.return_value = "v2"
+        response = self.client.post(self.url, {"image": SimpleUploadedFile("scan.png", _png(7))}).json()
+        self.assertFalse(response["cached"])
+        self.assertEqual(self.analyze_scan.call_count, 2)
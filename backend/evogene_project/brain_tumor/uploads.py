@@ -0,0 +1,195 @@
+# brain_tumor/uploads.py
+"""
+Streaming upload handling for the brain tumor endpoints.
+
+Django's default handlers buffer small files in memory and large ones in a
+temp file, and the views then read each upload again: once to hash it, once
+to decode it and once more when the ImageField writes it to storage.
+StreamingUploadHandler does the work while the body is being received:
+
+* every chunk goes straight to a temp file (TemporaryUploadedFile), so
+  FileSystemStorage later *moves* that file into place instead of copying it
+  and the decoder reads the same descriptor;
+* a SHA-256 of the bytes is updated per chunk (`upload.sha256`), so the
+  content-addressed cache never re-reads the file;
+* the first bytes are sniffed (magic numbers, not the client's content type
+  or file name), and size limits are enforced per chunk. A request whose
+  Content-Length is already over the limit is refused before anything is
+  read; a file that turns out too large or of the wrong type stops the
+  upload at that chunk, without reading the rest of the body.
+
+Views opt in through StreamedUploadMixin and declare their file fields.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.response import Response
+
+# (offset, magic) per format
+SIGNATURES = {
+    "jpeg": [(0, b"\xff\xd8\xff")],
+    "png": [(0, b"\x89PNG\r\n\x1a\n")],
+    "bmp": [(0, b"BM")],
+    "tiff": [(0, b"II*\x00"), (0, b"MM\x00*")],
+    "zip": [(0, b"PK\x03\x04"), (0, b"PK\x05\x06")],
+    "gzip": [(0, b"\x1f\x8b")],
+    "bz2": [(0, b"BZh")],
+    "xz": [(0, b"\xfd7zXZ\x00")],
+    "tar": [(257, b"ustar")],
+    "nifti": [(344, b"n+1\x00")],
+}
+KINDS = {
+    "image": ("jpeg", "png", "bmp", "tiff"),
+    "archive": ("zip", "tar", "gzip", "bz2", "xz"),
+    "volume": ("nifti", "gzip", "zip"),
+}
+_SNIFF_BYTES = 512  # enough for every signature above
+_FRAMING = 64 * 1024  # multipart boundaries, headers and small form fields on top of the file limit
+
+
+def sniff(head):
+    """Format name from the first bytes of a file, or None."""
+    for name, signatures in SIGNATURES.items():
+        for offset, magic in signatures:
+            if head[offset:offset + len(magic)] == magic:
+                return name
+    return None
+
+
+def _mb(limit):
+    return f"{limit / 2 ** 20:.4g} MB"
+
+
+class HashedUploadedFile(TemporaryUploadedFile):
+    """Upload streamed to a temp file; `sha256` is the digest of its bytes, `detected_format` its sniffed type."""
+    sha256 = None
+    detected_format = None
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Single upload handler for a view: temp file + hash + type/size checks per chunk.
+
+    `fields` maps each accepted file field to (kind or None, max bytes, on_error):
+    kind is a key of KINDS (None = any type); on_error "reject" stops the whole
+    upload, "skip" drops just that file (recorded in request.upload_skipped).
+    Files in other fields are skipped without being written anywhere.
+    """
+
+    def __init__(self, request=None, fields=None, max_request_bytes=None):
+        super().__init__(request)
+        self.fields = fields or {}
+        self.max_request_bytes = max_request_bytes
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if self.max_request_bytes and content_length and content_length > self.max_request_bytes + _FRAMING:
+            self._refuse(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"Upload is larger than {_mb(self.max_request_bytes)}")
+            return QueryDict(encoding=encoding), MultiValueDict()  # the body is never read
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        # Django closes `handler.file` on SkipFile; don't let that hit the previous, finished upload
+        self.__dict__.pop("file", None)
+        if field_name not in self.fields:
+            raise SkipFile()
+        self.kind, self.max_bytes, self.on_error = self.fields[field_name]
+        if content_length and content_length > self.max_bytes:
+            self._fail(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"'{file_name}' is larger than {_mb(self.max_bytes)}")
+
+        self.file = HashedUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.head = b""
+        self.checked = self.kind is None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self._fail(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"'{self.file_name}' is larger than {_mb(self.max_bytes)}")
+        if not self.checked:
+            self.head += raw_data[:_SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= _SNIFF_BYTES:
+                self._check_type()
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None  # last handler: the chunk stops here
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            # Files shorter than _SNIFF_BYTES. Django calls this outside its `except SkipFile`,
+            # so a skipped file is dropped by returning None instead of raising
+            try:
+                self._check_type()
+            except (SkipFile, StopUpload):
+                self.file.close()
+                self.__dict__.pop("file", None)
+                if self.on_error == "skip":
+                    return None
+                raise
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def _check_type(self):
+        self.checked = True
+        self.file.detected_format = sniff(self.head)
+        if self.file.detected_format not in KINDS[self.kind]:
+            self._fail(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                       f"'{self.file_name}' is not a supported {self.kind} ({', '.join(KINDS[self.kind])})")
+
+    def _fail(self, code, message):
+        if self.on_error == "skip":
+            skipped = getattr(self.request, "upload_skipped", None)
+            if skipped is None:
+                skipped = self.request.upload_skipped = []
+            skipped.append({"file": self.file_name, "error": message})
+            raise SkipFile()
+        self._refuse(code, message)
+        raise StopUpload(connection_reset=True)  # stop reading the body here
+
+    def _refuse(self, code, message):
+        if self.request is not None:
+            self.request.upload_rejection = (code, message)
+
+
+class StreamedUploadMixin:
+    """
+    APIView mixin: installs StreamingUploadHandler before DRF parses the body.
+
+    `upload_fields` maps field -> (kind, max-bytes setting, default, on_error);
+    `upload_request_limit` optionally names a setting that caps the whole body.
+    """
+    upload_fields = {}
+    upload_request_limit = None
+
+    def initialize_request(self, request, *args, **kwargs):
+        fields = {
+            name: (kind, getattr(settings, setting, default), on_error)
+            for name, (kind, setting, default, on_error) in self.upload_fields.items()
+        }
+        max_request_bytes = None
+        if self.upload_request_limit:
+            setting, default = self.upload_request_limit
+            max_request_bytes = getattr(settings, setting, default)
+        request.upload_handlers = [StreamingUploadHandler(request, fields, max_request_bytes)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def upload_rejection(self, request):
+        """Error Response if the handler refused the upload, else None (parses the body)."""
+        request.FILES
+        rejection = getattr(request._request, "upload_rejection", None)
+        if rejection is None:
+            return None
+        code, message = rejection
+        return Response({"error": message}, status=code)
+
+    @staticmethod
+    def skipped_uploads(request):
+        return getattr(request._request, "upload_skipped", [])
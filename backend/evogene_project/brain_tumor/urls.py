@@ -1,6 +1,6 @@
 # brain_tumor/urls.py
 from django.urls import path
-from .views import BrainTumorAnalyzeView
+from .views import BrainTumorAnalyzeView, BrainTumorBulkAnalyzeView, BrainTumorVolumeAnalyzeView, BrainTumorRenderView, BrainTumorBatchStatsView
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -9,6 +9,11 @@ urlpatterns = [
     # Assuming project urls are routed to /api/brain/
     # The final endpoint is: /api/brain/analyze/
     path('brain-tumor/analysis/', BrainTumorAnalyzeView.as_view(), name='brain-scan-analyze'),
+    path('brain-tumor/analysis/bulk/', BrainTumorBulkAnalyzeView.as_view(), name='brain-scan-bulk-analyze'),
+    path('brain-tumor/analysis/volume/', BrainTumorVolumeAnalyzeView.as_view(), name='brain-scan-volume-analyze'),
+    path('brain-tumor/analysis/<int:pk>/mask/', BrainTumorRenderView.as_view(default_style='mask'), name='brain-scan-mask'),
+    path('brain-tumor/analysis/<int:pk>/overlay/', BrainTumorRenderView.as_view(default_style='overlay'), name='brain-scan-overlay'),
+    path('brain-tumor/batch-stats/', BrainTumorBatchStatsView.as_view(), name='brain-scan-batch-stats'),
 ]
 
 if settings.DEBUG:
@@ -1,52 +1,189 @@
 # brain_tumor/utils.py
 from io import BytesIO
 from PIL import Image
+from django.core.files.base import ContentFile
 import numpy as np
-import tensorflow as tf
 import os
+import tarfile
+import zipfile
+from django.conf import settings
+from evogene_project.model_registry import registry
+from .batching import MicroBatcher
+from . import regions, workers
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, "models", "model_attention_layer_unet.h5")
+# Registered in settings.ML_MODELS
+MODEL_NAME = "brain_tumor_unet"
 
 
-try:
-    model = tf.keras.models.load_model(MODEL_PATH)
-    print("✅ Brain Tumor DL Model Loaded Successfully.")
-except Exception as e:
-    raise RuntimeError(f"Model loading failed: {e}")
+def load_unet(path):
+    # TensorFlow is imported here so that importing this module stays cheap
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
 
 
-def analyze_scan(image_file):
-    """Process uploaded MRI image, resize, run prediction, return (score, mask_buffer)."""
+def get_model():
+    """The attention U-Net, loaded on first use via the model registry.
 
-    # 🧩 Step 1: Load and preprocess image
+    With BRAIN_TUMOR_INFERENCE_WORKERS > 0 this is a client of the out-of-process
+    inference pool instead (brain_tumor/workers.py); TensorFlow stays out of this process.
+    """
+    if workers.enabled():
+        return workers.get_client()
+    return registry.get(MODEL_NAME)
+
+
+def model_version():
+    """Content hash of the loaded U-Net file (cache key component)."""
+    if workers.enabled():
+        return workers.get_client().version()
+    return registry.version(MODEL_NAME)
+
+
+# 🧠 Shared micro-batcher: concurrent requests are merged into one forward pass
+batcher = MicroBatcher(
+    predict_fn=lambda batch: get_model().predict_on_batch(batch),
+    max_batch_size=getattr(settings, "BRAIN_TUMOR_BATCH_MAX_SIZE", 16),
+    max_wait_ms=getattr(settings, "BRAIN_TUMOR_BATCH_MAX_WAIT_MS", 10),
+    timeout=getattr(settings, "BRAIN_TUMOR_BATCH_TIMEOUT", 60),
+)
+
+
+INPUT_SIZE = (128, 128)
+INPUT_CHANNELS = 2
+MASK_SIZE = (256, 256)
+_255 = np.float32(255)
+
+
+def decode_scan(image_file):
+    """Decode an upload straight to a (128, 128) uint8 grayscale array.
+
+    JPEGs are decoded in draft mode: libjpeg scales by 1/2, 1/4 or 1/8 in the
+    DCT and emits luma only, so a 2048px scan never exists at full size or in
+    RGB. The final resize to the model input is the same as before.
+    """
     img = Image.open(image_file)
+    if img.format == "JPEG" and getattr(settings, "BRAIN_TUMOR_JPEG_DRAFT", True):
+        img.draft("L", INPUT_SIZE)  # never goes below the requested size
+    if img.mode != "L":
+        img = img.convert("L")  # single-channel grayscale
+    if img.size != INPUT_SIZE:
+        img = img.resize(INPUT_SIZE)  # match model input size
+    return np.asarray(img)
+
+
+def preprocess_scan(image_file, out=None):
+    """Load an uploaded MRI image and return a (128, 128, 2) float32 model input.
+
+    The model was trained on 2-channel input; the grayscale slice is used for
+    both channels by broadcasting. With `out` (e.g. one slot of a preallocated
+    batch) the normalized pixels are written straight into it; without, the
+    result is a read-only view that duplicates the channel without copying.
+    """
+    return to_model_input(decode_scan(image_file), out=out)
+
+
+def to_model_input(gray, out=None):
+    """(128, 128) uint8 slice -> (128, 128, 2) float32 in [0, 1] (see preprocess_scan)."""
+    if out is not None:
+        np.divide(gray[:, :, None], _255, out=out)  # normalize + duplicate in one pass
+        return out
+    channel = np.divide(gray, _255, dtype=np.float32)
+    return np.broadcast_to(channel[:, :, None], (*INPUT_SIZE, INPUT_CHANNELS))
+
+
+def predict_batch(input_batch):
+    """Run one forward pass over an (N, 128, 128, 2) batch, bypassing the micro-batcher."""
+    return np.asarray(get_model().predict_on_batch(input_batch))
+
 
-    # Convert to grayscale if your model uses 2 channels
-    # (Assumption: model trained on 2-channel input — e.g., MRI slices or merged modalities)
-    img = img.convert("L")  # convert to single-channel grayscale
-    img = img.resize((128, 128))  # match model input size
+def mask_pixels(mask_output, out=None):
+    """First mask channel scaled to uint8 in one pass, without a float temporary."""
+    if out is None:
+        out = np.empty(mask_output.shape[:2], dtype=np.uint8)
+    np.multiply(mask_output[:, :, 0], _255, out=out, casting="unsafe")
+    return out
 
-    # Convert to NumPy array and duplicate channels to make 2 channels
-    img_array = np.array(img)
-    if len(img_array.shape) == 2:  # (H, W)
-        img_array = np.stack([img_array, img_array], axis=-1)  # (H, W, 2)
 
-    # Normalize and add batch dimension
-    img_array = img_array / 255.0
-    input_tensor = np.expand_dims(img_array, axis=0)  # (1, 128, 128, 2)
+def encode_png(pixels, size=MASK_SIZE):
+    """(H, W) uint8 pixels -> grayscale PNG buffer, upscaled to `size` to display nicely."""
+    img = Image.fromarray(pixels)
+    if img.size != tuple(size):
+        img = img.resize(tuple(size))
 
-    # 🧩 Step 2: Model prediction
-    mask_output = model.predict(input_tensor)
+    # zlib level 1 is several times faster than the default 6 and barely larger on masks
+    buffer = BytesIO()
+    img.save(buffer, format="PNG", compress_level=getattr(settings, "BRAIN_TUMOR_MASK_PNG_LEVEL", 1))
+    buffer.seek(0)
+    return buffer
+
+
+def encode_mask(mask_output):
+    """First mask channel -> 256x256 grayscale PNG buffer (probabilities, not thresholded)."""
+    return encode_png(mask_pixels(mask_output))
+
+
+def postprocess_mask(mask_output):
+    """Turn one (128, 128, K) prediction into (score, detected_region payload)."""
     tumor_score = float(np.mean(mask_output))  # Use average activation as "score"
+    return tumor_score, regions.describe_mask(mask_output)
+
+
+def analyze_scan(image_file):
+    """Process uploaded MRI image, resize, run prediction, return (score, detected_region payload)."""
+
+    # 🧩 Step 1: Load and preprocess image
+    input_tensor = preprocess_scan(image_file)
+
+    # 🧩 Step 2: Model prediction (batched with other in-flight requests)
+    mask_output = batcher.predict(input_tensor)
+
+    # 🧩 Step 3: Score + regions / compact mask
+    return postprocess_mask(mask_output)
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def _read_member(stream, name, declared, budget):
+    """One archive member's bytes, refused on its declared size and again on what it actually inflates to."""
+    if declared <= budget["member"]:
+        data = stream.read(budget["member"] + 1)  # bounded, whatever the header claimed
+        declared = len(data)
+    if declared > budget["member"]:
+        raise ArchiveError(f"'{name}' in the archive is larger than {budget['member'] / 2 ** 20:.4g} MB")
+    budget["left"] -= declared
+    if budget["left"] < 0:
+        raise ArchiveError(f"Archive unpacks to more than {budget['unpacked'] / 2 ** 20:.4g} MB")
+    return data
+
 
-    # 🧩 Step 3: Create fake colored overlay mask
-    mask_img = Image.fromarray((mask_output[0, :, :, 0] * 255).astype(np.uint8))
-    mask_img = mask_img.resize((256, 256))  # upscale to display nicely
+def iter_archive_images(archive_file):
+    """Lazily yield image members of an uploaded zip/tar archive as named ContentFiles.
 
-    # Save into BytesIO buffer
-    mask_buffer = BytesIO()
-    mask_img.save(mask_buffer, format="PNG")
-    mask_buffer.seek(0)
+    Each member is capped at BRAIN_TUMOR_UPLOAD_MAX_BYTES and the archive as a whole at
+    BRAIN_TUMOR_ARCHIVE_UNPACKED_MAX_BYTES of decompressed data; ArchiveError past either.
+    """
+    unpacked = getattr(settings, "BRAIN_TUMOR_ARCHIVE_UNPACKED_MAX_BYTES", 2 * 1024 ** 3)
+    budget = {"member": getattr(settings, "BRAIN_TUMOR_UPLOAD_MAX_BYTES", 32 * 1024 ** 2), "unpacked": unpacked, "left": unpacked}
+    if zipfile.is_zipfile(archive_file):
+        archive_file.seek(0)
+        with zipfile.ZipFile(archive_file) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                with zf.open(info) as member:
+                    yield ContentFile(_read_member(member, name, info.file_size, budget), name=name)
+        return
 
-    return tumor_score, mask_buffer
+    archive_file.seek(0)
+    with tarfile.open(fileobj=archive_file, mode="r:*") as tf_archive:
+        for member in tf_archive:
+            name = os.path.basename(member.name)
+            if not member.isfile() or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            yield ContentFile(_read_member(tf_archive.extractfile(member), name, member.size, budget), name=name)
@@ -1,24 +1,46 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from django.core.files.base import ContentFile
+from rest_framework import permissions, status
+from django.core.files.base import File
 from django.contrib.auth import get_user_model
-from .models import BrainTumorAnalysis
-from .utils import analyze_scan   # Your AI function
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
+from itertools import chain, islice
+from .models import BrainTumorAnalysis, BrainTumorVolumeAnalysis
+from .volumes import VolumeError, analyze_volume, open_upload
+from .utils import ArchiveError, analyze_scan, batcher, model_version, preprocess_scan, predict_batch, postprocess_mask, iter_archive_images, INPUT_SIZE, INPUT_CHANNELS   # Your AI function
+from . import regions, renders, workers
+from .cache import cache_enabled, hash_upload, lookup, store_result, store_scan
+from .uploads import StreamedUploadMixin
 import io
+import json
+import tempfile
+import time
 import traceback
+import uuid
+import numpy as np
 
 User = get_user_model()
 
-class BrainTumorAnalyzeView(APIView):
+class BrainTumorAnalyzeView(StreamedUploadMixin, APIView):
     """
     Handles POST requests for brain tumor image analysis:
-    1. Accepts FormData image upload.
+    1. Accepts FormData image upload (streamed to disk and hashed as it arrives; oversize / non-image uploads are refused early).
     2. Passes image to ML model (analyze_scan).
-    3. Saves original + result.
+    3. Saves original + result (stored once per content hash; results cached per model version).
+       The result is the score plus regions and a compact mask in `detected_region`; no mask PNG is written.
     """
 
+    upload_fields = {"image": ("image", "BRAIN_TUMOR_UPLOAD_MAX_BYTES", 32 * 1024 ** 2, "reject")}
+    upload_request_limit = ("BRAIN_TUMOR_UPLOAD_MAX_BYTES", 32 * 1024 ** 2)
+
     def post(self, request, *args, **kwargs):
+        rejected = self.upload_rejection(request)
+        if rejected is not None:
+            return rejected
         try:
             if 'image' not in request.FILES:
                 return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
@@ -26,26 +48,20 @@ class BrainTumorAnalyzeView(APIView):
             image_file = request.FILES['image']
             user = request.user if request.user.is_authenticated else None
 
-            # Run deep learning analysis
-            tumor_score, mask_buffer = analyze_scan(image_file)
-
-            # Save DB record
-            image_file.seek(0)
-            analysis = BrainTumorAnalysis.objects.create(
-                user=user,
-                mri_image=image_file,
-                confidence_score=tumor_score,
-                prediction_label="Tumor Detected" if tumor_score > 0.5 else "No Tumor Detected"
-            )
+            if cache_enabled():
+                analysis, cached = self._analyze_cached(image_file, user)
+            else:
+                analysis, cached = self._analyze(image_file, user), False
+            tumor_score = analysis.confidence_score
 
-            mask_filename = f"mask_{analysis.pk}_{image_file.name}"
-            analysis.masked_image.save(mask_filename, ContentFile(mask_buffer.getvalue()))
-            
             response_data = {
                 "id": analysis.id,
                 "prediction_label": analysis.prediction_label,
                 "confidence_score": f"{tumor_score:.4f}",
-                "masked_image_url": request.build_absolute_uri(analysis.masked_image.url),
+                "masked_image_url": _mask_url(request, analysis),
+                "overlay_url": _overlay_url(request, analysis),
+                "regions": _regions(analysis),
+                "cached": cached,
                 "status": "Analysis Complete ✅"
             }
 
@@ -64,3 +80,332 @@ class BrainTumorAnalyzeView(APIView):
                 {"error": "Processing Failed", "details": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    def _analyze(self, image_file, user):
+        # Run deep learning analysis
+        tumor_score, detected_region = analyze_scan(image_file)
+
+        # Save DB record
+        image_file.seek(0)
+        analysis = BrainTumorAnalysis.objects.create(
+            user=user,
+            mri_image=image_file,
+            confidence_score=tumor_score,
+            detected_region=regions.dumps(detected_region),
+            prediction_label="Tumor Detected" if tumor_score > 0.5 else "No Tumor Detected"
+        )
+        return analysis
+
+    def _analyze_cached(self, image_file, user):
+        """Content-addressed path: same bytes + same model version => no inference, no new files."""
+        image_hash = hash_upload(image_file)
+        version = model_version()
+
+        cached = lookup(image_hash, version)
+        if cached is not None:
+            tumor_score, mask_name, detected_region = cached
+        else:
+            tumor_score, payload = analyze_scan(image_file)
+            mask_name, detected_region = None, regions.dumps(payload)
+            store_result(image_hash, version, tumor_score, detected_region)
+
+        analysis = BrainTumorAnalysis.objects.create(
+            user=user,
+            mri_image=store_scan(image_file, image_hash),
+            masked_image=mask_name,
+            detected_region=detected_region,
+            image_hash=image_hash,
+            confidence_score=tumor_score,
+            prediction_label="Tumor Detected" if tumor_score > 0.5 else "No Tumor Detected"
+        )
+        return analysis, cached is not None
+
+
+class BrainTumorBulkAnalyzeView(StreamedUploadMixin, APIView):
+    """
+    Handles POST requests for bulk brain tumor analysis:
+    1. Accepts many `images` (multipart) and/or one zip/tar `archive`; an oversize / non-image file is skipped and reported.
+    2. Runs scans through the U-Net in vectorized batches.
+    3. Bulk-creates the analysis rows per batch and streams one NDJSON line per scan.
+    """
+
+    upload_fields = {
+        "images": ("image", "BRAIN_TUMOR_UPLOAD_MAX_BYTES", 32 * 1024 ** 2, "skip"),
+        "image": ("image", "BRAIN_TUMOR_UPLOAD_MAX_BYTES", 32 * 1024 ** 2, "skip"),
+        "archive": ("archive", "BRAIN_TUMOR_ARCHIVE_MAX_BYTES", 1024 ** 3, "reject"),
+    }
+
+    def post(self, request, *args, **kwargs):
+        rejected = self.upload_rejection(request)
+        if rejected is not None:
+            return rejected
+        images = request.FILES.getlist('images') or request.FILES.getlist('image')
+        archive = request.FILES.get('archive')
+        skipped = self.skipped_uploads(request)
+        if not images and archive is None and not skipped:
+            return Response({"error": "No images or archive provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_files = getattr(settings, "BRAIN_TUMOR_BULK_MAX_FILES", 500)
+        if len(images) + len(skipped) > max_files:
+            return Response({"error": f"Too many files ({len(images) + len(skipped)} > {max_files})"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        scans = iter(images)
+        if archive is not None:
+            scans = chain(scans, iter_archive_images(archive))
+
+        batch_size = getattr(settings, "BRAIN_TUMOR_BULK_BATCH_SIZE", 32)
+        user = request.user if request.user.is_authenticated else None
+
+        response = StreamingHttpResponse(
+            self._stream(request, _capped(scans, max_files), batch_size, user, skipped),
+            content_type="application/x-ndjson",
+        )
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    def _stream(self, request, scans, batch_size, user, skipped=()):
+        started = time.perf_counter()
+        total = failed = len(skipped)
+        index = 0
+        for rejected in skipped:  # refused while uploading, never stored
+            yield _ndjson({"index": None, **rejected})
+        # One input buffer for the whole request; each scan is decoded straight into its slot
+        batch = np.empty((batch_size, *INPUT_SIZE, INPUT_CHANNELS), dtype=np.float32)
+
+        stopped = None  # ArchiveError that ends the upload; the scans read before it are still analyzed
+        try:
+            while stopped is None:
+                chunk, stopped = _take(scans, batch_size)
+                if not chunk:
+                    break
+
+                # 🧩 Step 1: Preprocess; a bad file only fails its own line
+                ready = []
+                for image_file in chunk:
+                    try:
+                        preprocess_scan(image_file, out=batch[len(ready)])
+                        ready.append((index, image_file))
+                    except Exception as e:
+                        failed += 1
+                        yield _ndjson({"index": index, "file": image_file.name, "error": str(e)})
+                    index += 1
+                total += len(chunk)
+                if not ready:
+                    continue
+
+                # 🧩 Step 2: One forward pass for the whole batch
+                outputs = predict_batch(batch[:len(ready)])
+
+                # 🧩 Step 3: Build rows and persist them in one INSERT
+                rows = []
+                for (_, image_file), mask_output in zip(ready, outputs):
+                    tumor_score, detected_region = postprocess_mask(mask_output)
+                    image_file.seek(0)
+                    rows.append(BrainTumorAnalysis(
+                        user=user,
+                        mri_image=image_file,
+                        confidence_score=tumor_score,
+                        detected_region=regions.dumps(detected_region),
+                        prediction_label="Tumor Detected" if tumor_score > 0.5 else "No Tumor Detected",
+                    ))
+                rows = BrainTumorAnalysis.objects.bulk_create(rows)
+
+                for (scan_index, image_file), analysis in zip(ready, rows):
+                    yield _ndjson({
+                        "index": scan_index,
+                        "file": image_file.name,
+                        "id": analysis.pk,
+                        "prediction_label": analysis.prediction_label,
+                        "confidence_score": f"{analysis.confidence_score:.4f}",
+                        "masked_image_url": _mask_url(request, analysis),
+                        "overlay_url": _overlay_url(request, analysis),
+                        "regions": _regions(analysis),
+                    })
+        except Exception as e:
+            print("[❌ ERROR in BrainTumorBulkAnalyzeView]")
+            traceback.print_exc()
+            yield _ndjson({"error": "Batch Processing Failed", "details": str(e)})
+        if stopped is not None:
+            yield _ndjson({"index": None, "error": str(stopped)})
+
+        elapsed = time.perf_counter() - started
+        yield _ndjson({
+            "done": True,
+            "total": total,
+            "failed": failed,
+            "elapsed_s": round(elapsed, 3),
+            "scans_per_sec": round(total / elapsed, 2) if elapsed > 0 else None,
+        })
+
+
+def _take(scans, count):
+    """(up to `count` scans, ArchiveError or None): an archive error keeps the scans read before it."""
+    chunk = []
+    try:
+        for scan in islice(scans, count):
+            chunk.append(scan)
+    except ArchiveError as e:
+        return chunk, e
+    return chunk, None
+
+
+def _capped(scans, limit):
+    """The first `limit` scans; ArchiveError instead of silently dropping any beyond them."""
+    for count, scan in enumerate(scans):
+        if count >= limit:
+            raise ArchiveError(f"More than {limit} scans in the upload; the rest were not analyzed")
+        yield scan
+
+
+def _ndjson(payload):
+    return json.dumps(payload) + "\n"
+
+
+def _render_url(request, name, analysis):
+    # The signed token lets <img> tags (no Authorization header) and guests load their own analysis
+    url = reverse(name, args=[analysis.pk])
+    return request.build_absolute_uri(f"{url}?token={renders.link_token(analysis.pk)}")
+
+
+def _mask_url(request, analysis):
+    """Rendered-on-demand mask for new rows; the stored PNG for rows from before compact masks."""
+    if analysis.masked_image:
+        return request.build_absolute_uri(analysis.masked_image.url)
+    return _render_url(request, 'brain-scan-mask', analysis)
+
+
+def _overlay_url(request, analysis):
+    return _render_url(request, 'brain-scan-overlay', analysis)
+
+
+def _regions(analysis):
+    payload = regions.loads(analysis.detected_region)
+    return payload["regions"] if payload else []
+
+
+class HasRenderToken(permissions.BasePermission):
+    """The request carries the signed `token` of the analysis in the URL."""
+
+    def has_permission(self, request, view):
+        return renders.check_link_token(view.kwargs.get("pk"), request.query_params.get("token"))
+
+
+class BrainTumorRenderView(APIView):
+    """
+    GET a mask / overlay PNG of one analysis, rendered from its stored mask on demand.
+    Query: size (256 or 320x240), style (mask | overlay | outline), color, alpha, token.
+    Only the owner (or a request with the analysis' signed token) gets the image; anyone else gets 404.
+    Rendered images are cached (memory + disk) per (analysis, size, style) and sent with an ETag.
+    """
+    permission_classes = [permissions.IsAuthenticated | HasRenderToken]
+    default_style = "mask"
+
+    def get_queryset(self, request, pk):
+        if renders.check_link_token(pk, request.query_params.get("token")):
+            return BrainTumorAnalysis.objects.all()
+        return BrainTumorAnalysis.objects.filter(user=request.user)
+
+    def get(self, request, pk, *args, **kwargs):
+        analysis = get_object_or_404(self.get_queryset(request, pk), pk=pk)
+        try:
+            options = renders.parse_options(request.query_params, self.default_style)
+        except renders.RenderError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        tag = renders.etag(analysis, options)
+        if {quote_etag(tag), "*"} & set(parse_etags(request.headers.get("If-None-Match", ""))):
+            return self._cacheable(HttpResponse(status=status.HTTP_304_NOT_MODIFIED), tag)
+
+        data, source = renders.cache.get(tag)
+        if data is None:
+            try:
+                data = renders.render(analysis, options)
+            except LookupError as e:
+                return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+            renders.cache.put(tag, data)
+        response = HttpResponse(data, content_type="image/png")
+        response["X-Render-Cache"] = source or "miss"
+        return self._cacheable(response, tag)
+
+    @staticmethod
+    def _cacheable(response, tag):
+        # The ETag changes with the analysis, so browsers may keep an image for as long as they like
+        response["ETag"] = quote_etag(tag)
+        response["Cache-Control"] = f"private, max-age={getattr(settings, 'BRAIN_TUMOR_RENDER_MAX_AGE', 86400)}"
+        return response
+
+
+class BrainTumorVolumeAnalyzeView(StreamedUploadMixin, APIView):
+    """
+    Handles POST requests for volumetric MRI analysis:
+    1. Accepts one NIfTI `volume` (.nii / .nii.gz), a zip of a DICOM series as `volume`, or DICOM `slices`.
+    2. Memory-maps the volume and streams its slices through the U-Net in batches.
+    3. Saves the per-volume score, per-slice scores and a 3-D NIfTI mask.
+    """
+
+    upload_fields = {
+        "volume": ("volume", "BRAIN_TUMOR_VOLUME_MAX_BYTES", 2 * 1024 ** 3, "reject"),
+        "slices": (None, "BRAIN_TUMOR_VOLUME_MAX_BYTES", 2 * 1024 ** 3, "reject"),
+    }
+    upload_request_limit = ("BRAIN_TUMOR_VOLUME_MAX_BYTES", 2 * 1024 ** 3)
+
+    def post(self, request, *args, **kwargs):
+        rejected = self.upload_rejection(request)
+        if rejected is not None:
+            return rejected
+        user = request.user if request.user.is_authenticated else None
+        try:
+            with open_upload(request.FILES) as volume, tempfile.TemporaryFile() as mask_file:
+                summary = analyze_volume(volume, mask_file=mask_file)
+                analysis = BrainTumorVolumeAnalysis(
+                    user=user,
+                    source_name=volume.name[:255],
+                    source_format=volume.source_format,
+                    shape="x".join(str(d) for d in summary["shape"]),
+                    slice_count=summary["slice_count"],
+                    confidence_score=summary["volume_score"],
+                    prediction_label="Tumor Detected" if summary["volume_score"] > 0.5 else "No Tumor Detected",
+                    peak_slice=summary["peak_slice"],
+                    tumor_volume_ml=summary["tumor_volume_ml"],
+                    slice_scores=summary["slice_scores"],
+                )
+                mask_file.seek(0)
+                analysis.mask_volume.save(f"mask_{uuid.uuid4().hex[:8]}.nii.gz", File(mask_file), save=False)
+                analysis.save()
+        except VolumeError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            print("[❌ ERROR in BrainTumorVolumeAnalyzeView]")
+            traceback.print_exc()
+            return Response({"error": "Volume Processing Failed", "details": str(e)},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            "id": analysis.id,
+            "source_format": analysis.source_format,
+            "shape": summary["shape"],
+            "spacing_mm": summary["spacing_mm"],
+            "prediction_label": analysis.prediction_label,
+            "confidence_score": f"{analysis.confidence_score:.4f}",
+            "mean_score": f"{summary['mean_score']:.4f}",
+            "peak_slice": analysis.peak_slice,
+            "tumor_volume_ml": analysis.tumor_volume_ml,
+            "slice_scores": analysis.slice_scores,
+            "mask_volume_url": request.build_absolute_uri(analysis.mask_volume.url),
+            "elapsed_s": summary["elapsed_s"],
+            "status": "Analysis Complete ✅",
+        }, status=status.HTTP_200_OK)
+
+
+class BrainTumorBatchStatsView(APIView):
+    """Per-batch size/latency stats of the U-Net micro-batcher (for tuning max batch size / wait window), plus the inference pool's when enabled and the render cache's."""
+
+    def get(self, request, *args, **kwargs):
+        stats = batcher.stats()
+        stats["render_cache"] = renders.cache.stats()
+        if workers.enabled():
+            try:
+                stats["inference_pool"] = workers.get_client().stats()
+            except Exception as e:
+                stats["inference_pool"] = {"error": str(e)}
+        return Response(stats, status=status.HTTP_200_OK)
@@ -0,0 +1,377 @@
+# brain_tumor/volumes.py
+"""
+3-D MRI studies: a NIfTI-1 volume (.nii / .nii.gz) or a DICOM series.
+
+Nothing loads a whole volume into memory:
+
+* NIfTI — .nii files are memory-mapped in place (the upload's temp file when
+  Django spooled it to disk); .nii.gz is decompressed once, in 1 MB chunks,
+  to a temp .nii and then mapped. Only the pages of the slices being read are
+  resident, and the OS can drop them again.
+* DICOM — one file per slice; headers are read without pixel data to sort
+  the series along the slice normal, then each slice's pixels are decoded
+  when its batch comes up. Needs `pydicom` (only imported for DICOM).
+
+`analyze_volume` streams slices through the U-Net BRAIN_TUMOR_VOLUME_BATCH_SIZE
+at a time into one reused input buffer, keeps per-slice scores, and writes
+the 3-D probability mask slice by slice into a gzipped NIfTI. Peak memory is
+one batch plus one source slice, whatever the number of slices.
+"""
+import gzip
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .regions import mask_threshold
+from .utils import INPUT_CHANNELS, INPUT_SIZE, mask_pixels, predict_batch, to_model_input
+
+NIFTI_DTYPES = {
+    2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32, 64: np.float64,
+    256: np.int8, 512: np.uint16, 768: np.uint32,
+}
+NIFTI_CODES = {np.dtype(dtype): code for code, dtype in NIFTI_DTYPES.items()}
+_CHUNK = 1 << 20
+
+
+class VolumeError(ValueError):
+    pass
+
+
+# 🧊 NIfTI-1
+class NiftiVolume:
+    """Memory-mapped single-file NIfTI-1 volume; `slice(k)` is the k-th axial slice as (rows, cols)."""
+    source_format = "nifti"
+
+    def __init__(self, path, name=None):
+        self.path = str(path)
+        self.name = name or os.path.basename(self.path)
+        with open(self.path, "rb") as f:
+            header = f.read(348)
+        if len(header) < 348:
+            raise VolumeError("File is too short to be a NIfTI volume")
+
+        sizes = {endian: struct.unpack_from(f"{endian}i", header, 0)[0] for endian in "<>"}
+        if 540 in sizes.values():
+            raise VolumeError("NIfTI-2 volumes are not supported; save as NIfTI-1")
+        endian = "<" if sizes["<"] == 348 else ">"
+        if sizes[endian] != 348 or header[344:347] != b"n+1":
+            raise VolumeError("Not a single-file NIfTI-1 volume (.nii / .nii.gz)")
+
+        dims = struct.unpack_from(f"{endian}8h", header, 40)
+        datatype = struct.unpack_from(f"{endian}h", header, 70)[0]
+        pixdim = struct.unpack_from(f"{endian}8f", header, 76)
+        vox_offset, slope, inter = struct.unpack_from(f"{endian}3f", header, 108)
+        ndim = dims[0]
+        if ndim < 3 or any(d > 1 for d in dims[4:ndim + 1]):
+            raise VolumeError(f"Expected a 3-D volume, got dims {dims[1:ndim + 1]}")
+        if datatype not in NIFTI_DTYPES:
+            raise VolumeError(f"Unsupported NIfTI datatype {datatype}")
+
+        nx, ny, nz = dims[1:4]
+        if min(nx, ny, nz) < 1:
+            raise VolumeError(f"Volume dimensions must be positive, got {nx}x{ny}x{nz}")
+        # A truncated file or a bogus vox_offset would otherwise map past the end (or before the header)
+        if not np.isfinite(vox_offset) or vox_offset < 348:
+            raise VolumeError(f"Invalid NIfTI vox_offset {vox_offset}")
+        dtype = np.dtype(NIFTI_DTYPES[datatype])
+        needed = int(vox_offset) + nx * ny * nz * dtype.itemsize
+        size = os.path.getsize(self.path)
+        if size < needed:
+            raise VolumeError(f"NIfTI file is truncated: {nx}x{ny}x{nz} voxels need {needed} bytes, got {size}")
+        self.data = np.memmap(self.path, dtype=dtype.newbyteorder(endian), mode="r",
+                              offset=int(vox_offset), shape=(nx, ny, nz), order="F")
+        self.shape = (ny, nx, nz)  # rows, cols, slices
+        self.spacing = (abs(pixdim[2]) or 1.0, abs(pixdim[1]) or 1.0, abs(pixdim[3]) or 1.0)
+        self.slope = slope if slope and np.isfinite(slope) else 1.0
+        self.inter = inter if np.isfinite(inter) else 0.0
+
+    @property
+    def slice_count(self):
+        return self.shape[2]
+
+    def slice(self, k):
+        # x varies fastest on disk, so [:, :, k] is one contiguous block; .T is (rows, cols) for free
+        pixels = np.array(self.data[:, :, k].T, dtype=np.float32)
+        if self.slope != 1.0 or self.inter:
+            pixels *= self.slope
+            pixels += self.inter
+        return pixels
+
+    def close(self):
+        mmap = getattr(self.data, "_mmap", None)
+        self.data = None
+        if mmap is not None:
+            mmap.close()
+
+
+class NiftiWriter:
+    """Streams (rows, cols) slices into a NIfTI-1 file (gzipped by default)."""
+
+    def __init__(self, fileobj, rows, cols, slices, dtype, spacing=(1.0, 1.0, 1.0), scl_slope=1.0, compress=True):
+        self.dtype = np.dtype(dtype)
+        self._out = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=1) if compress else fileobj
+        self._out.write(nifti_header((cols, rows, slices), self.dtype, (spacing[1], spacing[0], spacing[2]), scl_slope))
+        self.written = 0
+
+    def write(self, pixels):
+        # C-order (rows, cols) bytes are x-fastest, i.e. NIfTI's on-disk order
+        self._out.write(np.ascontiguousarray(pixels, dtype=self.dtype).tobytes())
+        self.written += 1
+
+    def close(self):
+        if isinstance(self._out, gzip.GzipFile):
+            self._out.close()
+
+
+def nifti_header(shape_xyz, dtype, pixdim_xyz, scl_slope=1.0):
+    """348-byte NIfTI-1 header + empty extension block (data starts at byte 352)."""
+    dtype = np.dtype(dtype)
+    header = bytearray(352)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, 3, *shape_xyz, 1, 1, 1, 1)
+    struct.pack_into("<2h", header, 70, NIFTI_CODES[dtype.newbyteorder("=")], dtype.itemsize * 8)
+    struct.pack_into("<8f", header, 76, 1.0, *pixdim_xyz, 0.0, 0.0, 0.0, 0.0)
+    struct.pack_into("<3f", header, 108, 352.0, scl_slope, 0.0)
+    header[123] = 2  # xyzt_units: millimetres
+    header[344:348] = b"n+1\0"
+    return bytes(header)
+
+
+# 🩻 DICOM series
+class DicomSeries:
+    """One DICOM file per slice, sorted along the slice normal; pixels are decoded per slice on demand."""
+    source_format = "dicom"
+
+    def __init__(self, sources, name="dicom-series"):
+        pydicom = _pydicom()
+        self.name = name
+        series = {}
+        for source in sources:
+            try:
+                ds = pydicom.dcmread(_rewind(source), stop_before_pixels=True)
+            except Exception:
+                continue  # DICOMDIR, readme files, thumbnails ...
+            if "Rows" not in ds or "Columns" not in ds:
+                continue
+            series.setdefault(getattr(ds, "SeriesInstanceUID", ""), []).append((ds, source))
+        if not series:
+            raise VolumeError("No DICOM image slices found")
+        headers = max(series.values(), key=len)  # several series in one upload: take the largest
+
+        first = headers[0][0]
+        orientation = np.asarray(getattr(first, "ImageOrientationPatient", [1, 0, 0, 0, 1, 0]), dtype=float)
+        normal = np.cross(orientation[:3], orientation[3:])
+
+        def position(ds):
+            if "ImagePositionPatient" in ds:
+                return float(np.dot(np.asarray(ds.ImagePositionPatient, dtype=float), normal))
+            return float(getattr(ds, "InstanceNumber", 0) or 0)
+
+        headers.sort(key=lambda item: position(item[0]))
+        self.sources = [source for _, source in headers]
+        positions = np.asarray([position(ds) for ds, _ in headers])
+        gaps = np.diff(positions)
+        slice_gap = float(np.median(np.abs(gaps))) if len(gaps) and np.any(gaps) else \
+            float(getattr(first, "SliceThickness", 1.0) or 1.0)
+        row_mm, col_mm = (float(v) for v in getattr(first, "PixelSpacing", (1.0, 1.0)))
+        self.shape = (int(first.Rows), int(first.Columns), len(self.sources))
+        self.spacing = (row_mm, col_mm, slice_gap)
+
+    @property
+    def slice_count(self):
+        return self.shape[2]
+
+    def slice(self, k):
+        ds = _pydicom().dcmread(_rewind(self.sources[k]))
+        pixels = ds.pixel_array.astype(np.float32)
+        if pixels.shape != self.shape[:2]:
+            raise VolumeError(f"Slice {k} is {pixels.shape}, the series is {self.shape[:2]}")
+        slope, inter = float(getattr(ds, "RescaleSlope", 1) or 1), float(getattr(ds, "RescaleIntercept", 0) or 0)
+        if slope != 1.0 or inter:
+            pixels *= slope
+            pixels += inter
+        return pixels
+
+    def close(self):
+        self.sources = []
+
+
+def _pydicom():
+    try:
+        import pydicom
+    except ImportError:
+        raise VolumeError("DICOM series need the `pydicom` package on the server")
+    return pydicom
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+# 📥 Uploads
+@contextmanager
+def open_upload(files):
+    """The volume in request.FILES: `volume` (.nii, .nii.gz or a zip of DICOM files) or many `slices`.
+
+    Temp files live until the block exits.
+    """
+    with tempfile.TemporaryDirectory(prefix="mri_volume_") as workdir:
+        upload = files.get("volume")
+        slices = files.getlist("slices")
+        if upload is not None and zipfile.is_zipfile(_rewind(upload)):
+            volume = DicomSeries(_extract_archive(upload, workdir), name=upload.name)
+        elif upload is not None:
+            volume = NiftiVolume(nifti_on_disk(upload, workdir), name=upload.name)
+        elif slices:
+            volume = DicomSeries([_disk_path(f) or f for f in slices], name=f"{len(slices)} DICOM files")
+        else:
+            raise VolumeError("Upload a NIfTI `volume` (.nii / .nii.gz), a DICOM zip as `volume`, or DICOM `slices`")
+        try:
+            if volume.slice_count < 1:
+                raise VolumeError("Volume has no slices")
+            if volume.slice_count > _max_slices():
+                raise VolumeError(f"{volume.slice_count} slices exceeds the limit of {_max_slices()}")
+            yield volume
+        finally:
+            volume.close()
+
+
+def _disk_path(upload):
+    return upload.temporary_file_path() if hasattr(upload, "temporary_file_path") else None
+
+
+def nifti_on_disk(upload, workdir):
+    """A path to the uncompressed .nii: the upload's own temp file when possible, else a bounded copy."""
+    head = _rewind(upload).read(2)
+    _rewind(upload)
+    if head != b"\x1f\x8b" and _disk_path(upload):
+        return _disk_path(upload)
+
+    path = os.path.join(workdir, "volume.nii")
+    source = gzip.GzipFile(fileobj=upload, mode="rb") if head == b"\x1f\x8b" else upload
+    limit, written = _max_bytes(), 0
+    with open(path, "wb") as out:
+        while True:
+            chunk = source.read(_CHUNK)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > limit:
+                raise VolumeError(f"Volume is larger than {limit / 2 ** 20:g} MB uncompressed")
+            out.write(chunk)
+    return path
+
+
+def _extract_archive(upload, workdir):
+    paths, limit, written = [], _max_bytes(), 0
+    with zipfile.ZipFile(_rewind(upload)) as archive:
+        for index, info in enumerate(m for m in archive.infolist() if not m.is_dir()):
+            if index >= _max_slices() * 2:
+                raise VolumeError("Too many files in the DICOM archive")
+            written += info.file_size
+            if written > limit:
+                raise VolumeError(f"DICOM archive is larger than {limit / 2 ** 20:g} MB uncompressed")
+            path = os.path.join(workdir, f"{index:05d}.dcm")
+            with archive.open(info) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst, _CHUNK)
+            paths.append(path)
+    return paths
+
+
+def _max_slices():
+    return getattr(settings, "BRAIN_TUMOR_VOLUME_MAX_SLICES", 1024)
+
+
+def _max_bytes():
+    return getattr(settings, "BRAIN_TUMOR_VOLUME_MAX_BYTES", 2 * 1024 ** 3)
+
+
+# 🧠 Streamed inference
+def intensity_window(volume, samples=None, percentiles=None):
+    """(low, high) intensities from evenly spaced sample slices; maps the volume to 8-bit like a 2-D upload."""
+    samples = samples or getattr(settings, "BRAIN_TUMOR_VOLUME_WINDOW_SAMPLES", 16)
+    low_pct, high_pct = percentiles or getattr(settings, "BRAIN_TUMOR_VOLUME_WINDOW", (0.5, 99.5))
+    if volume.slice_count < 1:
+        raise VolumeError("Volume has no slices")
+    picks = np.unique(np.linspace(0, volume.slice_count - 1, min(samples, volume.slice_count)).astype(int))
+    sample = np.stack([volume.slice(k)[::2, ::2] for k in picks])  # every other pixel is plenty
+    low, high = (float(v) for v in np.percentile(sample, [low_pct, high_pct]))
+    return low, max(high, low + 1.0)
+
+
+def slice_to_gray(pixels, low, high):
+    """Window a float slice to uint8 and resize it to the model input (in place on `pixels`)."""
+    pixels -= low
+    pixels *= 255.0 / (high - low)
+    np.clip(pixels, 0, 255, out=pixels)
+    img = Image.fromarray(pixels.astype(np.uint8))
+    return np.asarray(img.resize(INPUT_SIZE) if img.size != INPUT_SIZE else img)
+
+
+def analyze_volume(volume, mask_file=None, predict=None, batch_size=None):
+    """Stream every slice through the U-Net; returns the per-volume summary dict.
+
+    With `mask_file`, the 3-D probability mask (model resolution, uint8 with
+    scl_slope 1/255) is written there as a gzipped NIfTI as batches finish.
+    """
+    predict = predict or predict_batch
+    batch_size = batch_size or getattr(settings, "BRAIN_TUMOR_VOLUME_BATCH_SIZE", 32)
+    started = time.perf_counter()
+    rows, cols, count = volume.shape
+    low, high = intensity_window(volume)
+
+    # Mask voxels are model-resolution pixels stretched over the original field of view
+    voxel_spacing = (volume.spacing[0] * rows / INPUT_SIZE[1], volume.spacing[1] * cols / INPUT_SIZE[0],
+                     volume.spacing[2])
+    writer = None
+    if mask_file is not None:
+        writer = NiftiWriter(mask_file, INPUT_SIZE[1], INPUT_SIZE[0], count, np.uint8, voxel_spacing,
+                             scl_slope=1 / 255)
+
+    batch = np.empty((batch_size, *INPUT_SIZE, INPUT_CHANNELS), dtype=np.float32)
+    pixels = np.empty(INPUT_SIZE[::-1], dtype=np.uint8)
+    scores = np.empty(count, dtype=np.float64)
+    tumor_voxels = 0
+    threshold = mask_threshold()
+    try:
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            for i, k in enumerate(range(start, stop)):
+                to_model_input(slice_to_gray(volume.slice(k), low, high), out=batch[i])
+            outputs = predict(batch[:stop - start])
+            for i, mask_output in enumerate(outputs):
+                scores[start + i] = float(np.mean(mask_output))
+                tumor_voxels += int(np.count_nonzero(mask_output[:, :, 0] > threshold))
+                if writer is not None:
+                    writer.write(mask_pixels(mask_output, out=pixels))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - started
+    peak = int(np.argmax(scores)) if count else None
+    return {
+        "source_format": volume.source_format,
+        "shape": [rows, cols, count],
+        "spacing_mm": [round(float(s), 4) for s in volume.spacing],
+        "slice_count": count,
+        "volume_score": float(scores.max()) if count else 0.0,  # the most suspicious slice decides
+        "mean_score": float(scores.mean()) if count else 0.0,
+        "peak_slice": peak,
+        "tumor_voxels": tumor_voxels,
+        "tumor_volume_ml": round(tumor_voxels * float(np.prod(voxel_spacing)) / 1000.0, 3),
+        "slice_scores": [round(float(s), 5) for s in scores],
+        "window": [round(low, 3), round(high, 3)],
+        "elapsed_s": round(elapsed, 3),
+        "slices_per_sec": round(count / elapsed, 2) if elapsed > 0 else None,
+    }
@@ -0,0 +1,410 @@
+# brain_tumor/workers.py
+"""
+Out-of-process U-Net inference.
+
+With BRAIN_TUMOR_INFERENCE_WORKERS > 0 the web processes never import
+TensorFlow. `manage.py run_inference_pool` starts a separate tier instead:
+
+* N worker processes (spawned, never forked from Django), each holding the
+  U-Net from the model registry, with BRAIN_TUMOR_INFERENCE_INTRA_THREADS /
+  _INTER_THREADS TensorFlow threads (or TFLite threads) and optionally pinned
+  to a CPU set. They all pull from one request queue, so load spreads itself.
+* A front process listening on BRAIN_TUMOR_INFERENCE_SOCKET (a Unix socket,
+  authenticated with a key derived from SECRET_KEY) that routes replies back.
+
+Tensors never go through pickle: each client thread owns an input and an
+output `multiprocessing.shared_memory` segment (grown on demand, reused
+across calls). Only the segment names, shape and dtype cross the socket and
+the queues; workers map the segments and read/write them in place.
+
+`PoolClient.predict_on_batch` has the same contract as the in-process
+models, so the micro-batcher and the bulk endpoint don't change: inference
+and web tiers are scaled independently (gunicorn workers/threads vs. pool
+workers/threads) on the same box.
+"""
+import atexit
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from multiprocessing import get_context, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from django.conf import settings
+
+from evogene_project.model_registry import ModelNotAvailable
+
+ATTACH_CACHE_SIZE = 64
+
+
+def enabled():
+    return getattr(settings, "BRAIN_TUMOR_INFERENCE_WORKERS", 0) > 0
+
+
+def _address():
+    return getattr(settings, "BRAIN_TUMOR_INFERENCE_SOCKET", "/tmp/evogene-inference.sock")
+
+
+def _authkey():
+    return hashlib.sha256(f"inference-pool:{settings.SECRET_KEY}".encode()).digest()
+
+
+def _timeout():
+    return getattr(settings, "BRAIN_TUMOR_INFERENCE_TIMEOUT", 60)
+
+
+def parse_cpus(spec):
+    """'0-3,6' -> {0, 1, 2, 3, 6} (empty spec -> None, i.e. no pinning)."""
+    if not spec:
+        return None
+    cpus = set()
+    for part in str(spec).split(","):
+        start, _, end = part.strip().partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+# 🧩 Client (runs in the Django processes)
+class PoolClient:
+    """Thread-safe: every thread gets its own connection and shared-memory segments."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._states = []
+        self._states_lock = threading.Lock()
+        self.info = None
+
+    def predict_on_batch(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        for attempt in range(2):
+            state = self._state()
+            try:
+                return self._predict(state, batch)
+            except TimeoutError as e:
+                # The pool is up but busy or stuck: another attempt would only double the wait
+                raise ModelNotAvailable(str(e))
+            except (EOFError, ConnectionError, BrokenPipeError) as e:
+                self._close(state)  # pool restarted: reconnect once
+                if attempt:
+                    raise ModelNotAvailable(f"Inference pool unavailable: {e}")
+            except OSError as e:  # shared memory, socket errors that a reconnect won't fix
+                self._close(state)
+                raise ModelNotAvailable(f"Inference pool unavailable: {e}")
+
+    def version(self):
+        return self._info()["version"]
+
+    def stats(self):
+        state = self._state()
+        state.conn.send(("stats",))
+        return state.conn.recv()
+
+    def _info(self):
+        if self.info is None:
+            self._state()
+        return self.info
+
+    def _predict(self, state, batch):
+        per_item = int(np.prod(self.info["output_shape"])) * 4
+        out_bytes = max(1, batch.shape[0] * per_item)
+        state.inputs = _ensure_segment(state.inputs, batch.nbytes)
+        state.outputs = _ensure_segment(state.outputs, out_bytes)
+        np.ndarray(batch.shape, np.float32, buffer=state.inputs.buf)[...] = batch
+
+        state.conn.send(("predict", state.inputs.name, batch.shape, state.outputs.name, state.outputs.size))
+        if not state.conn.poll(_timeout()):
+            self._close(state)
+            raise TimeoutError(f"Inference pool did not answer within {_timeout()}s")
+        status, payload, version = state.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Inference worker failed: {payload}")
+        self.info["version"] = version  # workers hot-reload the model file
+        # Copy out: the segment is reused by this thread's next call
+        return np.ndarray(payload, np.float32, buffer=state.outputs.buf).copy()
+
+    def _state(self):
+        state = getattr(self._local, "state", None)
+        if state is None or state.pid != os.getpid():
+            try:
+                conn = Client(_address(), family="AF_UNIX", authkey=_authkey())
+            except (OSError, EOFError) as e:
+                raise ModelNotAvailable(f"Inference pool not reachable at {_address()}: {e}")
+            _, self.info = conn.recv()  # ("hello", {...})
+            state = self._local.state = _ClientState(conn)
+            with self._states_lock:
+                self._states.append(state)
+        return state
+
+    def close(self):
+        """Disconnect every thread and unlink their segments (at process exit)."""
+        with self._states_lock:
+            states, self._states = [s for s in self._states if s.pid == os.getpid()], []
+        for state in states:
+            try:
+                state.conn.close()
+            except OSError:
+                pass
+            for segment in (state.inputs, state.outputs):
+                _release(segment)
+
+    def _close(self, state):
+        try:
+            state.conn.close()
+        except OSError:
+            pass
+        for segment in (state.inputs, state.outputs):
+            _release(segment)
+        state.inputs = state.outputs = None
+        with self._states_lock:
+            if state in self._states:
+                self._states.remove(state)
+        self._local.state = None
+
+
+class _ClientState:
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = os.getpid()
+        self.inputs = None
+        self.outputs = None
+
+
+def _ensure_segment(segment, nbytes):
+    """Reuse `segment` if it is big enough, else replace it with one twice the size needed."""
+    if segment is not None and segment.size >= nbytes:
+        return segment
+    _release(segment)
+    return shared_memory.SharedMemory(create=True, size=nbytes * 2)
+
+
+def _release(segment):
+    if segment is not None:
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PoolClient()
+                atexit.register(_client.close)
+    return _client
+
+
+# 🧠 Worker processes
+def _worker_main(index, requests, results, intra_threads, inter_threads, cpus):
+    import django
+    django.setup()
+
+    from django.conf import settings as worker_settings
+    from evogene_project.model_registry import registry
+    from .utils import INPUT_CHANNELS, INPUT_SIZE, MODEL_NAME
+
+    try:
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        worker_settings.BRAIN_TUMOR_TFLITE_THREADS = intra_threads
+        if getattr(worker_settings, "BRAIN_TUMOR_INFERENCE", "keras") != "tflite":
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(intra_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+
+        model = registry.get(MODEL_NAME)
+        input_shape = tuple(getattr(model, "input_shape", (None, *INPUT_SIZE, INPUT_CHANNELS))[1:])
+        output_shape = np.asarray(model.predict_on_batch(np.zeros((1, *input_shape), np.float32))).shape[1:]
+    except Exception as e:
+        results.put(("failed", index, str(e)))
+        return
+    results.put(("ready", index, {"input_shape": input_shape, "output_shape": output_shape,
+                                  "version": registry.version(MODEL_NAME)}))
+
+    attached = OrderedDict()
+
+    def segment(name):
+        if name in attached:
+            attached.move_to_end(name)
+            return attached[name]
+        shm = shared_memory.SharedMemory(name=name)
+        # The client owns the segment: keep this process's tracker from unlinking it on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        attached[name] = shm
+        if len(attached) > ATTACH_CACHE_SIZE:
+            attached.popitem(last=False)[1].close()
+        return shm
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, in_name, shape, out_name, out_capacity = message
+        started = time.perf_counter()
+        try:
+            model = registry.get(MODEL_NAME)
+            batch = np.ndarray(shape, np.float32, buffer=segment(in_name).buf)
+            output = np.asarray(model.predict_on_batch(batch), dtype=np.float32)
+            if output.nbytes > out_capacity:
+                raise ValueError(f"output of {output.nbytes} bytes does not fit the {out_capacity}-byte segment")
+            np.ndarray(output.shape, np.float32, buffer=segment(out_name).buf)[...] = output
+            reply = ("ok", output.shape, registry.version(MODEL_NAME))
+        except Exception as e:
+            reply = ("error", str(e), None)
+        results.put((request_id, index, reply, (time.perf_counter() - started) * 1000.0, shape[0]))
+
+
+# 🏭 Pool front process
+class InferencePool:
+    def __init__(self, workers, intra_threads=1, inter_threads=1, cpus=None, address=None):
+        self.workers = workers
+        self.intra_threads = intra_threads
+        self.inter_threads = inter_threads
+        self.cpus = cpus
+        self.address = address or _address()
+        self.info = None
+
+        self._ctx = get_context("spawn")  # a fresh interpreter: no forked Django state, no TF in the parent
+        self._requests = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._procs = {}
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._latencies = deque(maxlen=1000)
+        self._served = {}
+        self._restarts = 0
+
+    def start(self, ready_timeout=300):
+        for index in range(self.workers):
+            self._spawn(index)
+        deadline = time.monotonic() + ready_timeout
+        ready = 0
+        while ready < self.workers:
+            try:
+                kind, index, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [i for i, proc in self._procs.items() if not proc.is_alive()]
+                if dead or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"Only {ready}/{self.workers} inference workers became ready"
+                                       f"{f' (worker(s) {dead} exited)' if dead else ''}")
+                continue
+            if kind == "failed":
+                self.stop()
+                raise ModelNotAvailable(f"Inference worker {index} could not load the model: {payload}")
+            self.info = {**payload, "workers": self.workers, "intra_threads": self.intra_threads,
+                         "runtime": getattr(settings, "BRAIN_TUMOR_INFERENCE", "keras")}
+            ready += 1
+        threading.Thread(target=self._route, name="inference-router", daemon=True).start()
+        threading.Thread(target=self._supervise, name="inference-supervisor", daemon=True).start()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # stale socket from a previous run
+        with Listener(self.address, family="AF_UNIX", authkey=_authkey()) as listener:
+            while not self._stopping.is_set():
+                try:
+                    conn = listener.accept()
+                except Exception as e:  # failed handshake (wrong key, client gone)
+                    if not self._stopping.is_set():
+                        print(f"[WARN] Inference pool rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+        for _ in self._procs:
+            self._requests.put(None)
+        for proc in self._procs.values():
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            served = dict(self._served)
+        lat = np.asarray(latencies or [0.0])
+        return {
+            **(self.info or {}),
+            "alive": sum(proc.is_alive() for proc in self._procs.values()),
+            "restarts": self._restarts,
+            "in_flight": len(self._pending),
+            "served_per_worker": served,
+            "inference_ms": {"p50": round(float(np.percentile(lat, 50)), 3),
+                             "p95": round(float(np.percentile(lat, 95)), 3), "window": len(latencies)},
+        }
+
+    def _spawn(self, index):
+        proc = self._ctx.Process(
+            target=_worker_main, name=f"unet-worker-{index}", daemon=True,
+            args=(index, self._requests, self._results, self.intra_threads, self.inter_threads, self.cpus),
+        )
+        proc.start()
+        self._procs[index] = proc
+
+    def _serve(self, conn):
+        """One client connection (one web thread): forward requests, wait for the routed reply."""
+        try:
+            conn.send(("hello", self.info))
+            while True:
+                message = conn.recv()
+                if message[0] == "stats":
+                    conn.send(self.stats())
+                    continue
+                _, in_name, shape, out_name, out_capacity = message
+                request_id = next(self._ids)
+                waiter = [threading.Event(), None]
+                with self._lock:
+                    self._pending[request_id] = waiter
+                self._requests.put((request_id, in_name, shape, out_name, out_capacity))
+                if not waiter[0].wait(_timeout()):
+                    waiter[1] = ("error", "inference timed out", None)
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                conn.send(waiter[1])
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _route(self):
+        while not self._stopping.is_set():
+            message = self._results.get()
+            if message[0] in ("ready", "failed"):
+                if message[0] == "ready":
+                    self.info["version"] = message[2]["version"]
+                else:
+                    print(f"[ERROR] Restarted inference worker {message[1]} failed: {message[2]}")
+                continue
+            request_id, index, reply, elapsed_ms, items = message
+            with self._lock:
+                self._latencies.append(elapsed_ms)
+                self._served[index] = self._served.get(index, 0) + items
+                waiter = self._pending.get(request_id)
+            if waiter is not None:
+                waiter[1] = reply
+                waiter[0].set()
+
+    def _supervise(self):
+        # A crashed worker (OOM, segfault in a native op) is replaced; its in-flight request times out
+        while not self._stopping.wait(1.0):
+            for index, proc in list(self._procs.items()):
+                if not proc.is_alive():
+                    print(f"[WARN] Inference worker {index} exited ({proc.exitcode}), restarting 🔄")
+                    self._restarts += 1
+                    self._spawn(index)
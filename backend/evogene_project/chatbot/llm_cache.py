@@ -0,0 +1,169 @@
+# chatbot/llm_cache.py
+"""
+Persistent cache for Gemini output, in two tiers.
+
+* "prompt" — exact match on the model and the normalized messages
+  (whitespace collapsed, case-folded). Serves variant extraction: the same
+  question asked again, give or take spacing and capitalisation.
+* "variant" — keyed on the model, the prompt template and the extracted
+  variant(s) with their Evo2 result, not on the user's wording. Serves
+  summaries: "what does chr12:43119628 G>A do?" and "is 12-43119628-G-A
+  pathogenic?" end up with the same summary after one LLM call.
+
+A change to a prompt template changes the keys, so stale answers are never
+served after an edit. Entries expire after LLM_CACHE_TTL_SECONDS and the
+table is trimmed LRU-first to LLM_CACHE_MAX_ENTRIES. Each entry remembers
+what its call cost in tokens, so hits add up to `tokens_saved`.
+"""
+import hashlib
+import json
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import LLMResponseCache
+from . import variant_cache
+
+PROMPT, VARIANT = LLMResponseCache.PROMPT, LLMResponseCache.VARIANT
+_SPACES = re.compile(r"\s+")
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = {PROMPT: 0, VARIANT: 0}
+        self.misses = {PROMPT: 0, VARIANT: 0}
+        self.tokens_saved = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def lookup(self, tier, hit, tokens=0):
+        with self.lock:
+            (self.hits if hit else self.misses)[tier] += 1
+            self.tokens_saved += tokens
+
+    def incr(self, field, n=1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + n)
+
+
+counters = _Counters()
+
+
+def enabled():
+    return getattr(settings, "LLM_CACHE_ENABLED", True)
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def _normalize(text):
+    return _SPACES.sub(" ", str(text)).strip().casefold()
+
+
+def prompt_key(messages, model):
+    """Exact tier: model + every message, normalized."""
+    return _digest(PROMPT, model, *(f"{m.type}:{_normalize(m.content)}" for m in messages))
+
+
+def variant_key(template_messages, pairs, model):
+    """Variant tier: model + prompt template + [(variant, evo2 result), ...] in order.
+
+    `template_messages` are the prompt built from empty data, so editing the template moves the key.
+    """
+    template = [f"{m.type}:{_normalize(m.content)}" for m in template_messages]
+    scored = [
+        f"{variant_cache.cache_key(variant)}={json.dumps(result, sort_keys=True, default=str)}"
+        for variant, result in pairs
+    ]
+    return _digest(VARIANT, model, *template, *scored)
+
+
+def estimate_tokens(messages, text, usage=None):
+    """Tokens one call cost: the provider's usage metadata, else ~4 characters per token."""
+    if usage and (usage.get("input_tokens") or usage.get("output_tokens")):
+        return int(usage.get("input_tokens", 0)) + int(usage.get("output_tokens", 0))
+    return (sum(len(str(m.content)) for m in messages) + len(text)) // 4
+
+
+def get(key, tier):
+    """Cached response text, or None on miss / expiry."""
+    if not enabled():
+        return None
+    entry = LLMResponseCache.objects.filter(key=key).only("pk", "response", "tokens", "created_at").first()
+    ttl = getattr(settings, "LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+    if entry is not None and ttl and entry.created_at < timezone.now() - timedelta(seconds=ttl):
+        entry.delete()
+        entry = None
+    if entry is None:
+        counters.lookup(tier, hit=False)
+        return None
+
+    LLMResponseCache.objects.filter(pk=entry.pk).update(hit_count=F("hit_count") + 1, last_used_at=timezone.now())
+    counters.lookup(tier, hit=True, tokens=entry.tokens)
+    return entry.response
+
+
+def put(key, tier, model, text, tokens):
+    if not enabled() or not text:
+        return
+    now = timezone.now()
+    try:
+        LLMResponseCache.objects.update_or_create(
+            key=key,
+            defaults={"tier": tier, "model": model[:64], "response": text, "tokens": tokens,
+                      "created_at": now, "last_used_at": now},
+        )
+    except IntegrityError:
+        return  # stored concurrently by another task
+    counters.incr("stores")
+    evict()
+
+
+def evict():
+    """Drop expired entries, then the least recently used beyond LLM_CACHE_MAX_ENTRIES."""
+    removed = 0
+    ttl = getattr(settings, "LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+    if ttl:
+        removed += LLMResponseCache.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()[0]
+
+    max_entries = getattr(settings, "LLM_CACHE_MAX_ENTRIES", 20000)
+    excess = LLMResponseCache.objects.count() - max_entries
+    if excess > 0:
+        stale = list(LLMResponseCache.objects.order_by("last_used_at").values_list("pk", flat=True)[:excess])
+        removed += LLMResponseCache.objects.filter(pk__in=stale).delete()[0]
+
+    if removed:
+        counters.incr("evictions", removed)
+    return removed
+
+
+def stats():
+    with counters.lock:
+        hits, misses = dict(counters.hits), dict(counters.misses)
+        snapshot = {
+            "tokens_saved": counters.tokens_saved,
+            "stores": counters.stores,
+            "evictions": counters.evictions,
+        }
+    for tier in (PROMPT, VARIANT):
+        lookups = hits[tier] + misses[tier]
+        snapshot[tier] = {
+            "hits": hits[tier],
+            "misses": misses[tier],
+            "hit_rate": round(hits[tier] / lookups, 4) if lookups else None,
+        }
+    total = sum(hits.values()) + sum(misses.values())
+    snapshot["hit_rate"] = round(sum(hits.values()) / total, 4) if total else None
+    snapshot["entries"] = LLMResponseCache.objects.count()
+    lifetime = LLMResponseCache.objects.aggregate(hits=Sum("hit_count"), tokens=Sum(F("hit_count") * F("tokens")))
+    snapshot["lifetime_hits"] = lifetime["hits"] or 0
+    snapshot["lifetime_tokens_saved"] = lifetime["tokens"] or 0
+    snapshot["enabled"] = enabled()
+    return snapshot
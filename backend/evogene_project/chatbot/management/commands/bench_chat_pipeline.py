@@ -0,0 +1,276 @@
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from chatbot import pipeline, pipeline_async, resilience, result_store, scoring
+
+STUB_VARIANT = {"chromosome": "chr12", "variant_position": 43119628, "alternative": "A", "genome": "hg38"}
+STUB_EVO2 = {"reference": "G", "alternative": "A", "delta_score": -0.0021, "prediction": "Likely benign",
+             "classification_confidence": 0.87, "position": 43119628}
+
+
+def _serve_stubs(port_queue, gemini_latency, evo2_latency, faults):
+    """Local stand-ins for Gemini and Evo2 that answer after a fixed delay (runs in a child process).
+
+    A tiny keep-alive HTTP/1.1 server on asyncio, so the stubs themselves never limit concurrency.
+    `faults` injects errors into the stubs it targets: a share of 503s and a share of stalled responses.
+    """
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                path = lines[0].split(" ")[1]
+                headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+                length = int(headers.get("Content-Length", headers.get("content-length", 0)))
+                body = json.loads(await reader.readexactly(length) or b"{}")
+
+                if path.strip("/") in faults["targets"]:
+                    roll = random.random()
+                    if roll < faults["error_rate"]:
+                        writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                        await writer.drain()
+                        continue
+                    if roll < faults["error_rate"] + faults["slow_rate"]:
+                        await asyncio.sleep(faults["slow_seconds"])
+
+                if path == "/gemini":
+                    await asyncio.sleep(gemini_latency)
+                    is_extract = "variant extractor" in (body.get("messages") or [""])[0]
+                    content = json.dumps(STUB_VARIANT) if is_extract else "Stub summary: likely benign variant."
+                    payload = {"content": content}
+                else:
+                    await asyncio.sleep(evo2_latency)
+                    payload = STUB_EVO2
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=4096)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+class StubChatModel:
+    """Minimal invoke/ainvoke chat model talking to the local Gemini stub."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def invoke(self, messages):
+        r = requests.post(self.url, json={"messages": [m.content for m in messages]}, timeout=90)
+        r.raise_for_status()
+        return AIMessage(content=r.json()["content"])
+
+    async def ainvoke(self, messages):
+        data = await pipeline_async.post_json(self.url, {"messages": [m.content for m in messages]})
+        return AIMessage(content=data["content"])
+
+    def stream(self, messages):
+        yield from _word_chunks(self.invoke(messages).content)
+
+    async def astream(self, messages):
+        for chunk in _word_chunks((await self.ainvoke(messages)).content):
+            yield chunk
+
+
+def _word_chunks(text):
+    """Word-sized chunks, like a streaming LLM response."""
+    return [AIMessageChunk(content=word) for word in re.findall(r"\S+\s*", text)]
+
+
+class InProcessChatModel:
+    """Instant canned answers, for --offline runs with no network at all."""
+
+    def invoke(self, messages):
+        is_extract = "variant extractor" in messages[0].content
+        return AIMessage(content=json.dumps(STUB_VARIANT) if is_extract else "Stub summary: likely benign variant.")
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+    def stream(self, messages):
+        yield from _word_chunks(self.invoke(messages).content)
+
+    async def astream(self, messages):
+        for chunk in _word_chunks(self.invoke(messages).content):
+            yield chunk
+
+
+class Command(BaseCommand):
+    help = "Benchmark chat pipeline concurrency (thread-per-task, bounded pool, asyncio) against local stubs (or fully offline)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tasks", type=int, default=200)
+        parser.add_argument("--gemini-latency", type=float, default=0.2)
+        parser.add_argument("--evo2-latency", type=float, default=0.5)
+        parser.add_argument("--pool-workers", type=int, default=getattr(settings, "CHAT_WORKERS", 4))
+        parser.add_argument("--modes", default="threads,pool,asyncio")
+        parser.add_argument("--pre-parser", action="store_true", help="Keep the local variant parser on (skips extraction)")
+        parser.add_argument("--offline", action="store_true",
+                            help="No stub servers: in-process LLM stub + the local scoring backend (pipeline overhead only)")
+        # 💥 Fault injection, to exercise resilience.py (retries, hedging, breaker, deadlines)
+        parser.add_argument("--fault-target", default="evo2", help="Stubs to inject faults into: evo2, gemini or both")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub responses that are 503s")
+        parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of stub responses that stall")
+        parser.add_argument("--slow-seconds", type=float, default=5.0)
+        parser.add_argument("--sla", type=float, default=None, help="Per-task deadline (CHAT_TASK_SLA_SECONDS)")
+
+    def handle(self, *args, **options):
+        # No caches (and no pre-parser unless asked) so every task does all three steps
+        settings.EVO2_CACHE_ENABLED = False
+        settings.LLM_CACHE_ENABLED = False
+        settings.CHAT_PRE_PARSER_ENABLED = options["pre_parser"]
+        result_store.set_store(result_store.build_store("files", directory=tempfile.mkdtemp(prefix="bench_task_results_")))
+        if options["sla"]:
+            settings.CHAT_TASK_SLA_SECONDS = options["sla"]
+        n = options["tasks"]
+
+        server = None
+        if options["offline"]:
+            pipeline.llm = InProcessChatModel()
+            scoring.set_backend(scoring.LocalHeuristicScoringBackend())
+            self.stdout.write(f"{n} tasks, offline (in-process LLM stub, local scoring backend)")
+        else:
+            port_queue = multiprocessing.Queue()
+            targets = ("evo2", "gemini") if options["fault_target"] == "both" else (options["fault_target"],)
+            faults = {"targets": targets, "error_rate": options["error_rate"],
+                      "slow_rate": options["slow_rate"], "slow_seconds": options["slow_seconds"]}
+            server = multiprocessing.Process(
+                target=_serve_stubs, args=(port_queue, options["gemini_latency"], options["evo2_latency"], faults),
+                daemon=True,
+            )
+            server.start()
+            base = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+            # Point the pipeline at the stubs
+            pipeline.llm = StubChatModel(f"{base}/gemini")
+            scoring.set_backend(scoring.HttpScoringBackend(url=f"{base}/evo2"))
+            ideal = (1 if options["pre_parser"] else 2) * options["gemini_latency"] + options["evo2_latency"]
+            self.stdout.write(f"{n} tasks, ideal single-task latency {ideal:.2f}s, stubs at {base}")
+
+        runners = {
+            "threads": self._run_thread_per_task,
+            "pool": lambda n: self._run_pool(n, options["pool_workers"]),
+            "asyncio": self._run_asyncio,
+        }
+        try:
+            for mode in options["modes"].split(","):
+                resilience.reset()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    wall, latencies, peak_threads = self._measure(runners[mode], n)
+                ok = [t for t in latencies if t is not None]
+                lat = np.asarray(ok or [0.0])
+                self.stdout.write(
+                    f"{mode:>8}: {n / wall:8.1f} tasks/s | wall {wall:6.2f}s | "
+                    f"p50 {np.percentile(lat, 50):6.2f}s p95 {np.percentile(lat, 95):6.2f}s | "
+                    f"failed {n - len(ok)} | peak threads {peak_threads}"
+                )
+                for name, dep in resilience.stats().items():
+                    self.stdout.write(
+                        f"          {name}: {dep['calls']} calls, {dep['attempts']} attempts, {dep['retries']} retries, "
+                        f"{dep['timeouts']} timeouts, {dep['hedges']} hedges ({dep['hedge_wins']} won), "
+                        f"{dep['short_circuited']} short-circuited, breaker {dep['breaker']} "
+                        f"(opened {dep['breaker_opened']}x)"
+                    )
+        finally:
+            if server is not None:
+                server.terminate()
+
+    def _measure(self, runner, n):
+        peak = [threading.active_count()]
+        done = threading.Event()
+
+        def sample():
+            while not done.is_set():
+                peak[0] = max(peak[0], threading.active_count())
+                time.sleep(0.01)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        latencies = runner(n)
+        wall = time.perf_counter() - started
+        done.set()
+        sampler.join()
+        return wall, latencies, peak[0] - 1  # minus the sampler itself
+
+    @staticmethod
+    def _timed(fn, task_id):
+        """Latency of one task, or None if it failed."""
+        t0 = time.perf_counter()
+        try:
+            fn(task_id, "Analyze chr12:43119628 G>A on hg38")
+        except Exception:
+            return None
+        return time.perf_counter() - t0
+
+    def _run_thread_per_task(self, n):
+        """Pre-pool behaviour: one daemon thread per request."""
+        latencies = [None] * n
+
+        def work(i):
+            latencies[i] = self._timed(pipeline.run_analysis, str(uuid.uuid4()))
+
+        threads = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies
+
+    def _run_pool(self, n, workers):
+        """Bounded pool of CHAT_WORKERS threads (queue wait counts towards latency)."""
+        submitted = time.perf_counter()
+
+        def work(i):
+            try:
+                pipeline.run_analysis(str(uuid.uuid4()), "Analyze chr12:43119628 G>A on hg38")
+            except Exception:
+                return None
+            return time.perf_counter() - submitted
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(work, range(n)))
+
+    def _run_asyncio(self, n):
+        async def main():
+            async def one(i):
+                t0 = time.perf_counter()
+                try:
+                    with resilience.task_deadline():
+                        await pipeline_async.run_analysis_async(str(uuid.uuid4()), "Analyze chr12:43119628 G>A on hg38")
+                except Exception:
+                    return None
+                return time.perf_counter() - t0
+
+            return await asyncio.gather(*(one(i) for i in range(n)))
+
+        return asyncio.run(main())
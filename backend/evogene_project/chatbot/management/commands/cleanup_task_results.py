@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from chatbot import result_store
+
+
+class Command(BaseCommand):
+    help = "Delete task results older than CHAT_RESULT_TTL_SECONDS from the configured result store."
+
+    def handle(self, *args, **options):
+        store = result_store.get_store()
+        removed = store.cleanup()
+        self.stdout.write(f"🧹 Removed {removed} expired result(s); {store.count()} left in the {store.name} store")
@@ -0,0 +1,60 @@
+import json
+import os
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatbot import result_store
+
+
+class Command(BaseCommand):
+    help = "Copy legacy chatbot/task_results/<task_id>.json files into the configured result store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=getattr(settings, "CHAT_RESULTS_DIR", result_store.DEFAULT_RESULTS_DIR))
+        parser.add_argument("--store", default=None, help="database / sqlite (default: CHAT_RESULT_STORE)")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--delete", action="store_true", help="Remove each JSON file once it is imported")
+
+    def handle(self, *args, **options):
+        directory = options["dir"]
+        store = result_store.build_store(options["store"]) if options["store"] else result_store.get_store()
+        if store.name == "files":
+            self.stderr.write("The configured store is the file store already; pass --store database or sqlite.")
+            return
+
+        imported = skipped = 0
+        batch, paths = [], []
+
+        def flush():
+            nonlocal imported
+            store.save_many(batch, batch_size=options["batch_size"])
+            imported += len(batch)
+            if options["delete"]:
+                for path in paths:
+                    os.remove(path)
+            batch.clear()
+            paths.clear()
+
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    task_id = str(uuid.UUID(entry.name[:-5]))
+                    with open(entry.path) as f:
+                        data = json.load(f)
+                except (ValueError, OSError) as e:  # not a task id / unreadable / invalid JSON
+                    self.stderr.write(f"⚠️ Skipping {entry.name}: {e}")
+                    skipped += 1
+                    continue
+                owner = data.pop(result_store.FileResultStore.OWNER_KEY, None) if isinstance(data, dict) else None
+                batch.append((task_id, data, owner))
+                paths.append(entry.path)
+                if len(batch) >= options["batch_size"]:
+                    flush()
+        if batch:
+            flush()
+
+        self.stdout.write(f"✅ Imported {imported} result(s) into the {store.name} store ({skipped} skipped)")
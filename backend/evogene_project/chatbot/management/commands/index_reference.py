@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.reference import FastaReference, write_fai
+
+
+class Command(BaseCommand):
+    help = "Build the .fai index for a reference FASTA (REFERENCE_FASTA_HG38 / _HG19) and check a lookup."
+
+    def add_arguments(self, parser):
+        parser.add_argument("fasta")
+        parser.add_argument("--check", default=None, help="Print the base at e.g. chr12:43119628 after indexing")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        fai_path = write_fai(options["fasta"])
+        reference = FastaReference(options["fasta"], fai_path)
+        self.stdout.write(
+            f"✅ Indexed {len(reference.index)} sequences into {fai_path} in {time.perf_counter() - started:.1f}s"
+        )
+        if options["check"]:
+            chromosome, position = options["check"].rsplit(":", 1)
+            self.stdout.write(f"{options['check']} = {reference.base(chromosome, int(position))}")
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of genome:chromosome:position:alternative', max_length=64, unique=True)),
+                ('chromosome', models.CharField(max_length=16)),
+                ('variant_position', models.BigIntegerField()),
+                ('alternative', models.CharField(max_length=16)),
+                ('genome', models.CharField(max_length=8)),
+                ('result', models.JSONField(help_text='Raw Evo2 response')),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
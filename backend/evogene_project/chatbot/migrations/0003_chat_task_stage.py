@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_chat_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chattask',
+            name='stage',
+            field=models.CharField(choices=[('queued', 'Queued'), ('extracting', 'Extracting variant'), ('scoring', 'Scoring with Evo2'), ('summarizing', 'Summarizing'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_task_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chattask',
+            name='variants',
+            field=models.JSONField(blank=True, help_text='Batch tasks: pre-parsed variants ([] = extract from prompt)', null=True),
+        ),
+    ]
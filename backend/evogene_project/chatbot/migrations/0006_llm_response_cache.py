@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_chat_task_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMResponseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of tier, model and normalized input', max_length=64, unique=True)),
+                ('tier', models.CharField(choices=[('prompt', 'Exact normalized prompt'), ('variant', 'Extracted variant(s) + Evo2 result')], max_length=16)),
+                ('model', models.CharField(max_length=64)),
+                ('response', models.TextField()),
+                ('tokens', models.PositiveIntegerField(default=0, help_text='Prompt + completion tokens one call cost')),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_llm_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chattask',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Lease renewed by the running worker; stale = worker died', null=True),
+        ),
+    ]
@@ -1,3 +1,105 @@
+from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+User = get_user_model()
+
+
+class VariantResultCache(models.Model):
+    """Evo2 scoring result for one normalized variant (see chatbot/variant_cache.py)."""
+    key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of genome:chromosome:position:alternative")
+    chromosome = models.CharField(max_length=16)
+    variant_position = models.BigIntegerField()
+    alternative = models.CharField(max_length=16)
+    genome = models.CharField(max_length=8)
+    result = models.JSONField(help_text="Raw Evo2 response")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"VariantResultCache - {self.genome} {self.chromosome}:{self.variant_position} {self.alternative}"
+
+
+class ChatTask(models.Model):
+    """A queued variant analysis; the table doubles as the persistent work queue (see chatbot/tasks.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+    # Fine-grained progress pushed to /api/status/<id>/stream/ (see chatbot/progress.py)
+    EXTRACTING = 'extracting'
+    SCORING = 'scoring'
+    SUMMARIZING = 'summarizing'
+    STAGE_CHOICES = [
+        (QUEUED, 'Queued'),
+        (EXTRACTING, 'Extracting variant'),
+        (SCORING, 'Scoring with Evo2'),
+        (SUMMARIZING, 'Summarizing'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    task_id = models.UUIDField(unique=True)
+    prompt = models.TextField()
+    variants = models.JSONField(null=True, blank=True, help_text="Batch tasks: pre-parsed variants ([] = extract from prompt)")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    stage = models.CharField(max_length=16, choices=STAGE_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    worker = models.CharField(max_length=100, null=True, blank=True, help_text="host:pid of the claiming worker")
+    created_at = models.DateTimeField(default=timezone.now)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Lease renewed by the running worker; stale = worker died")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"ChatTask - {self.task_id} ({self.status}, attempt {self.attempts})"
+
+
+class TaskResult(models.Model):
+    """Stored output of a chat analysis (see chatbot/result_store.py)."""
+    task_id = models.UUIDField(unique=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='chat_results', null=True, blank=True)
+    status = models.CharField(max_length=16, db_index=True, help_text="processing / completed / error")
+    data = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', '-updated_at'], name='chat_result_user_status'),
+            models.Index(fields=['status', '-updated_at'], name='chat_result_status'),
+        ]
+
+    def __str__(self):
+        return f"TaskResult - {self.task_id} ({self.status})"
+
+
+class LLMResponseCache(models.Model):
+    """Cached Gemini output (see chatbot/llm_cache.py)."""
+    PROMPT, VARIANT = "prompt", "variant"
+    TIER_CHOICES = [
+        (PROMPT, "Exact normalized prompt"),
+        (VARIANT, "Extracted variant(s) + Evo2 result"),
+    ]
+
+    key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of tier, model and normalized input")
+    tier = models.CharField(max_length=16, choices=TIER_CHOICES)
+    model = models.CharField(max_length=64)
+    response = models.TextField()
+    tokens = models.PositiveIntegerField(default=0, help_text="Prompt + completion tokens one call cost")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"LLMResponseCache - {self.tier} {self.key[:12]} ({self.hit_count} hits)"
@@ -0,0 +1,377 @@
+# chatbot/pipeline.py
+import json
+import re
+import time
+from django.conf import settings
+from pydantic import ValidationError
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.messages import HumanMessage, SystemMessage
+from dotenv import load_dotenv
+from .schema import VariantInputSchema
+from . import llm_cache, progress, reference, resilience, result_store, scoring, variant_cache, variant_parser
+from .models import ChatTask
+from .tasks import TaskPool
+
+load_dotenv()
+
+# 🧠 Gemini LLM (retries and per-stage timeouts are handled by resilience.py, not the client)
+llm = ChatGoogleGenerativeAI(
+    model="models/gemini-2.0-flash", temperature=0.2, max_retries=0,
+    timeout=getattr(settings, "CHAT_DEPENDENCY_TIMEOUTS", {}).get("gemini", 30),
+)
+
+
+def ask_llm(messages, stage):
+    """One Gemini call within the task's stage budget, with jittered retries and the circuit breaker."""
+    return resilience.call("gemini", lambda timeout: llm.invoke(messages), stage)
+
+
+def model_name():
+    """Part of every LLM cache key, so switching models never serves the old model's answers."""
+    return str(getattr(llm, "model", None) or type(llm).__name__)
+
+
+# 🗂️ Persistent task results (backend chosen by CHAT_RESULT_STORE, see result_store.py)
+def save_result(task_id, data, user_id=None):
+    """Save (upsert) a task's result."""
+    result_store.get_store().save(task_id, data, user_id=user_id)
+
+
+def load_result(task_id):
+    """Load a task's result if it exists."""
+    return result_store.get_store().load(task_id)
+
+
+# 🧩 Prompt building / parsing shared by the threaded and asyncio pipelines
+def extraction_messages(user_prompt):
+    system_extract = SystemMessage(content=(
+        "You are a DNA variant extractor. Extract variant details as JSON "
+        "with keys: chromosome, variant_position, alternative, genome. "
+        "Output valid JSON only, no explanations."
+    ))
+    return [system_extract, HumanMessage(content=user_prompt)]
+
+
+def parse_extraction(raw_output):
+    """Gemini output -> normalized VariantInputSchema (raises ValueError if there is no usable variant)."""
+    # Try parsing Gemini output as JSON
+    try:
+        extracted = json.loads(raw_output)
+    except json.JSONDecodeError:
+        match = re.search(r"\{.*\}", raw_output, re.DOTALL)
+        extracted = json.loads(match.group(0)) if match else {}
+
+    # Validate via schema ('12' / 'chr12' etc. normalized to one spelling)
+    return variant_cache.normalize_variant(VariantInputSchema(**extracted))
+
+
+def summary_messages(payload, evo_result):
+    summary_prompt = f"""
+    Write a clear, short medical summary for this variant analysis.
+    Include chromosome, variant, classification, and interpretation.
+    Variant Data: {json.dumps(payload)}
+    Evo2 Result: {json.dumps(evo_result)}
+    """
+    return [
+        SystemMessage(content="You are a medical report generator. Respond with one coherent paragraph."),
+        HumanMessage(content=summary_prompt),
+    ]
+
+
+def chunk_text(chunk):
+    """Text of one streamed message chunk (some providers stream a list of content blocks)."""
+    content = chunk.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+def summary_cache_key(pairs, batch=False):
+    """LLM cache key for a summary of [(variant, evo2 result), ...]: the wording of the user's question
+    doesn't matter, only what was extracted and scored (and the prompt template)."""
+    template = batch_summary_messages([]) if batch else summary_messages({}, {})
+    return llm_cache.variant_key(template, pairs, model_name())
+
+
+def stream_summary(task_id, messages, partial, cache_key=None):
+    """Write the summary token by token: every chunk goes to progress (the SSE stream), and the partial
+    result is re-saved at most every CHAT_SUMMARY_FLUSH_SECONDS for status readers in other processes.
+    A summary already in the LLM cache is published in one go."""
+    if cache_key:
+        cached = llm_cache.get(cache_key, llm_cache.VARIANT)
+        if cached is not None:
+            print("♻️ LLM cache hit for the summary")
+            progress.publish_text(task_id, cached)
+            return cached
+
+    interval = getattr(settings, "CHAT_SUMMARY_FLUSH_SECONDS", 0.5)
+    text, flushed, usage = "", time.monotonic(), None
+    for chunk in resilience.stream("gemini", lambda timeout: llm.stream(messages), "summarize"):
+        text += chunk_text(chunk)
+        usage = getattr(chunk, "usage_metadata", None) or usage
+        progress.publish_text(task_id, text)
+        if time.monotonic() - flushed >= interval:
+            save_result(task_id, {**partial, "summary": text})
+            flushed = time.monotonic()
+    text = text.strip()
+    if cache_key:
+        llm_cache.put(cache_key, llm_cache.VARIANT, model_name(), text, llm_cache.estimate_tokens(messages, text, usage))
+    return text
+
+
+def extract_variant(user_prompt):
+    """Well-formed notations are parsed locally; only new free text costs a Gemini round trip."""
+    variant = variant_parser.parse(user_prompt)
+    if variant is not None:
+        print(f"⚡ Parsed variant locally, skipped LLM extraction: {variant.model_dump()}")
+        return variant
+
+    messages = extraction_messages(user_prompt)
+    key = llm_cache.prompt_key(messages, model_name())
+    raw_output = llm_cache.get(key, llm_cache.PROMPT)
+    if raw_output is not None:
+        print(f"♻️ LLM cache hit for the extraction: {raw_output}")
+        return parse_extraction(raw_output)
+
+    started = time.perf_counter()
+    response = ask_llm(messages, "extract")
+    variant_parser.record_llm_extraction(time.perf_counter() - started)
+    raw_output = response.content.strip()
+    print(f"🧬 Gemini Raw Output: {raw_output}")
+    variant = parse_extraction(raw_output)
+    # Only answers that parsed are cached, so a bad one is retried next time
+    llm_cache.put(key, llm_cache.PROMPT, model_name(), raw_output,
+                  llm_cache.estimate_tokens(messages, raw_output, getattr(response, "usage_metadata", None)))
+    return variant
+
+
+# 🧩 Background Worker Function
+@resilience.task_deadline()
+def run_analysis(task_id, user_prompt):
+    """Extract -> Evo2 -> summary. Raises on failure so the task pool can retry."""
+    print(f"🚀 Started background task {task_id}")
+    # STEP 1️⃣ - Extract structured variant data
+    progress.publish(task_id, ChatTask.EXTRACTING)
+    extracted_variant = extract_variant(user_prompt)
+    payload = extracted_variant.model_dump()
+    print(f"✅ Extracted Variant JSON: {payload}")
+
+    # Check REF / position against the local reference genome (ValueError = not retried, no Evo2 call)
+    reference_context = reference.validate(extracted_variant)
+
+    # STEP 2️⃣ - Score with the configured backend (skipped when this variant was scored recently)
+    progress.publish(task_id, ChatTask.SCORING)
+    backend = scoring.get_backend()
+    evo_result = variant_cache.get(extracted_variant) if backend.cacheable else None
+    evo_cached = evo_result is not None
+    if evo_cached:
+        print(f"♻️ Evo2 cache hit for {payload}")
+    else:
+        print(f"📤 Scoring with the {backend.name} backend: {payload}")
+        evo_result = backend.score(extracted_variant, reference_context)
+        print(f"✅ Evo2 API Response: {evo_result}")
+        if backend.cacheable:
+            variant_cache.put(extracted_variant, evo_result)
+
+    # 📤 The variant and its score are useful on their own: publish them before the summary exists
+    partial = {
+        "status": "processing",
+        "variant_data": payload,
+        "evo2_result": evo_result,
+        "evo2_cached": evo_cached,
+        "reference_context": reference_context,
+        "summary": "",
+    }
+    save_result(task_id, partial)
+
+    # STEP 3️⃣ - Stream a human summary
+    progress.publish(task_id, ChatTask.SUMMARIZING)
+    summary_text = stream_summary(
+        task_id, summary_messages(payload, evo_result), partial, summary_cache_key([(payload, evo_result)])
+    )
+
+    # ✅ Store final result persistently
+    save_result(task_id, {**partial, "status": "completed", "summary": summary_text})
+    progress.publish(task_id, ChatTask.COMPLETED)
+
+    print(f"✅ Task {task_id} completed successfully.")
+
+
+def record_failure(task_id, error):
+    """Final failure (no retries left): persist the error for the status endpoint."""
+    print(f"❌ Task {task_id} failed: {error}")
+    save_result(task_id, {"status": "error", "error": str(error)})
+    progress.publish(task_id, ChatTask.FAILED)
+
+
+# 🧩 Batch mode: N variants (pasted panel / VCF upload) -> concurrent Evo2 calls -> ONE summary
+def batch_extraction_messages(user_prompt):
+    system_extract = SystemMessage(content=(
+        "You are a DNA variant extractor. Extract EVERY variant mentioned as a JSON array of objects "
+        "with keys: chromosome, variant_position, alternative, genome. "
+        "Output valid JSON only, no explanations."
+    ))
+    return [system_extract, HumanMessage(content=user_prompt)]
+
+
+def extract_variants(user_prompt):
+    """All variants in a free-text prompt: local parse first, one Gemini call otherwise."""
+    variants = variant_parser.parse_all(user_prompt)
+    if variants:
+        print(f"⚡ Parsed {len(variants)} variants locally, skipped LLM extraction")
+        return variants
+
+    messages = batch_extraction_messages(user_prompt)
+    key = llm_cache.prompt_key(messages, model_name())
+    raw_output = llm_cache.get(key, llm_cache.PROMPT)
+    if raw_output is not None:
+        return parse_batch_extraction(raw_output)
+
+    started = time.perf_counter()
+    response = ask_llm(messages, "extract")
+    variant_parser.record_llm_extraction(time.perf_counter() - started)
+    raw_output = response.content.strip()
+    variants = parse_batch_extraction(raw_output)
+    llm_cache.put(key, llm_cache.PROMPT, model_name(), raw_output,
+                  llm_cache.estimate_tokens(messages, raw_output, getattr(response, "usage_metadata", None)))
+    return variants
+
+
+def parse_batch_extraction(raw_output):
+    """Gemini's JSON array -> normalized VariantInputSchemas (unreadable items skipped; ValueError if none)."""
+    try:
+        items = json.loads(raw_output)
+    except json.JSONDecodeError:
+        match = re.search(r"\[.*\]", raw_output, re.DOTALL)
+        items = json.loads(match.group(0)) if match else []
+
+    variants = []
+    for item in items if isinstance(items, list) else [items]:
+        try:
+            variants.append(variant_cache.normalize_variant(VariantInputSchema(**item)))
+        except (TypeError, ValidationError) as e:
+            print(f"⚠️ Skipping unreadable variant {item}: {e}")
+    if not variants:
+        raise ValueError("No variants found in the prompt")
+    return variants
+
+
+def score_variants(variants, contexts=None):
+    """[(evo2_result or None, cached, error or None)] in input order.
+
+    Cache hits are served from the DB; misses go to the scoring backend in one score_many() call
+    (concurrent / batched requests for the HTTP backend).
+    """
+    backend = scoring.get_backend()
+    contexts = contexts or [None] * len(variants)
+    rows = [None] * len(variants)
+    misses = []
+    for i, variant in enumerate(variants):
+        cached = variant_cache.get(variant) if backend.cacheable else None
+        if cached is not None:
+            rows[i] = (cached, True, None)
+        else:
+            misses.append(i)
+    if not misses:
+        return rows
+
+    scored = backend.score_many([variants[i] for i in misses], [contexts[i] for i in misses])
+    for i, (result, error) in zip(misses, scored):
+        rows[i] = (result, False, error)
+        # Cache writes stay on this thread (Django DB connections are per thread)
+        if result is not None and backend.cacheable:
+            variant_cache.put(variants[i], result)
+    return rows
+
+
+def batch_summary_messages(entries):
+    summary_prompt = f"""
+    Write a short medical summary for this panel of {len(entries)} variant analyses.
+    Start with an overview (how many look pathogenic / benign / uncertain), then one line per
+    notable variant with chromosome, position, classification and interpretation.
+    Variants and Evo2 results: {json.dumps(entries)}
+    """
+    return [
+        SystemMessage(content="You are a medical report generator. Be concise and group similar findings."),
+        HumanMessage(content=summary_prompt),
+    ]
+
+
+@resilience.task_deadline(getattr(settings, "CHAT_BATCH_SLA_SECONDS", 300))
+def run_batch_analysis(task_id, user_prompt, variants):
+    """Batch counterpart of run_analysis; `variants` are pre-parsed dicts, or [] to extract from the prompt."""
+    print(f"🚀 Started batch task {task_id}")
+    progress.publish(task_id, ChatTask.EXTRACTING)
+    if variants:
+        variants = [VariantInputSchema(**v) for v in variants]
+    else:
+        variants = extract_variants(user_prompt)
+    max_variants = getattr(settings, "CHAT_BATCH_MAX_VARIANTS", 200)
+    if len(variants) > max_variants:
+        raise ValueError(f"Too many variants ({len(variants)}), the limit is {max_variants}")
+
+    # Variants that fail the reference check get an error entry and are never sent to Evo2
+    contexts, rejected = [], {}
+    for i, v in enumerate(variants):
+        try:
+            contexts.append(reference.validate(v))
+        except ValueError as e:
+            contexts.append(None)
+            rejected[i] = str(e)
+    valid = [v for i, v in enumerate(variants) if i not in rejected]
+    valid_contexts = [c for i, c in enumerate(contexts) if i not in rejected]
+
+    progress.publish(task_id, ChatTask.SCORING)
+    started = time.perf_counter()
+    scored_rows = iter(score_variants(valid, valid_contexts))
+    rows = [(None, False, rejected[i]) if i in rejected else next(scored_rows) for i in range(len(variants))]
+    entries = [
+        {"variant_data": v.model_dump(), "evo2_result": result, "evo2_cached": cached,
+         "reference_context": context, "error": error}
+        for v, context, (result, cached, error) in zip(variants, contexts, rows)
+    ]
+    failed = sum(1 for entry in entries if entry["error"])
+    print(f"🧬 Scored {len(entries)} variants in {time.perf_counter() - started:.2f}s ({failed} failed)")
+    if len(rejected) == len(entries):
+        raise ValueError(f"No valid variants: {entries[0]['error']}")
+    if failed == len(entries):
+        raise RuntimeError(f"Evo2 failed for every variant: {entries[0]['error']}")
+
+    partial = {
+        "status": "processing",
+        "mode": "batch",
+        "variant_count": len(entries),
+        "failed": failed,
+        "variants": entries,
+        "summary": "",
+    }
+    save_result(task_id, partial)
+
+    # STEP 3️⃣ - One summary for the whole panel instead of one LLM call per variant
+    progress.publish(task_id, ChatTask.SUMMARIZING)
+    scored = [{"variant": e["variant_data"], "evo2": e["evo2_result"]} for e in entries if not e["error"]]
+    cache_key = summary_cache_key([(e["variant"], e["evo2"]) for e in scored], batch=True)
+    summary_text = stream_summary(task_id, batch_summary_messages(scored), partial, cache_key)
+
+    save_result(task_id, {**partial, "status": "completed", "summary": summary_text})
+    progress.publish(task_id, ChatTask.COMPLETED)
+    print(f"✅ Batch task {task_id} completed ({len(entries)} variants).")
+
+
+def run_task(task_id, user_prompt, variants=None):
+    """Task pool handler: batch tasks carry a `variants` list (possibly empty), single ones don't."""
+    if variants is None:
+        run_analysis(task_id, user_prompt)
+    else:
+        run_batch_analysis(task_id, user_prompt, variants)
+
+
+def background_analysis_task(task_id, user_prompt):
+    try:
+        run_analysis(task_id, user_prompt)
+    except Exception as e:
+        record_failure(task_id, e)
+
+
+# 🧵 Bounded worker pool with a persistent (DB) queue
+pool = TaskPool(handler=run_task, on_failure=record_failure)
@@ -0,0 +1,179 @@
+# chatbot/pipeline_async.py
+"""
+asyncio version of the variant analysis chain, served through asgi.py.
+
+All three network stages are awaited on the event loop — `llm.ainvoke` for
+Gemini and shared keep-alive `httpx.AsyncClient` pools for Evo2 (via the
+scoring backend's `ascore`) — so a single
+process keeps hundreds of analyses in flight without an OS thread each.
+Prompt building / parsing is shared with the threaded pipeline.
+"""
+import asyncio
+import itertools
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import llm_cache, pipeline, progress, reference, resilience, scoring, variant_cache, variant_parser
+from .models import ChatTask
+
+_shards = []
+_shards_loop = None
+_next_shard = itertools.count()
+_tasks = set()
+
+SHARD_CONNECTIONS = 8
+
+
+def _get_shards():
+    """Per-loop keep-alive pools, each guarded by a semaphore of its own size.
+
+    httpcore rescans every waiting request against every pooled connection on
+    each response, so one big pool costs O(connections²) CPU per request. Several
+    small pools with CHAT_ASYNC_MAX_CONNECTIONS spread across them keep that flat.
+    """
+    global _shards, _shards_loop
+    loop = asyncio.get_running_loop()
+    if _shards_loop is not loop or not _shards or _shards[0][0].is_closed:
+        total = getattr(settings, "CHAT_ASYNC_MAX_CONNECTIONS", 256)
+        size = min(SHARD_CONNECTIONS, total)
+        limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+        timeout = httpx.Timeout(90.0, connect=10.0)
+        _shards = [
+            (httpx.AsyncClient(limits=limits, timeout=timeout), asyncio.Semaphore(size))
+            for _ in range(max(1, -(-total // size)))
+        ]
+        _shards_loop = loop
+    return _shards
+
+
+async def post_json(url, payload, timeout=None):
+    """POST through the shared connection pools and return the decoded JSON body."""
+    shards = _get_shards()
+    client, slots = shards[next(_next_shard) % len(shards)]
+    async with slots:
+        response = await client.post(url, json=payload, timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+    response.raise_for_status()
+    return response.json()
+
+
+async def ask_llm_async(messages, stage):
+    """pipeline.ask_llm on the event loop: a losing hedge or an overrun attempt is cancelled."""
+    return await resilience.acall("gemini", lambda timeout: pipeline.llm.ainvoke(messages), stage)
+
+
+async def stream_summary_async(task_id, messages, partial, cache_key=None):
+    """pipeline.stream_summary on the event loop."""
+    if cache_key:
+        cached = await sync_to_async(llm_cache.get)(cache_key, llm_cache.VARIANT)
+        if cached is not None:
+            progress.publish_text(task_id, cached)
+            return cached
+
+    interval = getattr(settings, "CHAT_SUMMARY_FLUSH_SECONDS", 0.5)
+    text, flushed, usage = "", time.monotonic(), None
+    async for chunk in resilience.astream("gemini", lambda timeout: pipeline.llm.astream(messages), "summarize"):
+        text += pipeline.chunk_text(chunk)
+        usage = getattr(chunk, "usage_metadata", None) or usage
+        progress.publish_text(task_id, text)
+        if time.monotonic() - flushed >= interval:
+            await asyncio.to_thread(pipeline.save_result, task_id, {**partial, "summary": text})
+            flushed = time.monotonic()
+    text = text.strip()
+    if cache_key:
+        await sync_to_async(llm_cache.put)(
+            cache_key, llm_cache.VARIANT, pipeline.model_name(), text, llm_cache.estimate_tokens(messages, text, usage)
+        )
+    return text
+
+
+async def extract_variant_async(user_prompt):
+    """pipeline.extract_variant on the event loop (local parse, then the LLM cache, then Gemini)."""
+    variant = variant_parser.parse(user_prompt)
+    if variant is not None:
+        return variant
+
+    messages = pipeline.extraction_messages(user_prompt)
+    key = llm_cache.prompt_key(messages, pipeline.model_name())
+    raw_output = await sync_to_async(llm_cache.get)(key, llm_cache.PROMPT)
+    if raw_output is not None:
+        return pipeline.parse_extraction(raw_output)
+
+    started = time.perf_counter()
+    response = await ask_llm_async(messages, "extract")
+    variant_parser.record_llm_extraction(time.perf_counter() - started)
+    raw_output = response.content.strip()
+    variant = pipeline.parse_extraction(raw_output)
+    tokens = llm_cache.estimate_tokens(messages, raw_output, getattr(response, "usage_metadata", None))
+    await sync_to_async(llm_cache.put)(key, llm_cache.PROMPT, pipeline.model_name(), raw_output, tokens)
+    return variant
+
+
+async def run_analysis_async(task_id, user_prompt):
+    """Extract -> Evo2 -> summary without blocking the event loop. Raises on failure."""
+    print(f"🚀 Started async task {task_id}")
+
+    # STEP 1️⃣ - Extract structured variant data (stages are memory-only: no ChatTask row here)
+    progress.publish(task_id, ChatTask.EXTRACTING, persist=False)
+    extracted_variant = await extract_variant_async(user_prompt)
+    payload = extracted_variant.model_dump()
+    # The first lookup may open (or index) the FASTA: keep that off the event loop
+    reference_context = await asyncio.to_thread(reference.validate, extracted_variant)
+
+    # STEP 2️⃣ - Call Evo2 Model (skipped when this variant was scored recently)
+    progress.publish(task_id, ChatTask.SCORING, persist=False)
+    backend = scoring.get_backend()
+    evo_result = await sync_to_async(variant_cache.get)(extracted_variant) if backend.cacheable else None
+    evo_cached = evo_result is not None
+    if not evo_cached:
+        evo_result = await backend.ascore(extracted_variant, reference_context)
+        if backend.cacheable:
+            await sync_to_async(variant_cache.put)(extracted_variant, evo_result)
+
+    # 📤 Publish the variant and its score before the summary exists
+    partial = {
+        "status": "processing",
+        "variant_data": payload,
+        "evo2_result": evo_result,
+        "evo2_cached": evo_cached,
+        "reference_context": reference_context,
+        "summary": "",
+    }
+    await asyncio.to_thread(pipeline.save_result, task_id, partial)
+
+    # STEP 3️⃣ - Stream a human summary
+    progress.publish(task_id, ChatTask.SUMMARIZING, persist=False)
+    summary_text = await stream_summary_async(
+        task_id, pipeline.summary_messages(payload, evo_result), partial,
+        pipeline.summary_cache_key([(payload, evo_result)]),
+    )
+
+    # ✅ Store final result persistently
+    await asyncio.to_thread(pipeline.save_result, task_id, {**partial, "status": "completed", "summary": summary_text})
+    progress.publish(task_id, ChatTask.COMPLETED, persist=False)
+    print(f"✅ Task {task_id} completed successfully.")
+
+
+async def _run_and_record(task_id, user_prompt):
+    try:
+        with resilience.task_deadline():
+            await run_analysis_async(task_id, user_prompt)
+    except Exception as e:
+        await asyncio.to_thread(pipeline.record_failure, task_id, e)
+
+
+def in_flight():
+    return len(_tasks)
+
+
+def submit(task_id, user_prompt):
+    """Schedule an analysis on the running loop; returns False when CHAT_ASYNC_MAX_IN_FLIGHT is reached."""
+    if len(_tasks) >= getattr(settings, "CHAT_ASYNC_MAX_IN_FLIGHT", 500):
+        return False
+    progress.publish(task_id, ChatTask.QUEUED, persist=False)
+    task = asyncio.get_running_loop().create_task(_run_and_record(task_id, user_prompt))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return True
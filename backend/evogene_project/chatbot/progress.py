@@ -0,0 +1,166 @@
+# chatbot/progress.py
+"""
+Stage tracking for chat analyses, so status can be pushed instead of polled.
+
+`publish()` records queued -> extracting -> scoring -> summarizing ->
+completed/failed in memory (waking any waiter in this process at once) and
+on the ChatTask row (so waiters in other web workers see it on their next
+CHAT_STATUS_POLL_SECONDS check). `wait_for_change()` blocks until the stage
+differs from what the client already has, which backs the ETag long-poll.
+
+While the summary is being written, `publish_text()` keeps the text so far in
+memory (other processes read the partial result the worker flushes to the
+result store); `wait_for_update()` also wakes on new text, for the SSE stream.
+`await_update()` is the same wait for the ASGI stream, on the event loop: a
+publish in this process wakes it through its loop (call_soon_threadsafe), so
+summary tokens from the asyncio pipeline reach the stream chunk by chunk.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import ChatTask
+
+TERMINAL_STAGES = (ChatTask.COMPLETED, ChatTask.FAILED)
+_MAX_TRACKED = 10000
+
+_cond = threading.Condition()
+_stages = OrderedDict()  # task_id -> (publish count, stage), most recently published last
+_texts = OrderedDict()  # task_id -> summary text streamed so far
+_async_waiters = {}  # task_id -> {(event loop, asyncio.Event)} of await_update() calls
+
+
+def publish(task_id, stage, persist=True):
+    """Record a stage transition; persist=False skips the ChatTask row (asyncio tasks have none)."""
+    task_id = str(task_id)
+    if persist:
+        ChatTask.objects.filter(task_id=task_id).update(stage=stage)
+    with _cond:
+        _bump(task_id, stage)
+        if stage in TERMINAL_STAGES:
+            _texts.pop(task_id, None)  # the stored result has the full summary now
+
+
+def publish_text(task_id, text):
+    """Record the summary written so far (memory only) and wake this process's waiters."""
+    task_id = str(task_id)
+    with _cond:
+        _texts[task_id] = text
+        _texts.move_to_end(task_id)
+        while len(_texts) > _MAX_TRACKED:
+            _texts.popitem(last=False)
+        _bump(task_id, _stages.get(task_id, (0, None))[1])
+
+
+def _bump(task_id, stage):
+    # caller holds _cond
+    count = _stages.pop(task_id, (0, None))[0] + 1
+    _stages[task_id] = (count, stage)
+    while len(_stages) > _MAX_TRACKED:
+        _stages.popitem(last=False)
+    _cond.notify_all()
+    for loop, event in _async_waiters.get(task_id, ()):
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+
+def _published(task_id):
+    with _cond:
+        return _stages.get(task_id, (0, None))
+
+
+def current(task_id, load_result=None):
+    """Latest known stage, or None if the task is unknown. Falls back to the stored result
+    (via `load_result`) for tasks that never had a ChatTask row (asyncio pipeline)."""
+    task_id = str(task_id)
+    stage = ChatTask.objects.filter(task_id=task_id).values_list("stage", flat=True).first()
+    if stage is None:
+        stage = _published(task_id)[1]
+    if stage is None and load_result is not None:
+        result = load_result(task_id)
+        status = (result or {}).get("status")
+        if status == "completed":
+            stage = ChatTask.COMPLETED
+        elif status == "error":
+            stage = ChatTask.FAILED
+    return stage
+
+
+def text(task_id, load_result=None):
+    """Summary text streamed so far ("" before the summary stage)."""
+    task_id = str(task_id)
+    with _cond:
+        streamed = _texts.get(task_id)
+    if streamed is None and load_result is not None:
+        streamed = (load_result(task_id) or {}).get("summary")
+    return streamed or ""
+
+
+def wait_for_change(task_id, known_stage, timeout, load_result=None):
+    """Block up to `timeout` seconds until the stage is no longer `known_stage`; returns the stage then."""
+    return _wait(task_id, timeout, lambda: current(task_id, load_result), lambda stage: stage != known_stage)
+
+
+def _read_update(task_id, load_result=None):
+    stage = current(task_id, load_result)
+    return stage, text(task_id, load_result) if stage == ChatTask.SUMMARIZING else ""
+
+
+def wait_for_update(task_id, known_stage, known_length, timeout, load_result=None):
+    """Like wait_for_change(), but also returns once the summary grew past `known_length`
+    characters; returns (stage, summary text so far)."""
+    return _wait(task_id, timeout, lambda: _read_update(task_id, load_result),
+                 lambda seen: seen[0] != known_stage or len(seen[1]) > known_length)
+
+
+async def await_update(task_id, known_stage, known_length, timeout, load_result=None):
+    """wait_for_update() for the event loop: reads run in a thread (sync_to_async) and, between
+    them, the coroutine awaits a publish in this process or the next CHAT_STATUS_POLL_SECONDS
+    check, so a waiting stream holds neither a thread nor the loop."""
+    task_id = str(task_id)
+    poll = getattr(settings, "CHAT_STATUS_POLL_SECONDS", 1.0)
+    deadline = time.monotonic() + timeout
+    read = sync_to_async(_read_update)
+    waiter = (asyncio.get_running_loop(), asyncio.Event())
+    with _cond:
+        _async_waiters.setdefault(task_id, set()).add(waiter)
+    try:
+        while True:
+            waiter[1].clear()  # a publish from here on wakes the wait below
+            stage, summary = value = await read(task_id, load_result)
+            remaining = deadline - time.monotonic()
+            if stage != known_stage or len(summary) > known_length or stage in TERMINAL_STAGES or remaining <= 0:
+                return value
+            try:
+                await asyncio.wait_for(waiter[1].wait(), min(poll, remaining))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _cond:
+            waiters = _async_waiters.get(task_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del _async_waiters[task_id]
+
+
+def _wait(task_id, timeout, read, changed):
+    task_id = str(task_id)
+    poll = getattr(settings, "CHAT_STATUS_POLL_SECONDS", 1.0)
+    deadline = time.monotonic() + timeout
+    while True:
+        seen = _published(task_id)[0]
+        value = read()
+        stage = value[0] if isinstance(value, tuple) else value
+        remaining = deadline - time.monotonic()
+        if changed(value) or stage in TERMINAL_STAGES or remaining <= 0:
+            return value
+        with _cond:
+            # Woken straight away by a publish() in this process; otherwise re-read the DB each poll
+            _cond.wait_for(lambda: _stages.get(task_id, (0, None))[0] != seen, min(poll, remaining))
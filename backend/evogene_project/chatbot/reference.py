@@ -0,0 +1,168 @@
+# chatbot/reference.py
+"""
+Local reference genome lookups (plain FASTA + samtools-style .fai index).
+
+The FASTA is memory-mapped, so resolving a base or a flanking window is a
+couple of offset calculations into the page cache instead of a remote call:
+a variant whose ALT equals the reference base, or whose position is past the
+end of the chromosome, is rejected before Evo2 is ever called. Anything but a
+single-nucleotide variant is refused whether or not a FASTA is configured.
+
+Configure one FASTA per assembly in settings.REFERENCE_GENOMES
+({"hg38": "/data/hg38.fa", ...}). The .fai next to it is used if present and
+built (then saved) otherwise — see `manage.py index_reference`. Assemblies
+without a FASTA are simply not validated.
+"""
+import mmap
+import os
+import threading
+
+from django.conf import settings
+
+from .variant_cache import normalize_chromosome
+
+BASES = frozenset("ACGT")
+
+
+class FastaReference:
+    def __init__(self, fasta_path, fai_path=None):
+        self.fasta_path = str(fasta_path)
+        self.fai_path = str(fai_path or f"{self.fasta_path}.fai")
+        if not os.path.exists(self.fai_path):
+            write_fai(self.fasta_path, self.fai_path)
+        self.index = read_fai(self.fai_path)
+        # normalized name ('chr12', 'chrM') -> name as written in the FASTA ('12', 'MT', ...)
+        self._names = {normalize_chromosome(name): name for name in self.index}
+        with open(self.fasta_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def resolve(self, chromosome):
+        """FASTA sequence name for 'chr12' / '12' / 'MT' ..., or None if the assembly lacks it."""
+        if chromosome in self.index:
+            return chromosome
+        return self._names.get(normalize_chromosome(chromosome))
+
+    def length(self, chromosome):
+        name = self.resolve(chromosome)
+        return self.index[name][0] if name else None
+
+    def fetch(self, chromosome, start, end):
+        """Bases [start, end) (0-based, clipped to the chromosome), upper-cased."""
+        name = self.resolve(chromosome)
+        if name is None:
+            raise KeyError(chromosome)
+        length, offset, line_bases, line_width = self.index[name]
+        start, end = max(0, start), min(length, end)
+        if start >= end:
+            return ""
+
+        def file_offset(pos):
+            return offset + (pos // line_bases) * line_width + pos % line_bases
+
+        raw = self._map[file_offset(start):file_offset(end - 1) + 1]
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode("ascii").upper()
+
+    def base(self, chromosome, position):
+        """Reference base at a 1-based position."""
+        return self.fetch(chromosome, position - 1, position)
+
+    def close(self):
+        self._map.close()
+
+
+def read_fai(fai_path):
+    """{name: (length, offset, line_bases, line_width)} from a .fai file."""
+    index = {}
+    with open(fai_path) as f:
+        for line in f:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) >= 5:
+                index[columns[0]] = tuple(int(c) for c in columns[1:5])
+    return index
+
+
+def write_fai(fasta_path, fai_path=None):
+    """Build a samtools-compatible .fai for a plain (uncompressed) FASTA with fixed line lengths."""
+    fai_path = fai_path or f"{fasta_path}.fai"
+    entries = []
+    current = None  # [name, length, offset, line_bases, line_width]
+    short_line_seen = False
+    position = 0
+    with open(fasta_path, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if current:
+                    entries.append(current)
+                current = [line[1:].split()[0].decode(), 0, position + len(line), 0, 0]
+                short_line_seen = False
+            elif current:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases and short_line_seen:
+                    raise ValueError(f"{fasta_path}: uneven line lengths in '{current[0]}', reformat the FASTA")
+                if not current[3]:
+                    current[3], current[4] = bases, len(line)
+                elif bases > current[3]:
+                    raise ValueError(f"{fasta_path}: uneven line lengths in '{current[0]}', reformat the FASTA")
+                short_line_seen = short_line_seen or bases < current[3]
+                current[1] += bases
+            position += len(line)
+    if current:
+        entries.append(current)
+
+    with open(fai_path, "w") as f:
+        for entry in entries:
+            f.write("\t".join(str(v) for v in entry) + "\n")
+    return fai_path
+
+
+# 🧬 One reader per assembly, opened on first use
+_readers = {}
+_lock = threading.Lock()
+
+
+def get_reference(genome):
+    """FastaReference for 'hg38' / 'hg19', or None when no FASTA is configured for it."""
+    if genome not in _readers:
+        with _lock:
+            if genome not in _readers:
+                path = (getattr(settings, "REFERENCE_GENOMES", {}) or {}).get(genome)
+                _readers[genome] = FastaReference(path) if path and os.path.exists(path) else None
+    return _readers[genome]
+
+
+def validate(variant):
+    """Check a VariantInputSchema against the reference and return its context, or None when
+    there's no reference for its assembly. Raises ValueError for variants not worth scoring."""
+    alt = variant.alternative.upper()
+    given_ref = (variant.reference or "").upper()
+    if alt not in BASES or (given_ref and given_ref not in BASES):
+        raise ValueError(
+            f"{variant.chromosome}:{variant.variant_position} {given_ref or '?'}>{alt} is not a single-nucleotide "
+            "variant; only SNVs (one A/C/G/T replaced by another) can be scored"
+        )
+
+    reference = get_reference(variant.genome)
+    if reference is None:
+        return None
+
+    length = reference.length(variant.chromosome)
+    if length is None:
+        raise ValueError(f"{variant.chromosome} is not in the {variant.genome} reference")
+    position = variant.variant_position
+    if not 1 <= position <= length:
+        raise ValueError(f"Position {position} is outside {variant.chromosome} (1-{length}) on {variant.genome}")
+
+    ref = reference.base(variant.chromosome, position)
+    if given_ref and given_ref != ref:
+        raise ValueError(
+            f"REF mismatch at {variant.chromosome}:{position}: got {given_ref}, {variant.genome} has {ref}"
+        )
+    if alt == ref:
+        raise ValueError(f"{variant.chromosome}:{position} {ref}>{alt} is not a variant (ALT equals the reference base)")
+
+    flank = getattr(settings, "REFERENCE_FLANK_BASES", 50)
+    return {
+        "reference": ref,
+        "upstream": reference.fetch(variant.chromosome, position - 1 - flank, position - 1),
+        "downstream": reference.fetch(variant.chromosome, position - 1 + len(ref), position - 1 + len(ref) + flank),
+    }
@@ -0,0 +1,517 @@
+# chatbot/resilience.py
+"""
+Timeouts, retries, hedging and circuit breaking for the pipeline's outbound
+calls (Gemini and the Evo2 HTTP backend).
+
+* Deadline budgets — every task runs under CHAT_TASK_SLA_SECONDS. Each stage
+  (extract / score / summarize) gets a share of what is *left* according to
+  CHAT_STAGE_WEIGHTS, so time a fast stage didn't use rolls over to the next.
+  Calls made outside a task fall back to the dependency's own timeout.
+* Jittered retries — transient failures (timeouts, connection errors, 429 /
+  5xx) are retried up to CHAT_RETRY_ATTEMPTS times with full-jitter
+  exponential backoff, but never past the stage budget. The error that
+  finally escapes carries `upstream_attempts`, so the task pool doesn't
+  retry it a second time.
+* Hedged requests — for dependencies in CHAT_HEDGE_DEPENDENCIES, an attempt
+  still running after the dependency's recent p95 latency gets a second,
+  identical request; whichever answers first wins.
+* Circuit breaker — once CHAT_BREAKER_FAILURE_RATE of the last
+  CHAT_BREAKER_WINDOW calls failed (after their retries, so a blip a retry
+  absorbed doesn't count), calls fail fast with CircuitOpenError for
+  CHAT_BREAKER_OPEN_SECONDS, then a single probe call decides whether to close.
+
+`call()` is for the threaded pipeline and `acall()` for the asyncio one; both
+take `fn(timeout)`, which must make one attempt within `timeout` seconds.
+`stream()` / `astream()` do the same for token streams: retries only until
+the first chunk arrives, no hedging, and the stage budget bounds every gap
+between chunks.
+Counters are served at /api/chat/resilience-stats/.
+"""
+import asyncio
+import contextlib
+import contextvars
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from django.conf import settings
+
+STAGES = ("extract", "score", "summarize")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+# ⏱️ Per-task deadline (a contextvar, so it follows the task into asyncio tasks and to_thread calls)
+_deadline = contextvars.ContextVar("chat_task_deadline", default=None)
+
+
+@contextlib.contextmanager
+def task_deadline(seconds=None):
+    """Run the enclosed pipeline stages under one overall SLA."""
+    seconds = seconds or getattr(settings, "CHAT_TASK_SLA_SECONDS", 60)
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def stage_budget(stage, dependency):
+    """Seconds this stage may spend, retries and hedges included."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return _default_timeout(dependency)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Task deadline passed before the {stage} stage")
+    weights = getattr(settings, "CHAT_STAGE_WEIGHTS", {"extract": 1, "score": 2, "summarize": 1})
+    later = STAGES[STAGES.index(stage):] if stage in STAGES else (stage,)
+    share = weights.get(stage, 1) / sum(weights.get(s, 1) for s in later)
+    return remaining * share
+
+
+def _default_timeout(dependency):
+    return getattr(settings, "CHAT_DEPENDENCY_TIMEOUTS", {}).get(dependency, 30)
+
+
+# 🔌 Circuit breaker
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window=50, failure_rate=0.5, min_calls=10, open_seconds=15.0):
+        self.window = window
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.opened = 0  # times tripped
+        self._outcomes = deque(maxlen=window)
+        self._probe_out = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out now (in half-open, only one probe at a time)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probe_out:
+                    return False
+                self._probe_out = True
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_out = False
+                if ok:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._trip()
+
+    def release(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_out = False
+
+    def _trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.opened += 1
+        self._outcomes.clear()
+
+
+class Dependency:
+    """Breaker, latency window and counters for one downstream service."""
+
+    def __init__(self, name):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            window=getattr(settings, "CHAT_BREAKER_WINDOW", 50),
+            failure_rate=getattr(settings, "CHAT_BREAKER_FAILURE_RATE", 0.5),
+            min_calls=getattr(settings, "CHAT_BREAKER_MIN_CALLS", 10),
+            open_seconds=getattr(settings, "CHAT_BREAKER_OPEN_SECONDS", 15.0),
+        )
+        self.hedged = name in getattr(settings, "CHAT_HEDGE_DEPENDENCIES", ())
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=500)
+        self.counts = dict.fromkeys(
+            ("calls", "succeeded", "failed", "rejected", "short_circuited",
+             "attempts", "retries", "timeouts", "hedges", "hedge_wins"), 0
+        )
+        self._executor = None
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def observe(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def hedge_delay(self):
+        """p95 of recent successful attempts, or None while there isn't enough history."""
+        if not self.hedged:
+            return None
+        with self.lock:
+            if len(self.latencies) < getattr(settings, "CHAT_HEDGE_MIN_SAMPLES", 20):
+                return None
+            p95 = float(np.percentile(self.latencies, 95))
+        return max(p95, getattr(settings, "CHAT_HEDGE_MIN_DELAY_SECONDS", 0.05))
+
+    @property
+    def executor(self):
+        # Sync attempts run here so a call that ignores its timeout can't hold the worker past its budget
+        if self._executor is None:
+            with self.lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, "CHAT_RESILIENCE_THREADS", 32),
+                        thread_name_prefix=f"{self.name}-call",
+                    )
+        return self._executor
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            counts = dict(self.counts)
+        arr = np.asarray(latencies) if latencies else None
+        return {
+            **counts,
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "hedging": self.hedged,
+            "latency_p50_s": round(float(np.percentile(arr, 50)), 3) if arr is not None else None,
+            "latency_p95_s": round(float(np.percentile(arr, 95)), 3) if arr is not None else None,
+        }
+
+
+_dependencies = {}
+_dependencies_lock = threading.Lock()
+
+
+def dependency(name):
+    if name not in _dependencies:
+        with _dependencies_lock:
+            if name not in _dependencies:
+                _dependencies[name] = Dependency(name)
+    return _dependencies[name]
+
+
+def reset():
+    """Forget all breakers and counters (benchmarks, settings changes)."""
+    with _dependencies_lock:
+        _dependencies.clear()
+
+
+def stats():
+    return {name: dep.stats() for name, dep in list(_dependencies.items())}
+
+
+def is_transient(error):
+    """Worth retrying, and a sign the dependency is unhealthy (vs. a bad request)."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status_code", None) \
+        or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    # requests / httpx / google-api-core transport errors don't share a base class
+    name = type(error).__name__
+    return any(word in name for word in ("Timeout", "Connect", "Transport", "Unavailable", "DeadlineExceeded"))
+
+
+def _backoff(attempt):
+    base = getattr(settings, "CHAT_RETRY_BACKOFF_BASE_SECONDS", 0.2)
+    cap = getattr(settings, "CHAT_RETRY_BACKOFF_MAX_SECONDS", 2.0)
+    return random.uniform(0, min(cap, base * 2 ** attempt))  # full jitter
+
+
+def _admit(dep):
+    dep.count("calls")
+    if not dep.breaker.allow():
+        dep.count("short_circuited")
+        raise CircuitOpenError(f"{dep.name} circuit is open, failing fast")
+
+
+def _retry_delay(dep, error, attempt, attempts, deadline):
+    """Jittered backoff before the next attempt, or None when `error` should be raised."""
+    if isinstance(error, TimeoutError):
+        dep.count("timeouts")
+    delay = _backoff(attempt)
+    if is_transient(error) and attempt < attempts - 1 and time.monotonic() + delay < deadline:
+        dep.count("retries")
+        return delay
+    return None
+
+
+def _log_retry(dep, stage, attempt, error, delay):
+    print(f"🔁 {dep.name} {stage} attempt {attempt + 1} failed ({error!r}); retrying in {delay:.2f}s")
+
+
+def _give_up(error, attempt):
+    """Mark an error raised after `attempt + 1` upstream requests (see tasks.TaskPool)."""
+    try:
+        error.upstream_attempts = attempt + 1
+    except AttributeError:
+        pass
+
+
+def _settle(dep, outcome):
+    """Feed the breaker once per call (after retries), so blips a retry absorbed don't trip it."""
+    if outcome is None:
+        dep.breaker.release()  # cancelled mid-call: no verdict either way
+        return
+    dep.count(outcome)
+    dep.breaker.record(outcome != "failed")  # a 4xx / bad payload says nothing about the service's health
+
+
+# 🧵 Threaded pipeline
+def call(name, fn, stage):
+    """fn(timeout) with this stage's budget, retries, hedging and the breaker."""
+    dep = dependency(name)
+    deadline = time.monotonic() + stage_budget(stage, name)
+    attempts = getattr(settings, "CHAT_RETRY_ATTEMPTS", 3)
+    _admit(dep)
+    outcome = None
+    try:
+        for attempt in range(attempts):
+            dep.count("attempts")
+            started = time.monotonic()
+            try:
+                result = _attempt(dep, fn, deadline)
+            except Exception as e:
+                delay = _retry_delay(dep, e, attempt, attempts, deadline)
+                if delay is None:
+                    outcome = "failed" if is_transient(e) else "rejected"
+                    _give_up(e, attempt)
+                    raise
+                _log_retry(dep, stage, attempt, e, delay)
+                time.sleep(delay)
+            else:
+                dep.observe(time.monotonic() - started)
+                outcome = "succeeded"
+                return result
+    finally:
+        _settle(dep, outcome)
+
+
+def _attempt(dep, fn, deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"{dep.name} stage budget exhausted")
+    futures = [dep.executor.submit(fn, remaining)]
+    delay = dep.hedge_delay()
+    if delay is not None and delay < remaining:
+        done, _ = wait(futures, timeout=delay)
+        if not done and dep.breaker.state == CircuitBreaker.CLOSED:
+            dep.count("hedges")
+            futures.append(dep.executor.submit(fn, deadline - time.monotonic()))
+
+    # First success wins; an error only counts once every outstanding request has failed
+    pending, error = set(futures), None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"{dep.name} did not answer within the stage budget")
+        for future in done:
+            if future.exception() is None:
+                if future is not futures[0]:
+                    dep.count("hedge_wins")
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+# ⚡ asyncio pipeline
+async def acall(name, fn, stage):
+    """Async counterpart of call(): fn(timeout) returns an awaitable; losers are cancelled."""
+    dep = dependency(name)
+    deadline = time.monotonic() + stage_budget(stage, name)
+    attempts = getattr(settings, "CHAT_RETRY_ATTEMPTS", 3)
+    _admit(dep)
+    outcome = None
+    try:
+        for attempt in range(attempts):
+            dep.count("attempts")
+            started = time.monotonic()
+            try:
+                result = await _aattempt(dep, fn, deadline)
+            except Exception as e:
+                delay = _retry_delay(dep, e, attempt, attempts, deadline)
+                if delay is None:
+                    outcome = "failed" if is_transient(e) else "rejected"
+                    _give_up(e, attempt)
+                    raise
+                _log_retry(dep, stage, attempt, e, delay)
+                await asyncio.sleep(delay)
+            else:
+                dep.observe(time.monotonic() - started)
+                outcome = "succeeded"
+                return result
+    finally:
+        _settle(dep, outcome)
+
+
+async def _aattempt(dep, fn, deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"{dep.name} stage budget exhausted")
+    tasks = [asyncio.ensure_future(fn(remaining))]
+    try:
+        delay = dep.hedge_delay()
+        if delay is not None and delay < remaining:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and dep.breaker.state == CircuitBreaker.CLOSED:
+                dep.count("hedges")
+                tasks.append(asyncio.ensure_future(fn(deadline - time.monotonic())))
+
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceeded(f"{dep.name} did not answer within the stage budget")
+            winners = [task for task in done if task.exception() is None]  # also marks failures as retrieved
+            if winners:
+                if winners[0] is not tasks[0]:
+                    dep.count("hedge_wins")
+                return winners[0].result()
+            error = next(iter(done)).exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# 📡 Streamed responses (LLM tokens)
+_END = object()
+
+
+def stream(name, fn, stage):
+    """Yield the chunks of fn(timeout) (an iterator) within the stage budget.
+
+    The iterator is drained on the dependency's executor and handed over through a queue, so a
+    stalled stream can't block the caller past the deadline.
+    """
+    dep = dependency(name)
+    deadline = time.monotonic() + stage_budget(stage, name)
+    attempts = getattr(settings, "CHAT_RETRY_ATTEMPTS", 3)
+    _admit(dep)
+    outcome = None
+    try:
+        for attempt in range(attempts):
+            dep.count("attempts")
+            started, received = time.monotonic(), 0
+            chunks, stop = queue.Queue(), threading.Event()
+            dep.executor.submit(_drain, fn, deadline - started, chunks, stop)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"{name} stream did not finish within the stage budget")
+                    try:
+                        item = chunks.get(timeout=remaining)
+                    except queue.Empty:
+                        continue
+                    if item is _END:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    received += 1
+                    yield item
+            except Exception as e:
+                # Once chunks went out a retry would repeat them, so only an empty stream is retried
+                delay = _retry_delay(dep, e, attempt, attempts, deadline) if not received else None
+                if delay is None:
+                    outcome = "failed" if is_transient(e) else "rejected"
+                    _give_up(e, attempt)
+                    raise
+                _log_retry(dep, stage, attempt, e, delay)
+                time.sleep(delay)
+            else:
+                dep.observe(time.monotonic() - started)
+                outcome = "succeeded"
+                return
+            finally:
+                stop.set()
+    finally:
+        _settle(dep, outcome)
+
+
+def _drain(fn, timeout, chunks, stop):
+    try:
+        for chunk in fn(timeout):
+            if stop.is_set():
+                return
+            chunks.put(chunk)
+        chunks.put(_END)
+    except Exception as e:
+        chunks.put(e)
+
+
+async def astream(name, fn, stage):
+    """Async counterpart of stream(): fn(timeout) returns an async iterator."""
+    dep = dependency(name)
+    deadline = time.monotonic() + stage_budget(stage, name)
+    attempts = getattr(settings, "CHAT_RETRY_ATTEMPTS", 3)
+    _admit(dep)
+    outcome = None
+    try:
+        for attempt in range(attempts):
+            dep.count("attempts")
+            started, received = time.monotonic(), 0
+            iterator = aiter(fn(deadline - started))
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"{name} stream did not finish within the stage budget")
+                    try:
+                        async with asyncio.timeout(remaining):  # a timer, not a task per chunk like wait_for
+                            item = await anext(iterator)
+                    except StopAsyncIteration:
+                        break
+                    except TimeoutError:
+                        raise DeadlineExceeded(f"{name} stream did not finish within the stage budget")
+                    received += 1
+                    yield item
+            except Exception as e:
+                delay = _retry_delay(dep, e, attempt, attempts, deadline) if not received else None
+                if delay is None:
+                    outcome = "failed" if is_transient(e) else "rejected"
+                    _give_up(e, attempt)
+                    raise
+                _log_retry(dep, stage, attempt, e, delay)
+                await asyncio.sleep(delay)
+            else:
+                dep.observe(time.monotonic() - started)
+                outcome = "succeeded"
+                return
+            finally:
+                if hasattr(iterator, "aclose"):
+                    await iterator.aclose()
+    finally:
+        _settle(dep, outcome)
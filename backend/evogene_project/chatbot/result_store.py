@@ -0,0 +1,348 @@
+# chatbot/result_store.py
+"""
+Where finished (and in-progress) chat analysis results live.
+
+CHAT_RESULT_STORE picks the backend:
+
+* "database" (default) — the TaskResult table, indexed on task id, user and
+  status; writes are a single INSERT ... ON CONFLICT DO UPDATE, so readers
+  never see a half-written result.
+* "sqlite" — a standalone SQLite file (CHAT_RESULT_SQLITE_PATH, WAL mode),
+  for deployments that want results off the main database.
+* "files" — the old one-JSON-file-per-task directory, kept for rollbacks;
+  writes are now atomic (temp file + rename) and carry the owner, but
+  queries scan the directory.
+
+Every result expires CHAT_RESULT_TTL_SECONDS after its last write. Expired
+results are never returned by `load()` / `query()`, and are purged
+opportunistically from `save()` at most once per
+CHAT_RESULT_CLEANUP_INTERVAL_SECONDS, or with `manage.py cleanup_task_results`.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import TaskResult
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(__file__), "task_results")
+
+
+def _ttl():
+    return getattr(settings, "CHAT_RESULT_TTL_SECONDS", 30 * 24 * 3600)
+
+
+def _status_of(data):
+    return str(data.get("status") or "processing")[:16]
+
+
+class _BaseStore:
+    name = None
+
+    def __init__(self):
+        self._last_cleanup = 0.0
+        self._cleanup_lock = threading.Lock()
+
+    def save(self, task_id, data, user_id=None):
+        """Insert or replace the result for `task_id`; `user_id` is only written when given."""
+        self.save_many([(task_id, data, user_id)])
+        self._maybe_cleanup()
+
+    def _maybe_cleanup(self):
+        interval = getattr(settings, "CHAT_RESULT_CLEANUP_INTERVAL_SECONDS", 600)
+        now = time.monotonic()
+        if now - self._last_cleanup < interval or not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_cleanup = now
+            removed = self.cleanup()
+            if removed:
+                print(f"🧹 Removed {removed} expired task result(s) from the {self.name} store")
+        except Exception as e:
+            print(f"[WARN] Task result cleanup failed: {e}")
+        finally:
+            self._cleanup_lock.release()
+
+
+class DatabaseResultStore(_BaseStore):
+    name = "database"
+
+    def save_many(self, items, batch_size=500):
+        """Bulk upsert of (task_id, data, user_id) tuples; returns how many were written."""
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=_ttl()) if _ttl() else None
+        # Rows with and without a user are written separately so a missing user never clears one
+        with_user, without_user = [], []
+        for task_id, data, user_id in items:
+            row = TaskResult(
+                task_id=task_id, user_id=user_id, status=_status_of(data), data=data,
+                created_at=now, updated_at=now, expires_at=expires_at,
+            )
+            (with_user if user_id is not None else without_user).append(row)
+
+        fields = ["status", "data", "updated_at", "expires_at"]
+        for rows, update_fields in ((with_user, fields + ["user"]), (without_user, fields)):
+            if rows:
+                TaskResult.objects.bulk_create(
+                    rows, batch_size=batch_size, update_conflicts=True,
+                    unique_fields=["task_id"], update_fields=update_fields,
+                )
+        return len(with_user) + len(without_user)
+
+    @staticmethod
+    def _live():
+        # Expired rows wait for cleanup() but are already gone as far as readers are concerned
+        return TaskResult.objects.filter(Q(expires_at__isnull=True) | Q(expires_at__gte=timezone.now()))
+
+    def load(self, task_id):
+        return self._live().filter(task_id=task_id).values_list("data", flat=True).first()
+
+    def query(self, user_id=None, status=None, since=None, limit=100):
+        """Newest first; each item is {"task_id", "status", "updated_at", "result"}."""
+        qs = self._live()
+        if user_id is not None:
+            qs = qs.filter(user_id=user_id)
+        if status:
+            qs = qs.filter(status=status)
+        if since:
+            qs = qs.filter(updated_at__gte=since)
+        rows = qs.order_by("-updated_at").values_list("task_id", "status", "updated_at", "data")[:limit]
+        return [
+            {"task_id": str(task_id), "status": status, "updated_at": updated_at.isoformat(), "result": data}
+            for task_id, status, updated_at, data in rows
+        ]
+
+    def cleanup(self):
+        return TaskResult.objects.filter(expires_at__lt=timezone.now()).delete()[0]
+
+    def count(self):
+        return TaskResult.objects.count()
+
+
+class SQLiteResultStore(_BaseStore):
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS task_results (
+            task_id    TEXT PRIMARY KEY,
+            user_id    INTEGER,
+            status     TEXT NOT NULL,
+            data       TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            expires_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS task_results_user_status ON task_results (user_id, status, updated_at);
+        CREATE INDEX IF NOT EXISTS task_results_status ON task_results (status, updated_at);
+        CREATE INDEX IF NOT EXISTS task_results_expires ON task_results (expires_at);
+    """
+
+    UPSERT = """
+        INSERT INTO task_results (task_id, user_id, status, data, created_at, updated_at, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (task_id) DO UPDATE SET
+            user_id = COALESCE(excluded.user_id, task_results.user_id),
+            status = excluded.status,
+            data = excluded.data,
+            updated_at = excluded.updated_at,
+            expires_at = excluded.expires_at
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = str(path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        # One connection per thread (and per process, so a forked worker never reuses the parent's)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def save_many(self, items, batch_size=500):
+        now = time.time()
+        expires_at = now + _ttl() if _ttl() else None
+        rows = [
+            (str(task_id), user_id, _status_of(data), json.dumps(data), now, now, expires_at)
+            for task_id, data, user_id in items
+        ]
+        conn = self._connect()
+        for start in range(0, len(rows), batch_size):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(self.UPSERT, rows[start:start + batch_size])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    LIVE = "(expires_at IS NULL OR expires_at >= ?)"
+
+    def load(self, task_id):
+        row = self._connect().execute(
+            f"SELECT data FROM task_results WHERE task_id = ? AND {self.LIVE}", (str(task_id), time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, user_id=None, status=None, since=None, limit=100):
+        sql, params = f"SELECT task_id, status, updated_at, data FROM task_results WHERE {self.LIVE}", [time.time()]
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params.append(user_id)
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        if since:
+            sql += " AND updated_at >= ?"
+            params.append(since.timestamp())
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+        return [
+            {
+                "task_id": task_id,
+                "status": status,
+                "updated_at": datetime.fromtimestamp(updated_at, tz=dt_timezone.utc).isoformat(),
+                "result": json.loads(data),
+            }
+            for task_id, status, updated_at, data in self._connect().execute(sql, params)
+        ]
+
+    def cleanup(self):
+        return self._connect().execute("DELETE FROM task_results WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM task_results").fetchone()[0]
+
+
+class FileResultStore(_BaseStore):
+    """Legacy layout: <dir>/<task_id>.json. The owner is kept in the JSON under OWNER_KEY; query() walks the directory."""
+    name = "files"
+    OWNER_KEY = "_user_id"
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = str(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, task_id):
+        return os.path.join(self.directory, f"{task_id}.json")
+
+    def save_many(self, items, batch_size=None):
+        for task_id, data, user_id in items:
+            if user_id is None:
+                user_id = self._read(task_id)[1]  # a write without a user never clears the owner
+            payload = {**data, self.OWNER_KEY: user_id} if user_id is not None else data
+            # Write to a temp file in the same directory, then rename over: readers see old or new, never half
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self._path(task_id))
+        return len(items)
+
+    def _read(self, task_id):
+        """(data, owner user id) of a live result, (None, None) if it is missing or expired."""
+        try:
+            with open(self._path(task_id), "r") as f:
+                if _ttl() and os.fstat(f.fileno()).st_mtime < time.time() - _ttl():
+                    return None, None  # expired, waiting for cleanup()
+                data = json.load(f)
+        except FileNotFoundError:
+            return None, None
+        return data, data.pop(self.OWNER_KEY, None)
+
+    def load(self, task_id):
+        return self._read(task_id)[0]
+
+    def query(self, user_id=None, status=None, since=None, limit=100):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    entries.append((entry.stat().st_mtime, entry.name[:-5]))
+        results = []
+        for mtime, task_id in sorted(entries, reverse=True):
+            if since and mtime < since.timestamp():
+                break
+            data, owner = self._read(task_id)
+            # Legacy files have no owner: they are never listed for a user
+            if data is None or (user_id is not None and owner != user_id) or (status and _status_of(data) != status):
+                continue
+            updated_at = datetime.fromtimestamp(mtime, tz=dt_timezone.utc).isoformat()
+            results.append({"task_id": task_id, "status": _status_of(data), "updated_at": updated_at, "result": data})
+            if len(results) >= limit:
+                break
+        return results
+
+    def cleanup(self):
+        if not _ttl():
+            return 0
+        cutoff = time.time() - _ttl()
+        removed = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
+
+    def count(self):
+        with os.scandir(self.directory) as it:
+            return sum(1 for entry in it if entry.name.endswith(".json"))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The configured backend (built on first use)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = build_store(getattr(settings, "CHAT_RESULT_STORE", "database"))
+    return _store
+
+
+def set_store(store):
+    """Swap the backend at runtime (benchmarks, tests)."""
+    global _store
+    _store = store
+
+
+def build_store(kind, **options):
+    if kind == "database":
+        return DatabaseResultStore()
+    if kind == "sqlite":
+        path = options.get("path") or getattr(settings, "CHAT_RESULT_SQLITE_PATH", None) or \
+            os.path.join(settings.BASE_DIR, "task_results.sqlite3")
+        return SQLiteResultStore(path)
+    if kind == "files":
+        return FileResultStore(options.get("directory") or getattr(settings, "CHAT_RESULTS_DIR", DEFAULT_RESULTS_DIR))
+    raise ValueError(f"Unknown CHAT_RESULT_STORE '{kind}' (expected database, sqlite or files)")
+
+
+def parse_since(value):
+    """ISO datetime query parameter -> aware datetime (None if empty)."""
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f"Invalid datetime '{value}'")
+    return since if timezone.is_aware(since) else timezone.make_aware(since, dt_timezone.utc)
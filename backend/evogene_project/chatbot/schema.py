@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Literal, Optional
 
 # --- IMPORTANT NOTE ---
 # You must install Pydantic for this to work: pip install pydantic
@@ -29,4 +29,10 @@ class VariantInputSchema(BaseModel):
     genome: Literal["hg38", "hg19"] = Field(
         "hg38", 
         description="The genome assembly build. Defaults to hg38 if not specified by the user."
-    )
\ No newline at end of file
+    )
+
+    reference: Optional[str] = Field(
+        None,
+        exclude=True,
+        description="REF allele as given by the user, if any. Checked against the local reference genome; never sent to Evo2."
+    )
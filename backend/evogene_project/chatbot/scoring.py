@@ -0,0 +1,287 @@
+# chatbot/scoring.py
+"""
+Pluggable variant scoring backends (the "Evo2 step" of the chat pipeline).
+
+EVO2_BACKEND selects one:
+
+* "http" (default) — the Evo2 deployment at EVO2_ENDPOINT_URL over
+  keep-alive connection pools (one requests.Session per thread, the shared
+  httpx pools of pipeline_async on the event loop), behind resilience.py's
+  timeouts, retries and circuit breaker. With EVO2_RECORD_PATH set, every
+  response is also appended there for later replay.
+* "local" — an offline stand-in: a deterministic heuristic on the variant's
+  reference context (transition/transversion, CpG, GC content, homopolymer
+  runs). Not a pathogenicity model; it exists for load tests, CI and
+  failover, and returns the same fields as Evo2.
+* "replay" — answers from a recorded JSONL file (EVO2_REPLAY_PATH), keyed on
+  the normalized variant; misses raise or fall back to "local"
+  (EVO2_REPLAY_MISS).
+
+Only "http" results are real Evo2 output, so only those go through the
+persistent variant cache (`cacheable`).
+"""
+import asyncio
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import reference, resilience, variant_cache
+
+
+class ScoringBackend:
+    name = None
+    cacheable = False
+
+    def score(self, variant, context=None):
+        """Evo2-shaped result dict for one VariantInputSchema; raises on failure."""
+        raise NotImplementedError
+
+    def score_many(self, variants, contexts=None):
+        """[(result or None, error or None)] in input order; one failure doesn't sink the rest."""
+        rows = []
+        for variant, context in zip(variants, contexts or [None] * len(variants)):
+            try:
+                rows.append((self.score(variant, context), None))
+            except Exception as e:
+                rows.append((None, str(e)))
+        return rows
+
+    async def ascore(self, variant, context=None):
+        return await asyncio.to_thread(self.score, variant, context)
+
+
+# 🌐 Remote Evo2 deployment
+class HttpScoringBackend(ScoringBackend):
+    name = "http"
+    cacheable = True
+
+    def __init__(self, url, batch_url="", batch_size=32, concurrency=8, record_path=None):
+        self.url = url
+        self.batch_url = batch_url
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.recorder = Recorder(record_path) if record_path else None
+        self._local = threading.local()
+
+    def _session(self):
+        # requests.Session keeps connections alive; one per thread so pool workers never share sockets
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.concurrency)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+        return session
+
+    def _post(self, url, payload):
+        """POST within the current stage budget (timeouts, retries, hedging, breaker)."""
+        def attempt(timeout):
+            response = self._session().post(url, json=payload, headers={"Content-Type": "application/json"},
+                                            timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return resilience.call("evo2", attempt, "score")
+
+    def score(self, variant, context=None):
+        result = self._post(self.url, variant.model_dump())
+        if self.recorder:
+            self.recorder.write(variant, result)
+        return result
+
+    def score_many(self, variants, contexts=None):
+        """Concurrent single-variant calls, or EVO2_BATCH_SIZE-sized requests to the batch endpoint.
+
+        The batch endpoint is expected to take {"variants": [...]} and answer with a list (or
+        {"results": [...]}) in the same order.
+        """
+        if not variants:
+            return []
+        if self.batch_url:
+            chunks = [list(range(start, min(start + self.batch_size, len(variants))))
+                      for start in range(0, len(variants), self.batch_size)]
+            work, run = chunks, self._score_chunk
+        else:
+            work, run = [[i] for i in range(len(variants))], lambda chunk, vs: [self.score(vs[chunk[0]])]
+
+        rows = [None] * len(variants)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(work)))) as executor:
+            # copy_context() carries the task deadline into the executor threads
+            futures = [(chunk, executor.submit(contextvars.copy_context().run, run, chunk, variants)) for chunk in work]
+            for chunk, future in futures:
+                try:
+                    for i, result in zip(chunk, future.result()):
+                        rows[i] = (result, None)
+                except Exception as e:
+                    for i in chunk:
+                        rows[i] = (None, str(e))
+        return rows
+
+    def _score_chunk(self, chunk, variants):
+        data = self._post(self.batch_url, {"variants": [variants[i].model_dump() for i in chunk]})
+        results = data.get("results") if isinstance(data, dict) else data
+        if not isinstance(results, list) or len(results) != len(chunk):
+            raise ValueError("Evo2 batch response does not match the request")
+        if self.recorder:
+            for i, result in zip(chunk, results):
+                self.recorder.write(variants[i], result)
+        return results
+
+    async def ascore(self, variant, context=None):
+        from .pipeline_async import post_json  # the event loop's shared keep-alive pools
+
+        payload = variant.model_dump()
+        result = await resilience.acall("evo2", lambda timeout: post_json(self.url, payload, timeout=timeout), "score")
+        if self.recorder:
+            await asyncio.to_thread(self.recorder.write, variant, result)
+        return result
+
+
+# 💻 Offline stand-in
+_TRANSITIONS = {("A", "G"), ("G", "A"), ("C", "T"), ("T", "C")}
+
+
+class LocalHeuristicScoringBackend(ScoringBackend):
+    """Deterministic, microsecond-cheap scorer with Evo2's response shape."""
+    name = "local"
+
+    def __init__(self, flank=20):
+        self.flank = flank
+
+    def score(self, variant, context=None):
+        if context is None:
+            try:
+                context = reference.validate(variant)
+            except ValueError:
+                context = None
+        ref = (context or {}).get("reference") or (variant.reference or "N")
+        upstream = (context or {}).get("upstream", "")[-self.flank:]
+        downstream = (context or {}).get("downstream", "")[:self.flank]
+        alt = variant.alternative.upper()
+
+        # Each feature nudges the (negative = more disruptive) delta score
+        delta = -0.0005
+        if (ref[:1], alt[:1]) not in _TRANSITIONS:
+            delta -= 0.0010  # transversions are rarer / more disruptive
+        if len(ref) != len(alt):
+            delta -= 0.0020 + 0.0005 * min(abs(len(ref) - len(alt)), 10)  # indel, worse if not a multiple of 3
+            if abs(len(ref) - len(alt)) % 3:
+                delta -= 0.0030
+        cpg = (ref[:1] == "C" and downstream[:1] == "G") or (ref[:1] == "G" and upstream[-1:] == "C")
+        if cpg:
+            delta -= 0.0008  # CpG sites are mutation hotspots under strong constraint
+        window = upstream + ref + downstream
+        gc = sum(base in "GC" for base in window) / len(window) if window else 0.5
+        delta -= 0.0010 * max(gc - 0.5, 0)
+        run = _homopolymer_run(upstream, downstream, ref[:1])
+        if run >= 5:
+            delta += 0.0005  # slippage-prone runs tolerate changes better
+
+        delta = round(delta, 6)
+        pathogenic = delta < -0.0030
+        confidence = round(min(0.95, 0.55 + abs(delta + 0.0030) * 60), 3)
+        return {
+            "reference": ref,
+            "alternative": alt,
+            "position": variant.variant_position,
+            "delta_score": delta,
+            "prediction": "Likely pathogenic" if pathogenic else "Likely benign",
+            "classification_confidence": confidence,
+            "backend": self.name,
+            "features": {"transition": (ref[:1], alt[:1]) in _TRANSITIONS, "cpg": cpg,
+                         "gc_content": round(gc, 3), "homopolymer_run": run},
+        }
+
+    async def ascore(self, variant, context=None):
+        return self.score(variant, context)
+
+
+def _homopolymer_run(upstream, downstream, base):
+    left = len(upstream) - len(upstream.rstrip(base)) if base else 0
+    right = len(downstream) - len(downstream.lstrip(base)) if base else 0
+    return left + 1 + right
+
+
+# 📼 Recorded responses
+class Recorder:
+    """Appends {"key", "variant", "result"} lines for ReplayScoringBackend."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+
+    def write(self, variant, result):
+        line = json.dumps({"key": variant_cache.cache_key(variant), "variant": variant.model_dump(), "result": result})
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class ReplayScoringBackend(ScoringBackend):
+    name = "replay"
+
+    def __init__(self, path, miss="error"):
+        self.path = str(path)
+        self.miss = miss
+        self.fallback = LocalHeuristicScoringBackend() if miss == "local" else None
+        self.responses = {}
+        with open(self.path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.responses[entry["key"]] = entry["result"]  # the latest recording wins
+
+    def score(self, variant, context=None):
+        result = self.responses.get(variant_cache.cache_key(variant))
+        if result is not None:
+            return result
+        if self.fallback is not None:
+            return self.fallback.score(variant, context)
+        raise LookupError(f"No recorded Evo2 response for {variant.model_dump()}")
+
+    async def ascore(self, variant, context=None):
+        return self.score(variant, context)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured backend (built on first use)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_backend(getattr(settings, "EVO2_BACKEND", "http"))
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the backend at runtime (benchmarks, failover)."""
+    global _backend
+    _backend = backend
+
+
+def build_backend(kind, **options):
+    if kind == "http":
+        return HttpScoringBackend(
+            url=options.get("url") or settings.EVO2_ENDPOINT_URL,
+            batch_url=options.get("batch_url", getattr(settings, "EVO2_BATCH_ENDPOINT_URL", "")),
+            batch_size=getattr(settings, "EVO2_BATCH_SIZE", 32),
+            concurrency=getattr(settings, "CHAT_BATCH_EVO2_CONCURRENCY", 8),
+            record_path=options.get("record_path", getattr(settings, "EVO2_RECORD_PATH", "")) or None,
+        )
+    if kind == "local":
+        return LocalHeuristicScoringBackend()
+    if kind == "replay":
+        return ReplayScoringBackend(
+            options.get("path") or settings.EVO2_REPLAY_PATH,
+            miss=options.get("miss", getattr(settings, "EVO2_REPLAY_MISS", "error")),
+        )
+    raise ValueError(f"Unknown EVO2_BACKEND '{kind}' (expected http, local or replay)")
@@ -0,0 +1,236 @@
+# chatbot/tasks.py
+"""
+Bounded worker pool for chat analysis tasks, backed by the ChatTask table.
+
+* The table is the queue: tasks survive restarts and any process's workers
+  can claim them (an UPDATE ... WHERE status='queued' claim, so a task only
+  runs once even with several web workers).
+* Admission control: `submit()` refuses new work once CHAT_QUEUE_MAX tasks
+  are waiting, and the view answers 429.
+* Failures other than bad input (ValueError) are retried with jittered
+  exponential backoff up to CHAT_TASK_MAX_ATTEMPTS. A Gemini / Evo2 error
+  that resilience.py already retried (CHAT_RETRY_ATTEMPTS, within the stage
+  budget) is final here: each failure is retried by one layer only, so a
+  call never costs more than CHAT_RETRY_ATTEMPTS upstream requests. An open
+  circuit (no request made) and other errors are retried by the pool.
+* Running tasks hold a lease: every CHAT_TASK_HEARTBEAT_SECONDS a
+  maintenance thread renews `heartbeat_at` of this process's tasks and puts
+  back in the queue any task whose lease is older than
+  CHAT_TASK_STALE_SECONDS (its worker died), whichever process owned it.
+"""
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import progress
+from .models import ChatTask
+
+
+class QueueFull(Exception):
+    pass
+
+
+class TaskPool:
+    def __init__(self, handler, on_failure):
+        # handler(task_id, prompt, variants) raises on failure; on_failure(task_id, error) records a final failure
+        self.handler = handler
+        self.on_failure = on_failure
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._running = set()  # pks of the tasks this process is executing
+        self._pid = None
+        self._waits = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+        self.retries = 0
+        self.failures = 0
+        self.completed = 0
+
+    @property
+    def worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    # 🧩 Public API
+    def submit(self, task_id, prompt, variants=None):
+        """Persist and enqueue a task, or raise QueueFull when the backlog is at capacity.
+        `variants` (a list of variant dicts) marks a batch task."""
+        self.start()
+        max_queue = getattr(settings, "CHAT_QUEUE_MAX", 100)
+        if ChatTask.objects.filter(status=ChatTask.QUEUED).count() >= max_queue:
+            raise QueueFull()
+        ChatTask.objects.create(task_id=task_id, prompt=prompt, variants=variants)
+        self._wakeup.set()
+
+    def start(self):
+        """Start the worker threads and the lease thread in this process (idempotent, fork-aware)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._wakeup = threading.Event()
+            self._running = set()
+            self.recover(report_pending=True)
+            self._threads = [
+                threading.Thread(target=self._run, name=f"chat-worker-{i}", daemon=True)
+                for i in range(getattr(settings, "CHAT_WORKERS", 4))
+            ]
+            threading.Thread(target=self._maintain, name="chat-task-lease", daemon=True).start()
+            for t in self._threads:
+                t.start()
+
+    def heartbeat(self):
+        """Renew the lease of every task this process is running."""
+        with self._lock:
+            running = list(self._running)
+        if running:
+            ChatTask.objects.filter(pk__in=running, status=ChatTask.RUNNING, worker=self.worker_id).update(
+                heartbeat_at=timezone.now()
+            )
+
+    def recover(self, report_pending=False):
+        """Re-queue running tasks whose lease expired (their worker died mid-run)."""
+        stale = getattr(settings, "CHAT_TASK_STALE_SECONDS", 60)
+        cutoff = timezone.now() - timedelta(seconds=stale)
+        expired = Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+        recovered = ChatTask.objects.filter(expired, status=ChatTask.RUNNING).update(
+            status=ChatTask.QUEUED, stage=ChatTask.QUEUED, worker=None, next_attempt_at=timezone.now()
+        )
+        if recovered:
+            self._wakeup.set()
+        pending = ChatTask.objects.filter(status=ChatTask.QUEUED).count() if report_pending else 0
+        if recovered or pending:
+            print(f"♻️ Task queue recovery: {recovered} interrupted task(s) re-queued, {pending} pending")
+        return recovered
+
+    def stats(self):
+        now = timezone.now()
+        queued = ChatTask.objects.filter(status=ChatTask.QUEUED)
+        oldest = queued.order_by("created_at").values_list("created_at", flat=True).first()
+        with self._lock:
+            waits = list(self._waits)
+            runs = list(self._run_times)
+        return {
+            "workers": len(self._threads),
+            "max_queue": getattr(settings, "CHAT_QUEUE_MAX", 100),
+            "queue_depth": queued.count(),
+            "ready": queued.filter(next_attempt_at__lte=now).count(),
+            "running": ChatTask.objects.filter(status=ChatTask.RUNNING).count(),
+            "oldest_queued_age_s": round((now - oldest).total_seconds(), 3) if oldest else None,
+            "wait_s": _summarize(waits),
+            "run_s": _summarize(runs),
+            "completed": self.completed,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    # 🧩 Workers
+    def _claim(self):
+        """Atomically take the oldest ready task; returns None if there is nothing to do."""
+        now = timezone.now()
+        candidates = ChatTask.objects.filter(
+            status=ChatTask.QUEUED, next_attempt_at__lte=now
+        ).order_by("next_attempt_at", "created_at").values_list("pk", flat=True)[:10]
+        for pk in candidates:
+            claimed = ChatTask.objects.filter(pk=pk, status=ChatTask.QUEUED).update(
+                status=ChatTask.RUNNING, worker=self.worker_id, started_at=now, heartbeat_at=now
+            )
+            if claimed:
+                return ChatTask.objects.get(pk=pk)
+        return None
+
+    def _run(self):
+        poll = getattr(settings, "CHAT_QUEUE_POLL_SECONDS", 1.0)
+        while True:
+            try:
+                task = self._claim()
+            except Exception as e:
+                print(f"❌ Task queue claim failed: {e}")
+                task = None
+            if task is None:
+                close_old_connections()
+                self._wakeup.wait(poll)
+                self._wakeup.clear()
+                continue
+            self._execute(task)
+            close_old_connections()
+
+    def _maintain(self):
+        interval = getattr(settings, "CHAT_TASK_HEARTBEAT_SECONDS", 10)
+        while True:
+            time.sleep(interval)
+            try:
+                self.heartbeat()
+                self.recover()
+            except Exception as e:
+                print(f"❌ Task lease upkeep failed: {e}")
+            close_old_connections()
+
+    def _execute(self, task):
+        wait = (task.started_at - task.next_attempt_at).total_seconds() if task.attempts else \
+            (task.started_at - task.created_at).total_seconds()
+        attempts = task.attempts + 1
+        started = time.perf_counter()
+        with self._lock:
+            self._running.add(task.pk)
+        try:
+            self.handler(str(task.task_id), task.prompt, task.variants)
+        except Exception as e:
+            max_attempts = getattr(settings, "CHAT_TASK_MAX_ATTEMPTS", 3)
+            # Bad input / an unparsable variant won't improve; resilience.py already retried upstream errors
+            retryable = not isinstance(e, ValueError) and not getattr(e, "upstream_attempts", 0)
+            if retryable and attempts < max_attempts:
+                base = getattr(settings, "CHAT_RETRY_BACKOFF_SECONDS", 2.0)
+                delay = base * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+                ChatTask.objects.filter(pk=task.pk).update(
+                    status=ChatTask.QUEUED, attempts=attempts, last_error=str(e), worker=None,
+                    next_attempt_at=timezone.now() + timedelta(seconds=delay),
+                )
+                progress.publish(task.task_id, ChatTask.QUEUED)
+                with self._lock:
+                    self.retries += 1
+                print(f"🔁 Task {task.task_id} attempt {attempts} failed ({e}); retrying in {delay:.1f}s")
+                return
+
+            ChatTask.objects.filter(pk=task.pk).update(
+                status=ChatTask.FAILED, attempts=attempts, last_error=str(e), finished_at=timezone.now()
+            )
+            self.on_failure(str(task.task_id), e)
+            with self._lock:
+                self.failures += 1
+        else:
+            ChatTask.objects.filter(pk=task.pk).update(
+                status=ChatTask.COMPLETED, attempts=attempts, finished_at=timezone.now()
+            )
+            with self._lock:
+                self.completed += 1
+        finally:
+            with self._lock:
+                self._running.discard(task.pk)
+                self._waits.append(max(wait, 0.0))
+                self._run_times.append(time.perf_counter() - started)
+
+
+def _summarize(values):
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(arr.size),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "max": round(float(arr.max()), 3),
+    }
@@ -1,3 +1,1012 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import types
+import urllib.error
+import urllib.request
+import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import llm_cache, pipeline, pipeline_async, progress, reference, resilience, result_store, scoring, variant_cache, variant_parser, views
+from .models import ChatTask, LLMResponseCache, TaskResult, VariantResultCache
+from .schema import VariantInputSchema
+from .tasks import TaskPool
+
+
+def _collect(response):
+    return b"".join(response.streaming_content).decode()
+
+
+async def _acollect(response):
+    return "".join([chunk.decode() if isinstance(chunk, bytes) else chunk async for chunk in response.streaming_content])
+
+
+# 🧪 /api/status/<id>/stream/
+class StatusStreamTests(TransactionTestCase):
+
+    def _task(self, stage):
+        task_id = uuid.uuid4()
+        ChatTask.objects.create(task_id=task_id, prompt="chr1 100 A>G", status=ChatTask.RUNNING, stage=stage)
+        return task_id
+
+    def test_sync_stream_ends_with_the_terminal_stage(self):
+        task_id = self._task(ChatTask.FAILED)
+        response = self.client.get(f"/api/status/{task_id}/stream/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = _collect(response)
+        self.assertIn("event: stage", body)
+        self.assertIn("event: end", body)
+
+    def test_sync_streams_are_capped_per_process(self):
+        task_id = self._task(ChatTask.FAILED)
+        held = 0
+        while views._sync_streams.acquire(blocking=False):
+            held += 1
+        try:
+            response = self.client.get(f"/api/status/{task_id}/stream/")
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("Retry-After", response)
+            self.assertIn(f"/api/status/{task_id}/?wait=", response.json()["poll"])
+        finally:
+            for _ in range(held):
+                views._sync_streams.release()
+
+    def test_closing_a_sync_stream_frees_its_slot(self):
+        task_id = self._task(ChatTask.FAILED)
+        before = views._sync_streams._value
+        response = self.client.get(f"/api/status/{task_id}/stream/")
+        self.assertEqual(views._sync_streams._value, before - 1)
+        response.close()
+        self.assertEqual(views._sync_streams._value, before)
+
+    @override_settings(CHAT_STATUS_SYNC_STREAM_MAX_SECONDS=0)
+    def test_sync_stream_closes_at_its_deadline(self):
+        task_id = self._task(ChatTask.SCORING)
+        body = _collect(self.client.get(f"/api/status/{task_id}/stream/"))
+        self.assertIn("id: scoring:0", body)
+        self.assertNotIn("event: end", body)
+
+    @override_settings(CHAT_STATUS_POLL_SECONDS=0.05)
+    def test_async_stream_is_an_async_iterator(self):
+        task_id = self._task(ChatTask.SCORING)
+
+        async def scenario():
+            response = await self.async_client.get(f"/api/status/{task_id}/stream/")
+            self.assertTrue(response.is_async)
+            events = response.streaming_content
+            first = "".join([(await anext(events)).decode() for _ in range(2)])
+            await asyncio.to_thread(progress.publish, task_id, ChatTask.FAILED)
+            rest = await _acollect(response)
+            return first, rest
+
+        first, rest = asyncio.run(scenario())
+        self.assertIn("id: scoring:0", first)
+        self.assertIn("event: end", rest)
+
+    @override_settings(CHAT_STATUS_POLL_SECONDS=30, CHAT_SUMMARY_FLUSH_SECONDS=60)
+    def test_async_stream_sends_each_summary_chunk_as_it_is_written(self):
+        task_id = self._task(ChatTask.SUMMARIZING)
+        chunks = ["BRCA1 ", "variant ", "is likely benign."]
+
+        class FakeLLM:
+            async def astream(self, messages):
+                for text in chunks:
+                    await asyncio.sleep(0.05)
+                    yield types.SimpleNamespace(content=text)
+
+        async def scenario():
+            response = await self.async_client.get(f"/api/status/{task_id}/stream/")
+            events = response.streaming_content
+            for _ in range(2):  # retry + current stage
+                await anext(events)
+            writer = asyncio.ensure_future(pipeline_async.stream_summary_async(str(task_id), [], {}))
+            tokens = []
+            for _ in chunks:
+                # a poll interval of 30 s: only the publish wake-up can deliver these in time
+                tokens.append((await asyncio.wait_for(anext(events), 5)).decode())
+            await writer
+            await asyncio.to_thread(progress.publish, task_id, ChatTask.FAILED)
+            return tokens, await _acollect(response)
+
+        with mock.patch.object(pipeline, "llm", FakeLLM()):
+            tokens, rest = asyncio.run(scenario())
+        self.assertEqual([t.count("event: token") for t in tokens], [1, 1, 1])
+        self.assertIn('"text": "variant "', tokens[1])
+        self.assertIn("event: end", rest)
+
+
+# 🧪 Local variant parsing (SNVs only)
+class VariantParserTests(TestCase):
+
+    def test_snv_notations_are_parsed(self):
+        for prompt in ("chr12:43119628 G>A", "NC_000012.12:g.43119628G>A", "12-43119628-G-A", "chr12 43119628 G A"):
+            variant = variant_parser.parse(prompt)
+            self.assertIsNotNone(variant, prompt)
+            self.assertEqual((variant.variant_position, variant.alternative, variant.reference), (43119628, "A", "G"))
+
+    def test_indels_and_n_alleles_are_left_to_the_llm(self):
+        for prompt in ("chr12:43119628 GA>G", "chr12:43119628 G>GTT", "NC_000012.12:g.43119628G>AC",
+                       "12-43119628-GT-A", "chr12 43119628 G AT", "chr12:43119628 N>A"):
+            self.assertIsNone(variant_parser.parse(prompt), prompt)
+            self.assertEqual(variant_parser.count_variants(prompt), 0, prompt)
+
+    def test_vcf_indels_are_skipped(self):
+        lines = ["#CHROM\tPOS\tID\tREF\tALT", "1\t100\t.\tA\tG,AT", "1\t200\t.\tAT\tA", "1\t300\t.\tC\tT"]
+        self.assertEqual([(v.variant_position, v.alternative) for v in variant_parser.parse_vcf(lines)],
+                         [(100, "G"), (300, "T")])
+
+    def test_reference_validation_refuses_non_snvs_without_a_fasta(self):
+        for ref, alt in (("G", "GTT"), ("GA", "G"), (None, "N")):
+            variant = VariantInputSchema(chromosome="chr12", variant_position=100, alternative=alt, genome="hg38", reference=ref)
+            with self.assertRaisesRegex(ValueError, "not a single-nucleotide variant"):
+                reference.validate(variant)
+
+
+# 🧪 Evo2 result cache
+class VariantCacheTests(TestCase):
+
+    def test_long_alleles_are_stored_clipped_and_still_found_by_key(self):
+        variant = {"chromosome": "12", "variant_position": 100, "alternative": "ACGT" * 10, "genome": "hg38"}
+        variant_cache.put(variant, {"score": 1})
+        entry = VariantResultCache.objects.get()
+        self.assertEqual(entry.alternative, ("ACGT" * 10)[:16])
+        self.assertEqual(entry.key, variant_cache.cache_key(variant))
+        self.assertEqual(variant_cache.get(variant), {"score": 1})
+        self.assertIsNone(variant_cache.get({**variant, "alternative": ("ACGT" * 10)[:16]}))
+
+
+# 🧪 Task pool leases and retries
+@override_settings(CHAT_TASK_STALE_SECONDS=60, CHAT_TASK_MAX_ATTEMPTS=3)
+class TaskPoolTests(TestCase):
+
+    def setUp(self):
+        self.failures = []
+        self.pool = TaskPool(handler=lambda *args: None, on_failure=lambda task_id, e: self.failures.append(e))
+
+    def _running(self, heartbeat_age, worker="other-host:1"):
+        now = timezone.now()
+        return ChatTask.objects.create(
+            task_id=uuid.uuid4(), prompt="x", status=ChatTask.RUNNING, worker=worker,
+            started_at=now - timedelta(hours=1), heartbeat_at=now - timedelta(seconds=heartbeat_age),
+        )
+
+    def test_only_expired_leases_are_recovered(self):
+        dead, alive = self._running(heartbeat_age=120), self._running(heartbeat_age=5)
+        self.assertEqual(self.pool.recover(), 1)
+        dead.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((dead.status, dead.worker), (ChatTask.QUEUED, None))
+        self.assertEqual(alive.status, ChatTask.RUNNING)
+
+    def test_heartbeat_renews_this_process_tasks(self):
+        task = self._running(heartbeat_age=120, worker=self.pool.worker_id)
+        self.pool._running.add(task.pk)
+        self.pool.heartbeat()
+        self.assertEqual(self.pool.recover(), 0)
+        task.refresh_from_db()
+        self.assertEqual(task.status, ChatTask.RUNNING)
+
+    def _execute_raising(self, error):
+        ChatTask.objects.create(task_id=uuid.uuid4(), prompt="x")
+
+        def handler(*args):
+            raise error
+
+        self.pool.handler = handler
+        self.pool._execute(self.pool._claim())
+        return ChatTask.objects.get()
+
+    def test_errors_resilience_already_retried_are_final(self):
+        error = ConnectionError("gemini down")
+        resilience._give_up(error, 2)
+        task = self._execute_raising(error)
+        self.assertEqual(task.status, ChatTask.FAILED)
+        self.assertEqual(self.failures, [error])
+
+    def test_open_circuit_is_retried_by_the_pool(self):
+        task = self._execute_raising(resilience.CircuitOpenError("gemini circuit is open"))
+        self.assertEqual((task.status, task.attempts), (ChatTask.QUEUED, 1))
+
+
+# 🧪 Outbound call resilience against a local stub server
+class _StubServer:
+    """HTTP server on 127.0.0.1 answering each request with the next (status, delay) of `script`
+    (the last entry repeats)."""
+
+    def __init__(self):
+        self.script = [(200, 0)]
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with lock:
+                    index = stub.requests
+                    stub.requests += 1
+                status, delay = stub.script[min(index, len(stub.script) - 1)]
+                time.sleep(delay)
+                body = f"response {index}".encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def play(self, *script):
+        self.script, self.requests = list(script), 0
+
+    def fetch(self, timeout):
+        with urllib.request.urlopen(self.url, timeout=timeout) as response:
+            return response.read().decode()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(
+    CHAT_RETRY_ATTEMPTS=3, CHAT_RETRY_BACKOFF_BASE_SECONDS=0.001, CHAT_RETRY_BACKOFF_MAX_SECONDS=0.002,
+    CHAT_BREAKER_WINDOW=4, CHAT_BREAKER_MIN_CALLS=2, CHAT_BREAKER_FAILURE_RATE=0.5, CHAT_BREAKER_OPEN_SECONDS=0.3,
+    CHAT_HEDGE_DEPENDENCIES=["stub"], CHAT_HEDGE_MIN_SAMPLES=3, CHAT_HEDGE_MIN_DELAY_SECONDS=0.05,
+    CHAT_DEPENDENCY_TIMEOUTS={"stub": 5}, CHAT_STAGE_WEIGHTS={"extract": 1, "score": 2, "summarize": 1},
+)
+class ResilienceTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = _StubServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+
+    def call(self, stage="score"):
+        return resilience.call("stub", self.stub.fetch, stage)
+
+    def counts(self):
+        return resilience.dependency("stub").counts
+
+    def test_5xx_is_retried_until_it_succeeds(self):
+        self.stub.play((503, 0), (502, 0), (200, 0))
+        self.assertEqual(self.call(), "response 2")
+        self.assertEqual((self.counts()["attempts"], self.counts()["retries"]), (3, 2))
+
+    def test_breaker_trips_and_then_fails_fast(self):
+        self.stub.play((503, 0))
+        for _ in range(2):
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                self.call()
+            self.assertEqual(raised.exception.upstream_attempts, 3)
+        served = self.stub.requests
+        with self.assertRaises(resilience.CircuitOpenError):
+            self.call()
+        self.assertEqual(self.stub.requests, served)  # no request went out
+        self.assertEqual(resilience.dependency("stub").breaker.state, resilience.CircuitBreaker.OPEN)
+
+    def test_half_open_sends_one_probe_and_closes_on_success(self):
+        self.stub.play((503, 0))
+        for _ in range(2):
+            with self.assertRaises(urllib.error.HTTPError):
+                self.call()
+        time.sleep(0.35)  # CHAT_BREAKER_OPEN_SECONDS
+        self.stub.play((200, 0.3))
+        probe = threading.Thread(target=self.call)
+        probe.start()
+        time.sleep(0.1)
+        with self.assertRaises(resilience.CircuitOpenError):
+            self.call()  # only the probe may be out
+        probe.join()
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(resilience.dependency("stub").breaker.state, resilience.CircuitBreaker.CLOSED)
+
+    def test_failed_probe_reopens_the_breaker(self):
+        self.stub.play((503, 0))
+        for _ in range(2):
+            with self.assertRaises(urllib.error.HTTPError):
+                self.call()
+        time.sleep(0.35)
+        with self.assertRaises(urllib.error.HTTPError):
+            self.call()
+        self.assertEqual(resilience.dependency("stub").breaker.state, resilience.CircuitBreaker.OPEN)
+        self.assertEqual(resilience.dependency("stub").breaker.opened, 2)
+
+    def test_slow_attempt_is_hedged_and_the_fast_one_wins(self):
+        self.stub.play((200, 0))
+        for _ in range(3):
+            self.call()  # latency history for the p95
+        self.stub.play((200, 1.0), (200, 0))
+        started = time.monotonic()
+        self.assertEqual(self.call(), "response 1")
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual((self.counts()["hedges"], self.counts()["hedge_wins"]), (1, 1))
+
+    def test_unused_stage_time_rolls_over_to_the_next_stage(self):
+        self.stub.play((200, 0))
+        with resilience.task_deadline(4.0):
+            self.assertAlmostEqual(resilience.stage_budget("extract", "stub"), 1.0, delta=0.05)
+            self.call("extract")  # answers at once: almost the whole 1 s share is left over
+            self.assertGreater(resilience.stage_budget("score", "stub"), 2.5)  # 2/3 of ~4 s, not a fixed 2 s
+
+    def test_stage_budget_bounds_slow_responses(self):
+        self.stub.play((200, 2.0))
+        started = time.monotonic()
+        with resilience.task_deadline(1.0):
+            with self.assertRaises(TimeoutError):
+                self.call("extract")  # 1/4 of the task deadline
+        self.assertLess(time.monotonic() - started, 0.6)
+
+    def test_every_entry_point_logs_its_retries(self):
+        async def acall():
+            return await resilience.acall("stub", lambda timeout: asyncio.to_thread(self.stub.fetch, timeout), "score")
+
+        async def astream():
+            async def chunks(timeout):
+                yield await asyncio.to_thread(self.stub.fetch, timeout)
+            return [c async for c in resilience.astream("stub", chunks, "summarize")]
+
+        runs = {
+            "call": self.call,
+            "acall": lambda: asyncio.run(acall()),
+            "stream": lambda: list(resilience.stream("stub", lambda timeout: iter([self.stub.fetch(timeout)]), "summarize")),
+            "astream": lambda: asyncio.run(astream()),
+        }
+        for name, run in runs.items():
+            resilience.reset()
+            self.stub.play((503, 0), (200, 0))
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                run()
+            self.assertIn("🔁 stub", output.getvalue(), name)
+            self.assertIn("attempt 1 failed", output.getvalue(), name)
+
+
+# 🧪 Local reference genome (FASTA + .fai)
+_CHR1 = "ACGTACGTTTGGCCAANNACGTA"  # 23 bases: wraps at 5 per line with a short last line
+_CHR2 = "GATTACAGATTACA"
+
+
+def _write_fasta(directory, name, newline, width=5):
+    path = os.path.join(directory, name)
+    with open(path, "w", newline="") as f:
+        for seq_name, sequence in (("chr1 test sequence", _CHR1), ("2", _CHR2.lower())):
+            f.write(f">{seq_name}{newline}")
+            for i in range(0, len(sequence), width):
+                f.write(sequence[i:i + width] + newline)
+    return path
+
+
+class ReferenceTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_fai_matches_samtools_layout(self):
+        for newline in ("\n", "\r\n"):
+            path = _write_fasta(self.directory, f"ref{len(newline)}.fa", newline)
+            index = reference.read_fai(reference.write_fai(path))
+            header = len(f">chr1 test sequence{newline}")
+            self.assertEqual(index["chr1"], (23, header, 5, 5 + len(newline)))
+            self.assertEqual(index["2"][:1] + index["2"][2:], (14, 5, 5 + len(newline)))
+
+    def test_fetch_across_line_wraps(self):
+        for newline in ("\n", "\r\n"):
+            fasta = reference.FastaReference(_write_fasta(self.directory, f"wrap{len(newline)}.fa", newline))
+            self.addCleanup(fasta.close)
+            for start in range(len(_CHR1)):
+                for end in range(start + 1, len(_CHR1) + 1):
+                    self.assertEqual(fasta.fetch("chr1", start, end), _CHR1[start:end], (newline, start, end))
+            self.assertEqual(fasta.fetch("chr2", -3, 100), _CHR2)  # clipped, aliased, upper-cased
+            self.assertEqual(fasta.base("2", 7), "A")
+
+    def test_uneven_lines_are_refused(self):
+        path = os.path.join(self.directory, "uneven.fa")
+        with open(path, "w") as f:
+            f.write(">chr1\nACGTA\nCG\nTTAC\n")
+        with self.assertRaisesRegex(ValueError, "uneven line lengths"):
+            reference.write_fai(path)
+
+    def _validate(self, position, alt, ref=None):
+        variant = VariantInputSchema(chromosome="chr1", variant_position=position, alternative=alt, genome="hg38", reference=ref)
+        with override_settings(REFERENCE_GENOMES={"hg38": _write_fasta(self.directory, "hg38.fa", "\r\n")}):
+            reference._readers.pop("hg38", None)
+            try:
+                return reference.validate(variant)
+            finally:
+                reader = reference._readers.pop("hg38", None)
+                if reader is not None:
+                    reader.close()
+
+    def test_validate_returns_the_reference_base_and_flanks(self):
+        with override_settings(REFERENCE_FLANK_BASES=3):
+            context = self._validate(7, "A", ref="g")
+        self.assertEqual(context, {"reference": "G", "upstream": "TAC", "downstream": "TTT"})
+
+    def test_validate_rejects_out_of_range_positions(self):
+        for position in (0, 24):
+            with self.assertRaisesRegex(ValueError, "outside chr1 \\(1-23\\)"):
+                self._validate(position, "A")
+
+    def test_validate_rejects_ref_mismatch_and_no_change(self):
+        with self.assertRaisesRegex(ValueError, "REF mismatch at chr1:7: got C, hg38 has G"):
+            self._validate(7, "A", ref="C")
+        with self.assertRaisesRegex(ValueError, "not a variant"):
+            self._validate(7, "G")
+
+
+# 🧪 Task result stores
+class ResultStoreTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.user = get_user_model().objects.create_user(email="results@example.com", password="x", name="Results")
+        self.stores = [result_store.DatabaseResultStore(),
+                       result_store.SQLiteResultStore(os.path.join(self.directory, "results.sqlite3"))]
+
+    def expire(self, store, task_id):
+        past = timezone.now() - timedelta(seconds=1)
+        if store.name == "database":
+            TaskResult.objects.filter(task_id=task_id).update(expires_at=past)
+        else:
+            store._connect().execute("UPDATE task_results SET expires_at = ? WHERE task_id = ?",
+                                     (past.timestamp(), task_id))
+
+    def test_upsert_replaces_the_row_and_keeps_its_user(self):
+        for store in self.stores:
+            task_id = str(uuid.uuid4())
+            store.save(task_id, {"status": "processing"}, user_id=self.user.pk)
+            store.save(task_id, {"status": "completed", "summary": "ok"})
+            self.assertEqual(store.load(task_id), {"status": "completed", "summary": "ok"})
+            self.assertEqual(store.count(), 1, store.name)
+            [item] = store.query(user_id=self.user.pk)
+            self.assertEqual((item["task_id"], item["status"]), (task_id, "completed"))
+            store.cleanup()
+            self.assertEqual(store.count(), 1)
+            self.expire(store, task_id)
+            self.assertEqual(store.cleanup(), 1)
+
+    def test_expired_results_are_not_returned(self):
+        for store in self.stores:
+            task_id, fresh_id = str(uuid.uuid4()), str(uuid.uuid4())
+            store.save(task_id, {"status": "completed"}, user_id=self.user.pk)
+            store.save(fresh_id, {"status": "completed"}, user_id=self.user.pk)
+            self.expire(store, task_id)
+            self.assertIsNone(store.load(task_id), store.name)
+            self.assertEqual([item["task_id"] for item in store.query(user_id=self.user.pk)], [fresh_id])
+            self.assertEqual([item["task_id"] for item in store.query(status="completed")], [fresh_id])
+
+    @override_settings(CHAT_RESULT_TTL_SECONDS=0)
+    def test_results_without_a_ttl_never_expire(self):
+        for store in self.stores:
+            task_id = str(uuid.uuid4())
+            store.save(task_id, {"status": "completed"})
+            self.assertEqual(store.load(task_id), {"status": "completed"})
+            self.assertEqual(store.cleanup(), 0)
+
+    def test_expired_files_are_not_returned(self):
+        store = result_store.FileResultStore(self.directory)
+        store.save("old", {"status": "completed"})
+        store.save("new", {"status": "completed"})
+        stale = time.time() - 2 * result_store._ttl()
+        os.utime(store._path("old"), (stale, stale))
+        self.assertIsNone(store.load("old"))
+        self.assertEqual([item["task_id"] for item in store.query()], ["new"])
+
+    def test_every_backend_filters_by_user(self):
+        other = get_user_model().objects.create_user(email="other@example.com", password="x", name="Other")
+        for store in self.stores + [result_store.FileResultStore(os.path.join(self.directory, "files"))]:
+            mine, theirs, legacy = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+            store.save(mine, {"status": "completed"}, user_id=self.user.pk)
+            store.save(theirs, {"status": "completed"}, user_id=other.pk)
+            store.save(legacy, {"status": "completed"})
+            store.save(mine, {"status": "completed", "summary": "updated"})  # no user: the owner is kept
+            self.assertEqual([item["task_id"] for item in store.query(user_id=self.user.pk)], [mine], store.name)
+            self.assertEqual([item["task_id"] for item in store.query(user_id=other.pk)], [theirs], store.name)
+            self.assertEqual(len(store.query()), 3)
+            self.assertEqual(store.load(mine), {"status": "completed", "summary": "updated"})
+
+    def test_the_results_endpoint_lists_only_the_callers_results(self):
+        other = get_user_model().objects.create_user(email="other@example.com", password="x", name="Other")
+        for kind in ("database", "files"):
+            store = result_store.build_store(kind, directory=os.path.join(self.directory, "endpoint"))
+            previous = result_store.get_store()
+            result_store.set_store(store)
+            self.addCleanup(result_store.set_store, previous)
+            mine = str(uuid.uuid4())
+            store.save(mine, {"status": "completed"}, user_id=self.user.pk)
+            store.save(str(uuid.uuid4()), {"status": "completed"}, user_id=other.pk)
+
+            client = APIClient()
+            client.force_authenticate(self.user)
+            response = client.get("/api/chat/results/")
+            self.assertEqual([item["task_id"] for item in response.json()["results"]], [mine], kind)
+            for limit in ("0", "-1", "abc"):
+                self.assertEqual(client.get(f"/api/chat/results/?limit={limit}").status_code, 400)
+
+    def test_import_command_copies_legacy_files(self):
+        legacy = os.path.join(self.directory, "legacy")
+        os.makedirs(legacy)
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        for task_id in ids:
+            with open(os.path.join(legacy, f"{task_id}.json"), "w") as f:
+                json.dump({"status": "completed", "task": task_id}, f)
+        with open(os.path.join(legacy, "not-a-task.json"), "w") as f:
+            f.write("{}")
+        with open(os.path.join(legacy, f"{uuid.uuid4()}.json"), "w") as f:
+            f.write("{truncated")
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_task_results", dir=legacy, store="database", batch_size=2, delete=True,
+                     stdout=out, stderr=err)
+        self.assertIn("Imported 3 result(s) into the database store (2 skipped)", out.getvalue())
+        store = result_store.DatabaseResultStore()
+        for task_id in ids:
+            self.assertEqual(store.load(task_id), {"status": "completed", "task": task_id})
+        self.assertEqual(len(os.listdir(legacy)), 2)  # only the skipped files are left
+
+        # Files written by the file store keep their owner
+        owned = str(uuid.uuid4())
+        result_store.FileResultStore(legacy).save(owned, {"status": "completed"}, user_id=self.user.pk)
+        call_command("import_task_results", dir=legacy, store="database", stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual([item["task_id"] for item in store.query(user_id=self.user.pk)], [owned])
+        self.assertEqual(store.load(owned), {"status": "completed"})
+
+        # Importing again is an upsert, not a duplicate
+        call_command("import_task_results", dir=legacy, store="database", stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(TaskResult.objects.count(), 4)
+
+
+_VCF = (
+    "##fileformat=VCFv4.2\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    "chr17\t43045712\t.\tG\tA\t.\tPASS\t.\n"
+    "chr13\t32315474\t.\tC\tT,G\t.\tPASS\t.\n"
+    "chr7\t117559590\t.\tATCT\tA\t.\tPASS\t.\n"  # indel: skipped
+)
+
+
+class _CountingLLM:
+    """Stands in for Gemini: counts summary calls and streams a fixed text."""
+
+    def __init__(self):
+        self.calls = []
+
+    def stream(self, messages):
+        self.calls.append(messages)
+        for text in ("Two variants ", "look benign."):
+            yield types.SimpleNamespace(content=text)
+
+
+# 🧪 /api/chat/batch/
+class BatchEndpointTests(TestCase):
+
+    def setUp(self):
+        submit = mock.patch.object(views.pool, "submit")
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+
+    def submitted(self):
+        _task_id, prompt = self.submit.call_args.args
+        return prompt, self.submit.call_args.kwargs["variants"]
+
+    def test_a_vcf_upload_becomes_one_batch_task(self):
+        for name, data in (("panel.vcf", _VCF.encode()), ("panel.vcf.gz", gzip.compress(_VCF.encode()))):
+            response = self.client.post("/api/chat/batch/", {"file": SimpleUploadedFile(name, data)})
+            self.assertEqual(response.status_code, 202, response.content)
+            self.assertEqual(response.json()["variant_count"], 3)
+            prompt, variants = self.submitted()
+            self.assertIn(name, prompt)
+            self.assertEqual([(v["chromosome"], v["variant_position"], v["alternative"]) for v in variants],
+                             [("chr17", 43045712, "A"), ("chr13", 32315474, "T"), ("chr13", 32315474, "G")])
+
+    def test_a_variants_list_becomes_one_batch_task(self):
+        body = {"prompt": "My panel", "variants": [
+            {"chromosome": "chr17", "variant_position": 43045712, "reference": "G", "alternative": "A"},
+            {"chromosome": "chr13", "variant_position": 32315474, "alternative": "T"},
+        ]}
+        response = self.client.post("/api/chat/batch/", body, content_type="application/json")
+        self.assertEqual(response.status_code, 202, response.content)
+        prompt, variants = self.submitted()
+        self.assertEqual((prompt, len(variants)), ("My panel", 2))
+
+    @override_settings(CHAT_BATCH_MAX_VARIANTS=2)
+    def test_more_variants_than_the_limit_are_refused(self):
+        variants = [{"chromosome": "chr1", "variant_position": 1000 + i, "alternative": "A"} for i in range(3)]
+        response = self.client.post("/api/chat/batch/", {"variants": variants}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 2", response.json()["error"])
+        response = self.client.post("/api/chat/batch/", {"file": SimpleUploadedFile("panel.vcf", _VCF.encode())})
+        self.assertEqual(response.status_code, 400)
+        self.submit.assert_not_called()
+
+    def test_bodies_that_are_not_a_json_object_are_refused(self):
+        for body in ("[1, 2]", '"text"', "42", "null", "{not json"):
+            response = self.client.post("/api/chat/batch/", body, content_type="application/json")
+            self.assertEqual(response.status_code, 400, body)
+        self.submit.assert_not_called()
+
+    def test_a_batch_task_makes_one_consolidated_summary_call(self):
+        previous = scoring.get_backend()
+        scoring.set_backend(scoring.LocalHeuristicScoringBackend())
+        self.addCleanup(scoring.set_backend, previous)
+        fake = _CountingLLM()
+        variants = [
+            {"chromosome": "chr17", "variant_position": 43045712, "alternative": "A", "genome": "hg38"},
+            {"chromosome": "chr13", "variant_position": 32315474, "alternative": "T", "genome": "hg38"},
+            {"chromosome": "chr13", "variant_position": 32315475, "alternative": "ATG", "genome": "hg38"},
+        ]
+        task_id = str(uuid.uuid4())
+        with mock.patch.object(pipeline, "llm", fake), override_settings(REFERENCE_GENOMES={}):
+            reference._readers.clear()
+            pipeline.run_task(task_id, "panel", variants=variants)
+
+        self.assertEqual(len(fake.calls), 1)
+        result = pipeline.load_result(task_id)
+        self.assertEqual((result["status"], result["summary"]), ("completed", "Two variants look benign."))
+        self.assertEqual(result["variant_count"], 3)
+        self.assertEqual([entry["error"] is None for entry in result["variants"]], [True, True, False])
+        self.assertEqual({entry["evo2_result"]["backend"] for entry in result["variants"][:2]}, {"local"})
+
+
+def _snv(position, alternative="A", chromosome="chr1"):
+    return VariantInputSchema(chromosome=chromosome, variant_position=position, alternative=alternative, genome="hg38")
+
+
+class _Evo2Stub:
+    """Fake Evo2 deployment: POST / scores one variant (slowly for positions in `slow`),
+    POST /batch answers a {"variants": [...]} list, one result short when it holds `short_for`."""
+
+    def __init__(self):
+        self.slow, self.short_for = set(), None
+        self.in_flight = self.max_in_flight = self.requests = 0
+        stub, lock = self, threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    if self.path == "/batch":
+                        positions = [v["variant_position"] for v in payload["variants"]]
+                        body = [{"position": p} for p in positions]
+                        if stub.short_for in positions:
+                            body = body[:-1]
+                    else:
+                        time.sleep(0.2 if payload["variant_position"] in stub.slow else 0.05)
+                        body = {"position": payload["variant_position"]}
+                finally:
+                    with lock:
+                        stub.in_flight -= 1
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# 🧪 Variant scoring backends
+@override_settings(EVO2_ENDPOINT_URL="http://evo2.invalid/", EVO2_BATCH_ENDPOINT_URL="", EVO2_RECORD_PATH="",
+                   EVO2_REPLAY_MISS="error", CHAT_HEDGE_DEPENDENCIES=[], REFERENCE_GENOMES={})
+class ScoringBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        reference._readers.clear()
+
+    def test_build_backend_picks_the_named_backend(self):
+        recording = os.path.join(self.directory, "evo2.jsonl")
+        open(recording, "w").close()
+        self.assertIsInstance(scoring.build_backend("http"), scoring.HttpScoringBackend)
+        self.assertIsInstance(scoring.build_backend("local"), scoring.LocalHeuristicScoringBackend)
+        replay = scoring.build_backend("replay", path=recording, miss="local")
+        self.assertIsInstance(replay, scoring.ReplayScoringBackend)
+        self.assertIsNotNone(replay.fallback)
+        with self.assertRaisesRegex(ValueError, "Unknown EVO2_BACKEND 'gpu'"):
+            scoring.build_backend("gpu")
+
+    def test_local_backend_is_deterministic_and_evo2_shaped(self):
+        backend = scoring.LocalHeuristicScoringBackend()
+        context = {"reference": "C", "upstream": "ATATATATAT", "downstream": "GCGCGCGCGC"}
+        first = backend.score(_snv(1000, "T"), context)
+        self.assertEqual(first, backend.score(_snv(1000, "T"), context))
+        self.assertEqual(first, asyncio.run(backend.ascore(_snv(1000, "T"), context)))
+        for key in ("reference", "alternative", "position", "delta_score", "prediction", "classification_confidence"):
+            self.assertIn(key, first)
+        self.assertEqual((first["reference"], first["alternative"], first["position"]), ("C", "T", 1000))
+        self.assertTrue(first["features"]["cpg"] and first["features"]["transition"])
+        self.assertIn(first["prediction"], ("Likely pathogenic", "Likely benign"))
+        # A transversion at the same site is scored as more disruptive
+        self.assertLess(backend.score(_snv(1000, "A"), context)["delta_score"], first["delta_score"])
+
+    def test_recordings_replay_and_misses_follow_the_miss_mode(self):
+        path = os.path.join(self.directory, "evo2.jsonl")
+        recorder = scoring.Recorder(path)
+        recorder.write(_snv(1000), {"delta_score": -0.1, "recorded": 1})
+        recorder.write(_snv(1000, chromosome="1"), {"delta_score": -0.2, "recorded": 2})  # same variant, later
+
+        strict = scoring.ReplayScoringBackend(path, miss="error")
+        self.assertEqual(strict.score(_snv(1000)), {"delta_score": -0.2, "recorded": 2})
+        with self.assertRaisesRegex(LookupError, "No recorded Evo2 response"):
+            strict.score(_snv(2000))
+        [(result, error)] = strict.score_many([_snv(2000)])
+        self.assertIsNone(result)
+        self.assertIn("No recorded Evo2 response", error)
+
+        lenient = scoring.ReplayScoringBackend(path, miss="local")
+        self.assertEqual(lenient.score(_snv(2000))["backend"], "local")
+
+    def test_http_backend_keeps_input_order_and_honors_concurrency(self):
+        stub = _Evo2Stub()
+        self.addCleanup(stub.close)
+        stub.slow = {1000, 1002}
+        backend = scoring.HttpScoringBackend(stub.url + "/", concurrency=2)
+        positions = list(range(1000, 1006))
+        rows = backend.score_many([_snv(p) for p in positions])
+        self.assertEqual([result["position"] for result, _ in rows], positions)
+        self.assertEqual([error for _, error in rows], [None] * 6)
+        self.assertEqual(stub.max_in_flight, 2)
+
+    def test_a_short_batch_response_fails_only_its_chunk(self):
+        stub = _Evo2Stub()
+        self.addCleanup(stub.close)
+        stub.short_for = 1003
+        backend = scoring.HttpScoringBackend(stub.url + "/", batch_url=stub.url + "/batch", batch_size=2)
+        rows = backend.score_many([_snv(p) for p in range(1000, 1006)])
+        self.assertEqual(stub.requests, 3)
+        self.assertEqual([result and result["position"] for result, _ in rows], [1000, 1001, None, None, 1004, 1005])
+        self.assertIn("does not match the request", rows[2][1])
+        self.assertEqual(rows[3][1], rows[2][1])
+
+    def test_http_results_are_recorded_for_replay(self):
+        stub = _Evo2Stub()
+        self.addCleanup(stub.close)
+        path = os.path.join(self.directory, "recorded.jsonl")
+        backend = scoring.HttpScoringBackend(stub.url + "/", record_path=path)
+        backend.score_many([_snv(1000), _snv(1001)])
+        replay = scoring.ReplayScoringBackend(path)
+        self.assertEqual(replay.score(_snv(1001)), {"position": 1001})
+
+
+# 🧪 Two-tier LLM response cache
+@override_settings(LLM_CACHE_ENABLED=True, LLM_CACHE_TTL_SECONDS=3600, LLM_CACHE_MAX_ENTRIES=100)
+class LLMCacheTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(llm_cache, "counters", llm_cache._Counters())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prompt_tier_ignores_whitespace_and_case(self):
+        key = llm_cache.prompt_key(pipeline.extraction_messages("What does  chr12:43119628 G>A do?"), "gemini")
+        llm_cache.put(key, llm_cache.PROMPT, "gemini", '{"chromosome": "chr12"}', tokens=120)
+        same = llm_cache.prompt_key(pipeline.extraction_messages("what does chr12:43119628 g>a DO?\n"), "gemini")
+        self.assertEqual(llm_cache.get(same, llm_cache.PROMPT), '{"chromosome": "chr12"}')
+        other = llm_cache.prompt_key(pipeline.extraction_messages("What does chr12:43119629 G>A do?"), "gemini")
+        self.assertIsNone(llm_cache.get(other, llm_cache.PROMPT))
+        self.assertNotEqual(key, llm_cache.prompt_key(pipeline.extraction_messages("What does chr12:43119628 G>A do?"),
+                                                      "another-model"))
+
+    def test_variant_tier_ignores_the_wording_of_the_question(self):
+        evo2 = {"delta_score": -0.004, "prediction": "Likely pathogenic"}
+        first = variant_parser.parse("what does chr12:43119628 G>A do?")
+        second = variant_parser.parse("Is 12-43119628-G-A pathogenic?")
+        llm_cache.put(pipeline.summary_cache_key([(first, evo2)]), llm_cache.VARIANT, "gemini", "Summary", tokens=300)
+        self.assertEqual(llm_cache.get(pipeline.summary_cache_key([(second, evo2)]), llm_cache.VARIANT), "Summary")
+        # A different Evo2 result is a different summary
+        changed = {**evo2, "delta_score": -0.0001}
+        self.assertIsNone(llm_cache.get(pipeline.summary_cache_key([(second, changed)]), llm_cache.VARIANT))
+
+    def test_a_template_edit_changes_the_key(self):
+        variant, evo2 = _snv(1000), {"delta_score": -0.001}
+        template = pipeline.summary_messages({}, {})
+        edited = [type(m)(content=m.content + " Mention the gene.") for m in template]
+        self.assertNotEqual(llm_cache.variant_key(template, [(variant, evo2)], "gemini"),
+                            llm_cache.variant_key(edited, [(variant, evo2)], "gemini"))
+        self.assertEqual(pipeline.summary_cache_key([(variant, evo2)]),
+                         llm_cache.variant_key(template, [(variant, evo2)], pipeline.model_name()))
+        self.assertNotEqual(pipeline.summary_cache_key([(variant, evo2)]),
+                            pipeline.summary_cache_key([(variant, evo2)], batch=True))
+
+    def test_expired_entries_are_misses(self):
+        llm_cache.put("k", llm_cache.PROMPT, "gemini", "old answer", tokens=10)
+        LLMResponseCache.objects.filter(key="k").update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertIsNone(llm_cache.get("k", llm_cache.PROMPT))
+        self.assertFalse(LLMResponseCache.objects.filter(key="k").exists())
+        with override_settings(LLM_CACHE_TTL_SECONDS=0):  # no TTL: entries never expire
+            llm_cache.put("k", llm_cache.PROMPT, "gemini", "answer", tokens=10)
+            LLMResponseCache.objects.filter(key="k").update(created_at=timezone.now() - timedelta(days=365))
+            self.assertEqual(llm_cache.get("k", llm_cache.PROMPT), "answer")
+
+    @override_settings(LLM_CACHE_MAX_ENTRIES=3)
+    def test_evict_drops_the_least_recently_used(self):
+        for i in range(3):
+            llm_cache.put(f"k{i}", llm_cache.PROMPT, "gemini", f"answer {i}", tokens=10)
+            LLMResponseCache.objects.filter(key=f"k{i}").update(last_used_at=timezone.now() - timedelta(minutes=10 - i))
+        llm_cache.get("k0", llm_cache.PROMPT)  # k0 becomes the most recently used
+        llm_cache.put("k3", llm_cache.PROMPT, "gemini", "answer 3", tokens=10)
+        self.assertEqual(sorted(LLMResponseCache.objects.values_list("key", flat=True)), ["k0", "k2", "k3"])
+        self.assertEqual(llm_cache.stats()["evictions"], 1)
+
+    def test_hits_add_up_to_tokens_saved_and_hit_rates(self):
+        llm_cache.put("p", llm_cache.PROMPT, "gemini", "extraction", tokens=100)
+        llm_cache.put("v", llm_cache.VARIANT, "gemini", "summary", tokens=400)
+        for _ in range(2):
+            llm_cache.get("p", llm_cache.PROMPT)
+        llm_cache.get("missing", llm_cache.PROMPT)
+        llm_cache.get("v", llm_cache.VARIANT)
+        stats = llm_cache.stats()
+        self.assertEqual(stats["tokens_saved"], 2 * 100 + 400)
+        self.assertEqual((stats["prompt"]["hits"], stats["prompt"]["misses"], stats["prompt"]["hit_rate"]), (2, 1, 0.6667))
+        self.assertEqual(stats["variant"]["hit_rate"], 1.0)
+        self.assertEqual(stats["hit_rate"], 0.75)
+        self.assertEqual((stats["stores"], stats["entries"]), (2, 2))
+        self.assertEqual((stats["lifetime_hits"], stats["lifetime_tokens_saved"]), (3, 600))
+
+    @override_settings(LLM_CACHE_ENABLED=False)
+    def test_a_disabled_cache_stores_and_serves_nothing(self):
+        llm_cache.put("k", llm_cache.PROMPT, "gemini", "answer", tokens=10)
+        self.assertIsNone(llm_cache.get("k", llm_cache.PROMPT))
+        self.assertFalse(LLMResponseCache.objects.exists())
+
+
+class _AsyncLLM:
+    """Gemini stand-in for the asyncio pipeline: records the summary prompts, streams a fixed text."""
+
+    def __init__(self):
+        self.summaries = 0
+
+    async def ainvoke(self, messages):
+        raise AssertionError("well-formed notations are parsed locally")
+
+    async def astream(self, messages):
+        self.summaries += 1
+        for text in ("Likely ", "benign."):
+            yield types.SimpleNamespace(content=text)
+
+
+# 🧪 asyncio pipeline (CHAT_PIPELINE="asyncio")
+@override_settings(REFERENCE_GENOMES={}, CHAT_HEDGE_DEPENDENCIES=[])
+class AsyncPipelineTests(TransactionTestCase):
+
+    def setUp(self):
+        reference._readers.clear()
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        previous = scoring.get_backend()
+        self.addCleanup(scoring.set_backend, previous)
+
+    @override_settings(CHAT_ASYNC_MAX_IN_FLIGHT=1)
+    def test_submit_admits_up_to_the_in_flight_limit(self):
+        release = asyncio.Event()
+
+        async def hold(task_id, user_prompt):
+            await release.wait()
+
+        async def scenario():
+            with mock.patch.object(pipeline_async, "_run_and_record", hold):
+                admitted = pipeline_async.submit(str(uuid.uuid4()), "chr1:1000 A>G")
+                request = AsyncRequestFactory().post("/api/chat/", {"prompt": "chr1:2000 A>G"},
+                                                     content_type="application/json")
+                request.user = AnonymousUser()
+                busy = await views.llm_analysis_router_async(request)
+                in_flight = pipeline_async.in_flight()
+                release.set()
+                await asyncio.sleep(0)
+                await asyncio.gather(*pipeline_async._tasks)
+                return admitted, busy, in_flight
+
+        admitted, busy, in_flight = asyncio.run(scenario())
+        self.assertTrue(admitted)
+        self.assertEqual(in_flight, 1)
+        self.assertEqual(busy.status_code, 429)
+        self.assertEqual(pipeline_async.in_flight(), 0)
+
+    def test_failures_are_recorded(self):
+        task_id = str(uuid.uuid4())
+
+        async def fail(task_id, user_prompt):
+            raise RuntimeError("Evo2 is down")
+
+        with mock.patch.object(pipeline_async, "run_analysis_async", fail):
+            asyncio.run(pipeline_async._run_and_record(task_id, "chr1:1000 A>G"))
+        self.assertEqual(pipeline.load_result(task_id), {"status": "error", "error": "Evo2 is down"})
+        self.assertEqual(progress.current(task_id, pipeline.load_result), ChatTask.FAILED)
+
+    def test_connection_pools_are_reused_per_event_loop(self):
+        async def shards():
+            first, second = pipeline_async._get_shards(), pipeline_async._get_shards()
+            clients = [client for client, _ in first]
+            return first is second, clients
+
+        same_loop, clients = asyncio.run(shards())
+        self.assertTrue(same_loop)
+        _, other_clients = asyncio.run(shards())  # a new loop gets its own pools
+        self.assertTrue(set(map(id, clients)).isdisjoint(map(id, other_clients)))
+
+        async def close(pool):
+            for client in pool:
+                await client.aclose()
+
+        asyncio.run(close(clients + other_clients))
+
+    def test_an_analysis_runs_end_to_end_on_the_event_loop(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "evo2.jsonl")
+        recorded = {"delta_score": -0.0002, "prediction": "Likely benign", "classification_confidence": 0.7}
+        scoring.Recorder(path).write(_snv(43119628, "A", chromosome="chr12"), recorded)
+        scoring.set_backend(scoring.ReplayScoringBackend(path, miss="error"))
+        fake, task_id = _AsyncLLM(), str(uuid.uuid4())
+
+        with mock.patch.object(pipeline, "llm", fake):
+            asyncio.run(pipeline_async._run_and_record(task_id, "What does chr12:43119628 G>A do?"))
+
+        result = pipeline.load_result(task_id)
+        self.assertEqual(result["status"], "completed", result)
+        self.assertEqual(result["evo2_result"], recorded)
+        self.assertFalse(result["evo2_cached"])
+        self.assertEqual((result["variant_data"]["chromosome"], result["variant_data"]["variant_position"]),
+                         ("chr12", 43119628))
+        self.assertEqual(result["summary"], "Likely benign.")
+        self.assertEqual(fake.summaries, 1)
+        self.assertEqual(progress.current(task_id, pipeline.load_result), ChatTask.COMPLETED)
+
+        # A replay miss is a recorded failure, not an exception out of the task
+        missing = str(uuid.uuid4())
+        with mock.patch.object(pipeline, "llm", fake):
+            asyncio.run(pipeline_async._run_and_record(missing, "chr12:43119629 C>T"))
+        self.assertEqual(pipeline.load_result(missing)["status"], "error")
+        self.assertIn("No recorded Evo2 response", pipeline.load_result(missing)["error"])
@@ -1,8 +1,20 @@
 # disease/urls.py
+from django.conf import settings
 from django.urls import path
-from .views import llm_analysis_router , get_task_status
+from .views import llm_analysis_router , llm_analysis_router_async, batch_analysis_router, get_task_status, stream_task_status, list_task_results, variant_cache_stats, llm_cache_stats, variant_parser_stats, resilience_stats, task_queue_stats
+
+# "asyncio" serves /api/chat/ from the event loop (requires running under asgi.py)
+chat_view = llm_analysis_router_async if getattr(settings, "CHAT_PIPELINE", "pool") == "asyncio" else llm_analysis_router
 
 urlpatterns = [
-    path('chat/', llm_analysis_router, name='Evo-Chat'),
+    path('chat/', chat_view, name='Evo-Chat'),
+    path('chat/batch/', batch_analysis_router, name='Evo-Chat-Batch'),
     path("status/<uuid:task_id>/", get_task_status),
+    path("status/<uuid:task_id>/stream/", stream_task_status),
+    path("chat/results/", list_task_results),
+    path("chat/cache-stats/", variant_cache_stats),
+    path("chat/llm-cache-stats/", llm_cache_stats),
+    path("chat/parser-stats/", variant_parser_stats),
+    path("chat/resilience-stats/", resilience_stats),
+    path("chat/queue-stats/", task_queue_stats),
 ]
@@ -0,0 +1,156 @@
+# chatbot/variant_cache.py
+"""
+Persistent Evo2 result cache keyed on the normalized variant.
+
+'12', 'chr12' and 'CHR12' all map to 'chr12', alleles are upper-cased, so the
+same variant asked in different spellings only costs one Evo2 call. Entries
+expire after EVO2_CACHE_TTL_SECONDS and the table is trimmed LRU-first to
+EVO2_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import VariantResultCache
+from .schema import VariantInputSchema
+
+_CHROMOSOME_ALIASES = {"MT": "M", "23": "X", "24": "Y"}
+
+
+def normalize_chromosome(chromosome):
+    """'12' / 'chr12' / 'Chr12' -> 'chr12'; 'MT' -> 'chrM'."""
+    value = str(chromosome).strip()
+    if value.lower().startswith("chr"):
+        value = value[3:]
+    value = value.upper()
+    return "chr" + _CHROMOSOME_ALIASES.get(value, value)
+
+
+def normalize_variant(variant):
+    """Return a normalized VariantInputSchema (accepts a schema instance or a dict)."""
+    data = variant.model_dump() if isinstance(variant, VariantInputSchema) else dict(variant)
+    data["chromosome"] = normalize_chromosome(data["chromosome"])
+    data["alternative"] = str(data["alternative"]).strip().upper()
+    reference = getattr(variant, "reference", None) if isinstance(variant, VariantInputSchema) else data.get("reference")
+    data["reference"] = str(reference).strip().upper() if reference else None
+    return VariantInputSchema(**data)
+
+
+def cache_key(variant):
+    v = normalize_variant(variant)
+    raw = f"{v.genome}:{v.chromosome}:{v.variant_position}:{v.alternative}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def incr(self, field, n=1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + n)
+
+
+counters = _Counters()
+
+
+def enabled():
+    return getattr(settings, "EVO2_CACHE_ENABLED", True)
+
+
+def get(variant):
+    """Cached Evo2 result for this variant, or None on miss / expiry."""
+    if not enabled():
+        return None
+    key = cache_key(variant)
+    entry = VariantResultCache.objects.filter(key=key).first()
+    if entry is None:
+        counters.incr("misses")
+        return None
+
+    ttl = getattr(settings, "EVO2_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+    if ttl and entry.created_at < timezone.now() - timedelta(seconds=ttl):
+        entry.delete()
+        counters.incr("expired")
+        counters.incr("misses")
+        return None
+
+    VariantResultCache.objects.filter(pk=entry.pk).update(hit_count=F("hit_count") + 1, last_used_at=timezone.now())
+    counters.incr("hits")
+    return entry.result
+
+
+def _fit(field, value):
+    """Clip a descriptive column to its max_length (the full value is in the key hash), so a long
+    allele can never fail the INSERT on databases that enforce varchar lengths."""
+    return value[:VariantResultCache._meta.get_field(field).max_length]
+
+
+def put(variant, result):
+    if not enabled():
+        return
+    v = normalize_variant(variant)
+    now = timezone.now()
+    try:
+        VariantResultCache.objects.update_or_create(
+            key=cache_key(v),
+            defaults={
+                "chromosome": _fit("chromosome", v.chromosome),
+                "variant_position": v.variant_position,
+                "alternative": _fit("alternative", v.alternative),
+                "genome": v.genome,
+                "result": result,
+                "created_at": now,
+                "last_used_at": now,
+            },
+        )
+    except IntegrityError:
+        return  # stored concurrently by another task
+    counters.incr("stores")
+    evict()
+
+
+def evict():
+    """Drop expired entries, then the least recently used beyond EVO2_CACHE_MAX_ENTRIES."""
+    removed = 0
+    ttl = getattr(settings, "EVO2_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+    if ttl:
+        removed += VariantResultCache.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()[0]
+
+    max_entries = getattr(settings, "EVO2_CACHE_MAX_ENTRIES", 50000)
+    excess = VariantResultCache.objects.count() - max_entries
+    if excess > 0:
+        stale = list(VariantResultCache.objects.order_by("last_used_at").values_list("pk", flat=True)[:excess])
+        removed += VariantResultCache.objects.filter(pk__in=stale).delete()[0]
+
+    if removed:
+        counters.incr("evictions", removed)
+    return removed
+
+
+def stats():
+    with counters.lock:
+        hits, misses = counters.hits, counters.misses
+        snapshot = {
+            "hits": hits,
+            "misses": misses,
+            "expired": counters.expired,
+            "stores": counters.stores,
+            "evictions": counters.evictions,
+        }
+    lookups = hits + misses
+    snapshot["hit_rate"] = round(hits / lookups, 4) if lookups else None
+    snapshot["entries"] = VariantResultCache.objects.count()
+    snapshot["lifetime_hits"] = VariantResultCache.objects.aggregate(total=Sum("hit_count"))["total"] or 0
+    snapshot["enabled"] = enabled()
+    return snapshot
@@ -0,0 +1,233 @@
+# chatbot/variant_parser.py
+"""
+Local parser for variant notations, tried before asking Gemini to extract one.
+
+Recognised (case-insensitive, anywhere in the prompt):
+
+* `chr12:43119628 G>A`, `12:43119628G>A`, `chr12:g.43119628G>A`
+* HGVS genomic on RefSeq accessions: `NC_000012.12:g.43119628G>A`
+  (the accession version also tells us the assembly)
+* VCF-like: `chr12 43119628 G A`, `12-43119628-G-A`, `chr12:43119628:G:A`
+  (an rsID column between position and REF is allowed)
+
+Only single-nucleotide variants (one A/C/G/T on each side) take this path:
+Evo2 scores SNVs, so indels and multi-base / N alleles are left to the LLM
+(and then refused by reference.validate with a clear message).
+
+The genome is taken from an hg19/hg38/GRCh37/GRCh38 mention (or the
+accession), defaulting to hg38 like the schema. A prompt that mentions more
+than one distinct variant, or none we can read with confidence, returns
+None and goes to the LLM as before; `parse_all()` / `parse_vcf()` feed
+batch mode instead.
+"""
+import re
+import threading
+
+from django.conf import settings
+from pydantic import ValidationError
+
+from .schema import VariantInputSchema
+from . import variant_cache
+
+_ALLELE = r"[ACGT]"  # one base: SNVs only
+_ALLELE_UPPER = r"(?-i:[ACGT])"  # bare VCF-like columns must be upper case, or prose like "2 10 a c" would match
+_CHROM = r"(?:chr)?(?:[1-9]|1[0-9]|2[0-2]|X|Y|M|MT)"
+
+# chr12:43119628 G>A / chr12:g.43119628G>A / 12:43119628G>A
+_COLON_ARROW = re.compile(
+    rf"(?<![.\w])(?P<chrom>{_CHROM}):(?:g\.)?(?P<pos>\d[\d,]*)\s*(?P<ref>{_ALLELE})\s*>\s*(?P<alt>{_ALLELE})\b",
+    re.IGNORECASE,
+)
+# NC_000012.12:g.43119628G>A
+_HGVS_REFSEQ = re.compile(
+    rf"\b(?P<acc>NC_0000(?P<num>\d\d)\.(?P<ver>\d+)):g\.(?P<pos>\d+)(?P<ref>{_ALLELE})>(?P<alt>{_ALLELE})\b",
+    re.IGNORECASE,
+)
+# chr12 43119628 G A / 12-43119628-G-A / chr12:43119628:G:A (optionally with an rsID before REF)
+_VCF_LIKE = re.compile(
+    rf"(?<![.\w])(?P<chrom>{_CHROM})[\s:\-_]+(?P<pos>\d+)[\s:\-_]+(?:rs\d+[\s:\-_]+)?"
+    rf"(?P<ref>{_ALLELE_UPPER})[\s:\-_/]+(?P<alt>{_ALLELE_UPPER})\b",
+    re.IGNORECASE,
+)
+_GENOME = re.compile(r"\b(hg19|hg38|grch37|grch38)\b", re.IGNORECASE)
+_GENOME_ALIASES = {"hg19": "hg19", "grch37": "hg19", "hg38": "hg38", "grch38": "hg38"}
+
+# RefSeq chromosome accession versions per assembly (NC_0000<num>.<version>)
+_REFSEQ_VERSIONS = {
+    "hg38": {1: 11, 2: 12, 3: 12, 4: 12, 5: 10, 6: 12, 7: 14, 8: 11, 9: 12, 10: 11, 11: 10, 12: 12,
+             13: 11, 14: 9, 15: 10, 16: 10, 17: 11, 18: 10, 19: 10, 20: 11, 21: 9, 22: 11, 23: 11, 24: 10},
+    "hg19": {1: 10, 2: 11, 3: 11, 4: 11, 5: 9, 6: 11, 7: 13, 8: 10, 9: 11, 10: 10, 11: 9, 12: 11,
+             13: 10, 14: 8, 15: 9, 16: 9, 17: 10, 18: 9, 19: 9, 20: 10, 21: 8, 22: 10, 23: 10, 24: 9},
+}
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parsed = 0
+        self.fallbacks = 0
+        self.by_notation = {}
+        self.llm_seconds = 0.0  # time spent in LLM extraction on fallbacks, to estimate what parsing saved
+
+    def hit(self, notation):
+        with self.lock:
+            self.parsed += 1
+            self.by_notation[notation] = self.by_notation.get(notation, 0) + 1
+
+    def miss(self):
+        with self.lock:
+            self.fallbacks += 1
+
+
+counters = _Counters()
+
+
+def _candidates(text):
+    """(notation, chromosome, position, ref, alt, genome or None) for every match, in text order."""
+    matches = []
+    for m in _HGVS_REFSEQ.finditer(text):
+        num, ver = int(m["num"]), int(m["ver"])
+        genome = next((g for g, versions in _REFSEQ_VERSIONS.items() if versions.get(num) == ver), None)
+        if genome is None:
+            continue  # unknown accession/version: can't place it safely
+        chromosome = {23: "X", 24: "Y"}.get(num, str(num))
+        matches.append((m.start(), "hgvs", chromosome, m["pos"], m["ref"], m["alt"], genome))
+    for m in _COLON_ARROW.finditer(text):
+        matches.append((m.start(), "colon", m["chrom"], m["pos"], m["ref"], m["alt"], None))
+    for m in _VCF_LIKE.finditer(text):
+        matches.append((m.start(), "vcf", m["chrom"], m["pos"], m["ref"], m["alt"], None))
+    return [match[1:] for match in sorted(matches, key=lambda match: match[0])]
+
+
+def _scan(text):
+    """{(chromosome, position, alt, genome): (notation, ref)} in text order, or None when the assembly is ambiguous."""
+    mentioned = {_GENOME_ALIASES[g.lower()] for g in _GENOME.findall(text)}
+    found = {}
+    for notation, chromosome, position, ref, alt, genome in _candidates(text):
+        position = int(position.replace(",", ""))
+        if position <= 0 or ref.upper() == alt.upper():
+            continue
+        if genome is None:
+            if len(mentioned) > 1:
+                return None  # "lift hg19 to hg38"-style prompts are for the LLM
+            genome = next(iter(mentioned), "hg38")
+        key = (variant_cache.normalize_chromosome(chromosome), position, alt.upper(), genome)
+        found.setdefault(key, (notation, ref.upper()))
+    return found
+
+
+def _to_schema(key, ref=None):
+    chromosome, position, alt, genome = key
+    try:
+        return VariantInputSchema(
+            chromosome=chromosome, variant_position=position, alternative=alt, genome=genome, reference=ref,
+        )
+    except ValidationError:
+        return None
+
+
+def enabled():
+    return getattr(settings, "CHAT_PRE_PARSER_ENABLED", True)
+
+
+def parse(text):
+    """Normalized VariantInputSchema if `text` names exactly one variant we can read, else None."""
+    if not enabled():
+        return None
+    found = _scan(text)
+    if not found or len(found) != 1:
+        return _fallback()
+
+    key, (notation, ref) = next(iter(found.items()))
+    variant = _to_schema(key, ref)
+    if variant is None:
+        return _fallback()
+    counters.hit(notation)
+    return variant
+
+
+def parse_all(text):
+    """Every distinct variant in `text`, in order (batch mode); [] when none can be read with confidence."""
+    if not enabled():
+        return []
+    found = _scan(text)
+    variants = [v for v in (_to_schema(key, ref) for key, (_, ref) in (found or {}).items()) if v is not None]
+    if variants:
+        counters.hit("multi")
+    else:
+        counters.miss()
+    return variants
+
+
+def count_variants(text):
+    """How many distinct variants `text` names (0 if unreadable); no counters touched."""
+    return len(_scan(text) or {}) if enabled() else 0
+
+
+def parse_vcf(lines, default_genome="hg38", limit=None):
+    """SNVs from VCF text lines (str or bytes). Multi-allelic ALTs become one variant each;
+    indels, symbolic / breakend ALTs ('<DEL>', 'N[chr2:321[') and '.' are skipped. Raises ValueError on
+    malformed lines or more than `limit` variants."""
+    genome = default_genome
+    variants, seen = [], set()
+    for raw in lines:
+        line = raw.decode("utf-8", "replace") if isinstance(raw, bytes) else raw
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if line.startswith("##"):
+            mentioned = _GENOME.search(line) if line.lower().startswith(("##reference", "##assembly")) else None
+            if mentioned:
+                genome = _GENOME_ALIASES[mentioned.group(1).lower()]
+            continue
+        if line.startswith("#"):
+            continue
+
+        columns = line.split("\t")
+        if len(columns) < 5:
+            raise ValueError(f"Malformed VCF line (expected at least 5 tab-separated columns): {line[:80]}")
+        chromosome, position, _id, ref, alts = columns[:5]
+        if not position.isdigit():
+            raise ValueError(f"Malformed VCF position '{position}'")
+        if not re.fullmatch(_ALLELE, ref, re.IGNORECASE):
+            continue  # multi-base REF: deletion / MNV
+        for alt in alts.split(","):
+            alt = alt.strip().upper()
+            if not re.fullmatch(_ALLELE, alt, re.IGNORECASE) or alt == ref.upper():
+                continue
+            key = (variant_cache.normalize_chromosome(chromosome), int(position), alt, genome)
+            if key not in seen:
+                seen.add(key)
+                variant = _to_schema(key, ref.upper())
+                if variant is not None:
+                    variants.append(variant)
+                if limit and len(variants) > limit:
+                    raise ValueError(f"VCF has more than {limit} variants")
+    return variants
+
+
+def _fallback():
+    counters.miss()
+    return None
+
+
+def record_llm_extraction(seconds):
+    with counters.lock:
+        counters.llm_seconds += seconds
+
+
+def stats():
+    with counters.lock:
+        parsed, fallbacks = counters.parsed, counters.fallbacks
+        by_notation = dict(counters.by_notation)
+        llm_seconds = counters.llm_seconds
+    total = parsed + fallbacks
+    avg_llm = llm_seconds / fallbacks if fallbacks else None
+    return {
+        "llm_calls_saved": parsed,
+        "llm_fallbacks": fallbacks,
+        "parse_rate": round(parsed / total, 4) if total else None,
+        "by_notation": by_notation,
+        "avg_llm_extraction_s": round(avg_llm, 3) if avg_llm is not None else None,
+        "est_seconds_saved": round(avg_llm * parsed, 1) if avg_llm is not None else None,
+    }
@@ -1,157 +1,403 @@
+import gzip
+import io
 import json
 import threading
-import requests
 import time
 import uuid
-import os
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from pydantic import BaseModel, Field, ValidationError
-from typing import Literal
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from dotenv import load_dotenv
+from asgiref.sync import sync_to_async
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from pydantic import ValidationError
+from .models import ChatTask
+from .schema import VariantInputSchema
+from .pipeline import load_result, pool, save_result
+from .result_store import get_store, parse_since
+from .tasks import QueueFull
+from . import llm_cache, pipeline_async, progress, resilience, variant_cache, variant_parser
 
-load_dotenv()
 
-# 🌐 Evo2 model endpoint
-EVO2_ENDPOINT_URL = "https://anmol1140w--variant-analysis-evo2-evo2model-analyze-sing-4a3d81.modal.run"
+def _read_prompt(request):
+    """Returns (prompt, None) or (None, error response)."""
+    if request.method != "POST":
+        return None, JsonResponse({"error": "POST required"}, status=405)
 
-# 🧠 Gemini LLM
-llm = ChatGoogleGenerativeAI(model="models/gemini-2.0-flash", temperature=0.2)
+    try:
+        data = json.loads(request.body)
+        user_prompt = data.get("prompt", "").strip()
+        if not user_prompt:
+            return None, JsonResponse({"error": "Missing 'prompt'"}, status=400)
+    except json.JSONDecodeError:
+        return None, JsonResponse({"error": "Invalid JSON"}, status=400)
+    return user_prompt, None
 
-# ✅ Pydantic Schema for structured variant data
-class VariantInputSchema(BaseModel):
-    chromosome: str = Field(..., description="Chromosome, e.g., 'chr12'")
-    variant_position: int = Field(..., description="Variant position")
-    alternative: str = Field(..., description="Alternative allele")
-    genome: Literal["hg38", "hg19"] = Field("hg38", description="Genome build")
 
-# 🗂️ Directory for persistent task results
-RESULTS_DIR = os.path.join(os.path.dirname(__file__), "task_results")
-os.makedirs(RESULTS_DIR, exist_ok=True)
+def _request_user_id(request):
+    """Session user, or the bearer of a valid JWT (these are plain Django views, not DRF ones)."""
+    if request.user.is_authenticated:
+        return request.user.pk
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except Exception:
+        return None
+    return authenticated[0].pk if authenticated else None
 
 
-def save_result(task_id, data):
-    """Save result JSON to a file."""
-    with open(os.path.join(RESULTS_DIR, f"{task_id}.json"), "w") as f:
-        json.dump(data, f)
+def _busy_response():
+    response = JsonResponse({
+        "error": "Server busy, too many analyses in progress. Please retry shortly.",
+    }, status=429)
+    response["Retry-After"] = str(getattr(settings, "CHAT_RETRY_AFTER_SECONDS", 10))
+    return response
 
 
-def load_result(task_id):
-    """Load result JSON if exists."""
-    file_path = os.path.join(RESULTS_DIR, f"{task_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            return json.load(f)
-    return None
+def _accepted_response(task_id, **extra):
+    return JsonResponse({
+        **extra,
+        "task_id": task_id,
+        "status": "processing",
+        "message": "🧬 Analysis started. Follow progress at /api/status/<task_id>/stream/ (or poll /api/status/<task_id>/)",
+    }, status=202)
 
 
-# 🧩 Background Worker Function
-def background_analysis_task(task_id, user_prompt):
-    print(f"🚀 Started background task {task_id}")
+# 🌐 Route: Start a new analysis
+@csrf_exempt
+def llm_analysis_router(request):
+    user_prompt, error = _read_prompt(request)
+    if error:
+        return error
+
+    # Generate unique task ID
+    task_id = str(uuid.uuid4())
+
+    # Tie the result to the user up front (before a worker can finish it) so it shows in /api/chat/results/
+    user_id = _request_user_id(request)
+    if user_id:
+        save_result(task_id, {"status": "processing"}, user_id=user_id)
+
+    # Queue for the bounded worker pool (429 when the backlog is full); several variants -> one batch task
+    variants = [] if variant_parser.count_variants(user_prompt) > 1 else None
     try:
-        # STEP 1️⃣ - Extract structured variant data
-        system_extract = SystemMessage(content=(
-            "You are a DNA variant extractor. Extract variant details as JSON "
-            "with keys: chromosome, variant_position, alternative, genome. "
-            "Output valid JSON only, no explanations."
-        ))
-        human_message = HumanMessage(content=user_prompt)
-        response = llm.invoke([system_extract, human_message])
-        raw_output = response.content.strip()
-        print(f"🧬 Gemini Raw Output: {raw_output}")
-
-        # Try parsing Gemini output as JSON
-        try:
-            extracted = json.loads(raw_output)
-        except json.JSONDecodeError:
-            import re
-            match = re.search(r"\{.*\}", raw_output, re.DOTALL)
-            extracted = json.loads(match.group(0)) if match else {}
-
-        # Validate via schema
-        extracted_variant = VariantInputSchema(**extracted)
-        payload = extracted_variant.model_dump()
-        print(f"✅ Extracted Variant JSON: {payload}")
-
-        # STEP 2️⃣ - Call Evo2 Model
-        print(f"📤 Sending to Evo2 ({EVO2_ENDPOINT_URL}) with 90s timeout: {payload}")
-        evo_response = requests.post(
-            EVO2_ENDPOINT_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=90,
-        )
-        evo_response.raise_for_status()
-        evo_result = evo_response.json()
-        print(f"✅ Evo2 API Response: {evo_result}")
-
-        # STEP 3️⃣ - Generate a human summary
-        summary_prompt = f"""
-        Write a clear, short medical summary for this variant analysis.
-        Include chromosome, variant, classification, and interpretation.
-        Variant Data: {json.dumps(payload)}
-        Evo2 Result: {json.dumps(evo_result)}
-        """
-
-        summary_response = llm.invoke([
-            SystemMessage(content="You are a medical report generator. Respond with one coherent paragraph."),
-            HumanMessage(content=summary_prompt),
-        ])
-        summary_text = summary_response.content.strip()
-
-        # ✅ Store final result persistently
-        save_result(task_id, {
-            "status": "completed",
-            "variant_data": payload,
-            "evo2_result": evo_result,
-            "summary": summary_text,
-        })
-
-        print(f"✅ Task {task_id} completed successfully.")
-    except Exception as e:
-        print(f"❌ Task {task_id} failed: {e}")
-        save_result(task_id, {"status": "error", "error": str(e)})
+        pool.submit(task_id, user_prompt, variants=variants)
+    except QueueFull:
+        if user_id:
+            save_result(task_id, {"status": "error", "error": "Server busy"})
+        return _busy_response()
 
+    # Respond instantly
+    return _accepted_response(task_id)
 
-# 🌐 Route: Start a new analysis
+
+# 🌐 Route: Start a new analysis on the asyncio pipeline (ASGI only, CHAT_PIPELINE = "asyncio")
 @csrf_exempt
-def llm_analysis_router(request):
-    if request.method != "POST":
-        return JsonResponse({"error": "POST required"}, status=405)
+async def llm_analysis_router_async(request):
+    user_prompt, error = _read_prompt(request)
+    if error:
+        return error
+
+    task_id = str(uuid.uuid4())
+    user_id = await sync_to_async(_request_user_id)(request)
+    if user_id:
+        await sync_to_async(save_result)(task_id, {"status": "processing"}, user_id=user_id)
+
+    if variant_parser.count_variants(user_prompt) > 1:
+        # Panels go to the batch path on the task pool
+        try:
+            await sync_to_async(pool.submit)(task_id, user_prompt, variants=[])
+            return _accepted_response(task_id)
+        except QueueFull:
+            pass
+    elif pipeline_async.submit(task_id, user_prompt):
+        return _accepted_response(task_id)
+
+    if user_id:
+        await sync_to_async(save_result)(task_id, {"status": "error", "error": "Server busy"})
+    return _busy_response()
+
+
+def _status_payload(task_id, stage):
+    """Full stored result once the task is finished, otherwise its current stage."""
+    if stage in progress.TERMINAL_STAGES:
+        result = load_result(task_id)
+        if result:
+            return result
+    task = ChatTask.objects.filter(task_id=task_id).only("status", "attempts").first()
+    payload = {
+        "status": "processing",
+        "stage": stage or ChatTask.QUEUED,
+        "queue_status": task.status if task else None,
+        "attempts": task.attempts if task else 0,
+    }
+    if stage == ChatTask.SUMMARIZING:
+        # Variant data and the Evo2 result are saved before the summary starts; the summary is partial
+        partial = load_result(task_id) or {}
+        payload.update({key: value for key, value in partial.items() if key != "status"})
+        payload["summary"] = progress.text(task_id) or partial.get("summary", "")
+    return payload
+
+
+def _etag(stage):
+    return f'"{stage or ChatTask.QUEUED}"'
+
+
+def _variant_dict(variant):
+    # model_dump() leaves out the user's REF allele; keep it for the worker's reference check
+    return {**variant.model_dump(), "reference": variant.reference}
+
+
+def _read_batch(request):
+    """(prompt, variant dicts) from a VCF upload, {"variants": [...]} or {"prompt": "..."}; raises ValueError."""
+    max_variants = getattr(settings, "CHAT_BATCH_MAX_VARIANTS", 200)
+    upload = request.FILES.get("file")
+    if upload is not None:
+        name = (upload.name or "").lower()
+        if not name.endswith((".vcf", ".vcf.gz", ".txt")):
+            raise ValueError("Upload a .vcf or .vcf.gz file")
+        stream = gzip.open(upload, "rt") if name.endswith(".gz") else io.TextIOWrapper(upload, encoding="utf-8")
+        genome = request.POST.get("genome", "hg38")
+        variants = variant_parser.parse_vcf(stream, default_genome=genome, limit=max_variants)
+        if not variants:
+            raise ValueError("No usable SNV / indel records in the VCF")
+        return f"VCF upload: {upload.name} ({len(variants)} variants)", [_variant_dict(v) for v in variants]
 
     try:
         data = json.loads(request.body)
-        user_prompt = data.get("prompt", "").strip()
-        if not user_prompt:
-            return JsonResponse({"error": "Missing 'prompt'"}, status=400)
     except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON"}, status=400)
+        raise ValueError("Invalid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    if data.get("variants"):
+        if not isinstance(data["variants"], list) or len(data["variants"]) > max_variants:
+            raise ValueError(f"'variants' must be a list of at most {max_variants} variants")
+        try:
+            variants = [_variant_dict(variant_cache.normalize_variant(VariantInputSchema(**v))) for v in data["variants"]]
+        except (TypeError, ValidationError) as e:
+            raise ValueError(f"Invalid variant: {e}")
+        return data.get("prompt") or f"Batch of {len(variants)} variants", variants
 
-    # Generate unique task ID
-    task_id = str(uuid.uuid4())
+    prompt = str(data.get("prompt", "")).strip()
+    if not prompt:
+        raise ValueError("Send a VCF 'file', a 'variants' list or a 'prompt'")
+    # Parsed in the worker (locally when possible, one LLM extraction otherwise)
+    return prompt, []
 
-    # Launch background thread
-    threading.Thread(
-        target=background_analysis_task,
-        args=(task_id, user_prompt),
-        daemon=True
-    ).start()
 
-    # Respond instantly
-    return JsonResponse({
-        "task_id": task_id,
-        "status": "processing",
-        "message": "🧬 Analysis started. Check progress at /api/status/<task_id>/",
-    }, status=202)
+# 🌐 Route: Analyze a panel of variants (VCF upload / list / pasted text) as ONE task with ONE summary
+@csrf_exempt
+def batch_analysis_router(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        prompt, variants = _read_batch(request)
+    except (ValueError, UnicodeDecodeError, OSError) as e:  # OSError: not actually gzip
+        return JsonResponse({"error": str(e)}, status=400)
+
+    task_id = str(uuid.uuid4())
+    user_id = _request_user_id(request)
+    if user_id:
+        save_result(task_id, {"status": "processing"}, user_id=user_id)
+    try:
+        pool.submit(task_id, prompt, variants=variants)
+    except QueueFull:
+        if user_id:
+            save_result(task_id, {"status": "error", "error": "Server busy"})
+        return _busy_response()
+
+    return _accepted_response(task_id, mode="batch", variant_count=len(variants) or None)
 
 
 # 🌐 Route: Check task status
+# ?wait=<seconds> with If-None-Match turns this into a long-poll: it answers as soon as the
+# stage moves past the one in the ETag, or 304 Not Modified when `wait` runs out.
 @csrf_exempt
 def get_task_status(request, task_id):
-    result = load_result(task_id)
-    print(f"📡 Checking task {task_id}, found:", result)
-    if not result:
-        return JsonResponse({"status": "processing"}, status=202)
-    return JsonResponse(result, status=200)
+    try:
+        wait = min(float(request.GET.get("wait") or 0), getattr(settings, "CHAT_STATUS_LONG_POLL_MAX_SECONDS", 30))
+    except ValueError:
+        return JsonResponse({"error": "'wait' must be a number of seconds"}, status=400)
+
+    if_none_match = request.headers.get("If-None-Match")
+    known_stage = if_none_match.removeprefix("W/").strip('"') if if_none_match else None
+    if known_stage and wait > 0:
+        stage = progress.wait_for_change(task_id, known_stage, wait, load_result)
+    else:
+        stage = progress.current(task_id, load_result)
+
+    if known_stage and known_stage == (stage or ChatTask.QUEUED):
+        response = HttpResponse(status=304)
+    else:
+        status = 200 if stage in progress.TERMINAL_STAGES else 202
+        response = JsonResponse(_status_payload(task_id, stage), status=status)
+    response["ETag"] = _etag(stage)
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def _sse(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class _StatusStream:
+    """SSE framing for one task's stream, shared by the WSGI (thread) and ASGI (event loop) versions."""
+
+    def __init__(self, task_id, last_event_id, max_seconds):
+        # EventSource resends the last event id ("<stage>:<summary characters received>") when it reconnects
+        last_seen, _, last_offset = (last_event_id or "").partition(":")
+        self.task_id = task_id
+        self.known = last_seen or None
+        self.sent = int(last_offset) if last_offset.isdigit() else 0
+        self.keepalive = getattr(settings, "CHAT_STATUS_KEEPALIVE_SECONDS", 15)
+        self.deadline = time.monotonic() + max_seconds
+        self.done = False
+
+    def timeout(self):
+        return max(min(self.keepalive, self.deadline - time.monotonic()), 0)
+
+    def stage_frames(self, stage):
+        """Frames for a stage transition (reads the stored result, so call it off the event loop)."""
+        self.known = stage
+        payload = _status_payload(self.task_id, stage)
+        if stage == ChatTask.SUMMARIZING:
+            self.sent = len(payload.get("summary") or "")
+        frames = [_sse("stage", payload, event_id=f"{stage}:{self.sent}")]
+        if stage in progress.TERMINAL_STAGES:
+            frames.append(_sse("end", {"stage": stage}))
+            self.done = True
+        return frames
+
+    def text_frames(self, stage, summary):
+        """Frames when the stage is unchanged: new summary text, a keep-alive, or nothing at the deadline."""
+        if len(summary) > self.sent:
+            # Only the new text; `offset` lets the client splice it in even after a reconnect
+            frame = _sse("token", {"text": summary[self.sent:], "offset": self.sent}, event_id=f"{stage}:{len(summary)}")
+            self.sent = len(summary)
+            return [frame]
+        if self.deadline - time.monotonic() <= 0:
+            self.done = True  # client reconnects and resumes from Last-Event-ID
+            return []
+        return [": keep-alive\n\n"]
+
+
+class _StreamSlot:
+    """Iterator wrapper that gives a WSGI stream's slot back when the response is closed (even if never iterated)."""
+
+    def __init__(self, iterator, release):
+        self._iterator = iterator
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        self._iterator.close()
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+
+_sync_streams = threading.BoundedSemaphore(getattr(settings, "CHAT_STATUS_MAX_SYNC_STREAMS", 2))
+
+
+def _sync_events(stream, task_id):
+    yield "retry: 3000\n\n"
+    while not stream.done:
+        stage, summary = progress.wait_for_update(task_id, stream.known, stream.sent, stream.timeout(), load_result)
+        yield from stream.stage_frames(stage) if stage != stream.known else stream.text_frames(stage, summary)
+
+
+async def _async_events(stream, task_id):
+    yield "retry: 3000\n\n"
+    while not stream.done:
+        stage, summary = await progress.await_update(task_id, stream.known, stream.sent, stream.timeout(), load_result)
+        if stage != stream.known:
+            frames = await sync_to_async(stream.stage_frames)(stage)
+        else:
+            frames = stream.text_frames(stage, summary)
+        for frame in frames:
+            yield frame
+
+
+# 🌐 Route: Server-Sent Events stream of stage transitions and summary tokens, ending with the result
+# Under ASGI the stream is an async generator: it waits on the event loop and holds no thread.
+# Under WSGI every open stream pins a server thread, so at most CHAT_STATUS_MAX_SYNC_STREAMS run per
+# process and each closes after CHAT_STATUS_SYNC_STREAM_MAX_SECONDS (EventSource reconnects and resumes);
+# past the cap the answer is 503 and the client falls back to the ETag long-poll on /api/status/<id>/.
+def stream_task_status(request, task_id):
+    stage = progress.current(task_id, load_result)
+    if stage is None:
+        return JsonResponse({"error": "Unknown task"}, status=404)
+
+    last_event_id = request.headers.get("Last-Event-ID")
+    if isinstance(request, ASGIRequest):
+        stream = _StatusStream(task_id, last_event_id, getattr(settings, "CHAT_STATUS_STREAM_MAX_SECONDS", 300))
+        content = _async_events(stream, task_id)
+    else:
+        if not _sync_streams.acquire(blocking=False):
+            response = JsonResponse({
+                "error": "Too many open status streams",
+                "poll": f"/api/status/{task_id}/?wait={getattr(settings, 'CHAT_STATUS_LONG_POLL_MAX_SECONDS', 30)}",
+            }, status=503)
+            response["Retry-After"] = str(getattr(settings, "CHAT_RETRY_AFTER_SECONDS", 10))
+            return response
+        stream = _StatusStream(task_id, last_event_id, getattr(settings, "CHAT_STATUS_SYNC_STREAM_MAX_SECONDS", 30))
+        content = _StreamSlot(_sync_events(stream, task_id), _sync_streams.release)
+
+    response = StreamingHttpResponse(content, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
+
+
+# 🌐 Route: The signed-in user's analyses, newest first (?status=completed&since=<iso>&limit=50)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def list_task_results(request):
+    try:
+        since = parse_since(request.query_params.get("since"))
+        limit = min(int(request.query_params.get("limit", 50)), getattr(settings, "CHAT_RESULT_QUERY_MAX", 500))
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    results = get_store().query(
+        user_id=request.user.pk, status=request.query_params.get("status") or None, since=since, limit=limit,
+    )
+    return Response({"count": len(results), "results": results})
+
+
+# 🌐 Route: Evo2 variant cache metrics
+def variant_cache_stats(request):
+    return JsonResponse(variant_cache.stats(), status=200)
+
+
+# 🌐 Route: LLM response cache hit rate per tier and tokens saved
+def llm_cache_stats(request):
+    return JsonResponse(llm_cache.stats(), status=200)
+
+
+# 🌐 Route: Local variant pre-parser hit rate (LLM extraction calls saved)
+def variant_parser_stats(request):
+    return JsonResponse(variant_parser.stats(), status=200)
+
+
+# 🌐 Route: Outbound call health (breaker state, retries, hedges, timeouts per dependency)
+def resilience_stats(request):
+    return JsonResponse(resilience.stats(), status=200)
+
+
+# 🌐 Route: Task queue depth / wait time
+def task_queue_stats(request):
+    return JsonResponse(pool.stats(), status=200)
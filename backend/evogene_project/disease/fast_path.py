@@ -0,0 +1,184 @@
+# disease/fast_path.py
+"""
+NumPy-only scoring path for the diabetes LightGBM pipeline.
+
+At startup the fitted sklearn pipeline is "compiled" into plain arrays:
+  * ZeroToMeanImputer  -> column mask + precomputed means
+  * StandardScaler     -> mean_ / scale_ vectors
+  * LGBMClassifier     -> flattened tree node arrays, walked level by level
+
+so a single request never touches pandas or the sklearn/LightGBM call stack.
+The compiled scorer is verified against the original pipeline before use.
+"""
+import numpy as np
+import pandas as pd
+
+K_ZERO_THRESHOLD = 1e-35  # LightGBM's kZeroThreshold
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+
+class FastDiabetesScorer:
+    """Positive-class probability for rows given in `feature_names` order."""
+
+    def __init__(self, pipeline, feature_names):
+        self.feature_names = list(feature_names)
+        self.classes = np.asarray(pipeline.classes_)
+        preprocessor, classifier = pipeline.steps[0][1], pipeline.steps[-1][1]
+
+        self._compile_preprocessor(preprocessor)
+        self._compile_trees(classifier)
+
+        self.verified = False
+        self.max_abs_error = None
+
+    # 🧩 Compilation
+    def _compile_preprocessor(self, preprocessor):
+        n = len(self.feature_names)
+        self.zero_mask = np.zeros(n, dtype=bool)
+        self.impute_values = np.zeros(n, dtype=np.float64)
+        self.scale_mean = np.zeros(n, dtype=np.float64)
+        self.scale_std = np.ones(n, dtype=np.float64)
+
+        if getattr(preprocessor, "remainder", "drop") != "drop":
+            raise NotImplementedError("Only remainder='drop' column transformers are supported")
+
+        self.column_order = []
+        for _, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop":
+                continue
+            idx = [self.feature_names.index(c) for c in columns]
+            steps = transformer.steps if hasattr(transformer, "steps") else [(None, transformer)]
+            for _, step in steps:
+                kind = type(step).__name__
+                if kind == "ZeroToMeanImputer":
+                    for col in step.cols:
+                        i = self.feature_names.index(col)
+                        self.zero_mask[i] = True
+                        self.impute_values[i] = step.means[col]
+                elif kind == "StandardScaler":
+                    if step.with_mean:
+                        self.scale_mean[idx] = step.mean_
+                    if step.with_std:
+                        self.scale_std[idx] = step.scale_
+                elif step != "passthrough":
+                    raise NotImplementedError(f"Unsupported preprocessing step: {kind}")
+            self.column_order.extend(idx)
+
+        self.column_order = np.asarray(self.column_order, dtype=np.intp)
+
+    def _compile_trees(self, classifier):
+        dump = classifier.booster_.dump_model()
+        objective = dump.get("objective", "")
+        if not objective.startswith("binary"):
+            raise NotImplementedError(f"Unsupported objective: {objective}")
+        self.sigmoid = 1.0
+        for token in objective.split():
+            if token.startswith("sigmoid:"):
+                self.sigmoid = float(token.split(":", 1)[1])
+
+        feature, threshold, left, right = [], [], [], []
+        default_left, missing_type, value = [], [], []
+        roots = []
+        self.depth = 0
+
+        def add(node, depth):
+            pos = len(feature)
+            feature.append(-1)
+            threshold.append(0.0)
+            left.append(pos)
+            right.append(pos)
+            default_left.append(False)
+            missing_type.append(MISSING_NONE)
+            value.append(0.0)
+
+            if "leaf_value" in node:
+                value[pos] = node["leaf_value"]
+                self.depth = max(self.depth, depth)
+                return pos
+
+            if node.get("decision_type", "<=") != "<=":
+                raise NotImplementedError("Categorical splits are not supported")
+            feature[pos] = node["split_feature"]
+            threshold[pos] = node["threshold"]
+            default_left[pos] = node.get("default_left", True)
+            missing_type[pos] = _MISSING_TYPES[node.get("missing_type", "None")]
+            left[pos] = add(node["left_child"], depth + 1)
+            right[pos] = add(node["right_child"], depth + 1)
+            return pos
+
+        for tree in dump["tree_info"]:
+            roots.append(add(tree["tree_structure"], 0))
+
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.node_feature = np.asarray(feature, dtype=np.intp)
+        self.node_threshold = np.asarray(threshold, dtype=np.float64)
+        self.node_left = np.asarray(left, dtype=np.intp)
+        self.node_right = np.asarray(right, dtype=np.intp)
+        self.node_default_left = np.asarray(default_left, dtype=bool)
+        self.node_missing = np.asarray(missing_type, dtype=np.int8)
+        self.node_value = np.asarray(value, dtype=np.float64)
+        # Leaves point at themselves; a safe column index keeps the gather in bounds
+        self._gather_feature = np.where(self.node_feature < 0, 0, self.node_feature)
+
+    # 🧩 Scoring
+    def transform(self, X):
+        """Imputation + scaling, equivalent to the pipeline's preprocessor."""
+        X = np.asarray(X, dtype=np.float64)
+        X = np.where(self.zero_mask & ((X == 0) | np.isnan(X)), self.impute_values, X)
+        X = (X - self.scale_mean) / self.scale_std
+        return X[:, self.column_order]
+
+    def raw_score(self, Z):
+        rows = np.arange(Z.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (Z.shape[0], self.roots.size))
+        for _ in range(self.depth):
+            x = Z[rows, self._gather_feature[node]]
+            missing = self.node_missing[node]
+            is_nan = np.isnan(x)
+            x = np.where(is_nan & (missing != MISSING_NAN), 0.0, x)
+            use_default = ((missing == MISSING_ZERO) & (np.abs(x) <= K_ZERO_THRESHOLD)) | \
+                          ((missing == MISSING_NAN) & is_nan)
+            go_left = np.where(use_default, self.node_default_left[node], x <= self.node_threshold[node])
+            node = np.where(go_left, self.node_left[node], self.node_right[node])
+        return self.node_value[node].sum(axis=1)
+
+    def predict_proba(self, X):
+        """Positive-class probability for an (N, n_features) array."""
+        X = np.atleast_2d(X)
+        return 1.0 / (1.0 + np.exp(-self.sigmoid * self.raw_score(self.transform(X))))
+
+    def predict_one(self, row):
+        """(label, probability) for one row; labels follow the pipeline's argmax rule."""
+        proba = float(self.predict_proba(row)[0])
+        return self.classes[1] if proba > 0.5 else self.classes[0], proba
+
+    # 🧩 Verification
+    def verify(self, pipeline, n_samples=512, atol=1e-9, seed=0):
+        """Compare against pipeline.predict_proba on random rows (with zeros to exercise imputation)."""
+        rng = np.random.default_rng(seed)
+        X = np.abs(rng.normal(self.scale_mean, 1.5 * self.scale_std, size=(n_samples, len(self.feature_names))))
+        X[rng.random(X.shape) < 0.15] = 0.0
+
+        expected = pipeline.predict_proba(pd.DataFrame(X, columns=self.feature_names))[:, 1]
+        actual = self.predict_proba(X)
+        self.max_abs_error = float(np.max(np.abs(expected - actual)))
+        self.verified = bool(self.max_abs_error <= atol)
+        return self.verified
+
+
+def compile_pipeline(pipeline, feature_names):
+    """Build and verify a FastDiabetesScorer; returns None when the pipeline can't be compiled exactly."""
+    try:
+        scorer = FastDiabetesScorer(pipeline, feature_names)
+    except Exception as e:
+        print(f"[WARN] Diabetes fast path unavailable: {e}")
+        return None
+
+    if not scorer.verify(pipeline):
+        print(f"[WARN] Diabetes fast path disabled, max abs error {scorer.max_abs_error:.3e}")
+        return None
+
+    print(f"[INFO] Diabetes fast path compiled ({scorer.roots.size} trees, max abs error {scorer.max_abs_error:.1e}) ⚡")
+    return scorer
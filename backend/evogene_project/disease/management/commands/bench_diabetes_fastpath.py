@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from disease.fast_path import FastDiabetesScorer
+from disease.utils import FEATURE_NAMES, build_features, feature_row, get_model, score_features
+from evogene_project.model_registry import ModelNotAvailable
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark single-row diabetes scoring: sklearn/pandas pipeline vs. NumPy fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+        parser.add_argument("--warmup", type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            diabetes_model = get_model()
+        except ModelNotAvailable as e:
+            raise CommandError(str(e))
+
+        scorer = FastDiabetesScorer(diabetes_model, FEATURE_NAMES)
+        scorer.verify(diabetes_model)
+        self.stdout.write(f"Equivalence check: verified={scorer.verified} max_abs_error={scorer.max_abs_error:.3e}")
+
+        record = {
+            'pregnancies': 2, 'glucose': 140, 'blood_pressure_systolic': 120,
+            'blood_pressure_diastolic': 80, 'skin_thickness': 0, 'insulin': 0,
+            'bmi': 33.1, 'diabetes_pedigree_function': 0.5, 'age': 45,
+        }
+
+        def sklearn_path():
+            return score_features(build_features([record]))
+
+        def fast_path():
+            return scorer.predict_one(feature_row(record))
+
+        iterations, warmup = options["iterations"], options["warmup"]
+        results = {}
+        for name, fn in (("sklearn", sklearn_path), ("fast", fast_path)):
+            for _ in range(warmup):
+                fn()
+            timings = np.empty(iterations)
+            for i in range(iterations):
+                t0 = time.perf_counter()
+                fn()
+                timings[i] = time.perf_counter() - t0
+            timings *= 1e6
+            results[name] = timings
+            self.stdout.write(
+                f"{name:>8}: mean {timings.mean():9.1f} µs | p50 {np.percentile(timings, 50):9.1f} µs"
+                f" | p99 {np.percentile(timings, 99):9.1f} µs"
+            )
+
+        speedup = np.median(results["sklearn"]) / np.median(results["fast"])
+        self.stdout.write(self.style.SUCCESS(f"Per-request speedup (p50): {speedup:.1f}x"))
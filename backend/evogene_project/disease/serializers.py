@@ -2,8 +2,8 @@ from rest_framework import serializers
 from .models import DiabetesPrediction
 
 class DiabetesPredictionSerializer(serializers.ModelSerializer):
-    blood_pressure_systolic = serializers.FloatField(write_only=True)
-    blood_pressure_diastolic = serializers.FloatField(write_only=True)
+    blood_pressure_systolic = serializers.FloatField(write_only=True, min_value=0)
+    blood_pressure_diastolic = serializers.FloatField(write_only=True, min_value=0)
     blood_pressure = serializers.FloatField(read_only=True)
 
     class Meta:
@@ -20,3 +20,8 @@ class DiabetesPredictionSerializer(serializers.ModelSerializer):
             'pregnancies',
             'diabetes_pedigree_function'
         ]
+        # Measurements can't be negative (0 means "not measured" and is imputed by the model)
+        extra_kwargs = {
+            field: {'min_value': 0}
+            for field in ['glucose', 'skin_thickness', 'insulin', 'bmi', 'age', 'pregnancies', 'diabetes_pedigree_function']
+        }
@@ -1,3 +1,97 @@
-from django.test import TestCase
+import importlib.util
+import unittest
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from evogene_project.model_registry import ModelRegistry
+
+from . import utils
+from .fast_path import FastDiabetesScorer
+from .models import DiabetesPrediction
+
+
+# 🧪 NumPy fast path vs. the sklearn / LightGBM pipeline
+@unittest.skipUnless(importlib.util.find_spec("lightgbm"), "the diabetes pipeline needs LightGBM")
+class FastPathTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pipeline = utils.load_pipeline(settings.ML_MODELS[utils.MODEL_NAME]["path"])
+
+    def test_fast_path_matches_the_pipeline(self):
+        scorer = FastDiabetesScorer(self.pipeline, utils.FEATURE_NAMES)
+        rng = np.random.default_rng(42)
+        # Clinically plausible ranges, with zeros ("missing") sprinkled in for the imputer
+        low = np.array([0, 40, 40, 0, 0, 15, 0.05, 18])
+        high = np.array([15, 220, 130, 70, 600, 60, 2.5, 90])
+        X = rng.uniform(low, high, size=(2000, len(low)))
+        X[rng.random(X.shape) < 0.15] = 0.0
+
+        expected = self.pipeline.predict_proba(pd.DataFrame(X, columns=utils.FEATURE_NAMES))[:, 1]
+        max_abs_error = float(np.max(np.abs(scorer.predict_proba(X) - expected)))
+        self.assertLess(max_abs_error, 1e-9)
+
+        for row, probability in zip(X[:50], expected[:50]):
+            label, fast_probability = scorer.predict_one(row)
+            self.assertEqual(label, self.pipeline.classes_[int(probability > 0.5)])
+            self.assertAlmostEqual(fast_probability, probability, delta=1e-9)
+
+    def test_warm_up_compiles_the_fast_path(self):
+        spec = settings.ML_MODELS[utils.MODEL_NAME]
+        self.assertEqual(spec.get("on_load"), "disease.utils.compile_fast_scorer")
+        previous = utils._fast_scorer
+        self.addCleanup(setattr, utils, "_fast_scorer", previous)
+        utils._fast_scorer = (None, None)
+
+        with override_settings(ML_MODELS={utils.MODEL_NAME: spec}, DIABETES_FAST_PATH=True):
+            registry = ModelRegistry()
+            registry.warm_up([utils.MODEL_NAME])
+            version, scorer = utils._fast_scorer
+            self.assertEqual(version, registry.version(utils.MODEL_NAME))
+            self.assertIsNotNone(scorer)
+            self.assertTrue(scorer.verified)
+
+
+# 🧪 /api/diabetes/predict/batch/ uploads
+_HEADER = "pregnancies,glucose,blood_pressure_systolic,blood_pressure_diastolic,skin_thickness,insulin,bmi,diabetes_pedigree_function,age\n"
+
+
+@unittest.skipUnless(importlib.util.find_spec("lightgbm"), "the diabetes pipeline needs LightGBM")
+class BatchUploadTests(TestCase):
+
+    def post_csv(self, body):
+        upload = SimpleUploadedFile("patients.csv", (_HEADER + body).encode(), content_type="text/csv")
+        return self.client.post("/api/diabetes/predict/batch/", {"file": upload})
+
+    def test_valid_rows_are_scored_and_saved(self):
+        response = self.post_csv("2,120,120,80,20,80,30.1,0.5,40\n0,150,130,85,0,0,35.2,0.8,55\n")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["count"], 2)
+        self.assertEqual(sorted(DiabetesPrediction.objects.values_list("age", flat=True)), [40, 55])
+
+    def test_invalid_rows_are_reported_per_row_and_nothing_is_saved(self):
+        response = self.post_csv(
+            "2,120,120,80,20,80,30.1,0.5,40\n"
+            "2,120,120,80,20,80,30.1,0.5,34.7\n"  # age must be a whole number (was truncated to 34)
+            "2,-5,120,80,20,80,30.1,0.5,40\n"  # negative glucose
+            "2,NaN,120,80,20,80,30.1,0.5,40\n"
+            "2,120,120,80,20,80,,0.5,40\n"  # empty BMI
+        )
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertIn("4 of 5", body["error"])
+        self.assertEqual([(r["row"], sorted(r["errors"])) for r in body["rows"]],
+                         [(2, ["age"]), (3, ["glucose"]), (4, ["glucose"]), (5, ["bmi"])])
+        self.assertFalse(DiabetesPrediction.objects.exists())
+
+    def test_json_records_reject_negative_values(self):
+        record = {"pregnancies": 1, "glucose": 100, "blood_pressure_systolic": 120, "blood_pressure_diastolic": -80,
+                  "skin_thickness": 20, "insulin": 80, "bmi": 25, "diabetes_pedigree_function": 0.4, "age": 30}
+        response = self.client.post("/api/diabetes/predict/batch/", [record], content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("blood_pressure_diastolic", str(response.json()))
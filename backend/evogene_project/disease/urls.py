@@ -1,7 +1,8 @@
 # disease/urls.py
 from django.urls import path
-from .views import predict_diabetes
+from .views import predict_diabetes, predict_diabetes_batch
 
 urlpatterns = [
     path('diabetes/predict/', predict_diabetes, name='predict_diabetes'),
+    path('diabetes/predict/batch/', predict_diabetes_batch, name='predict_diabetes_batch'),
 ]
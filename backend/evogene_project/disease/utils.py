@@ -0,0 +1,127 @@
+# disease/utils.py
+from sklearn.base import BaseEstimator, TransformerMixin
+from django.conf import settings
+from evogene_project.model_registry import registry
+from .fast_path import compile_pipeline
+import pandas as pd
+import joblib
+import numpy as np
+import sys
+pd.set_option('future.no_silent_downcasting', True)
+
+# Registered in settings.ML_MODELS
+MODEL_NAME = "diabetes_pipeline"
+
+
+# 👇 Your custom transformer (exactly as used in training)
+class ZeroToMeanImputer(BaseEstimator, TransformerMixin):
+    def __init__(self, cols=None):
+        self.cols = cols
+        self.means = {}
+
+    def fit(self, X, y=None):
+        X_df = pd.DataFrame(X, columns=X.columns)
+        for col in self.cols:
+            self.means[col] = X_df[col].replace(0, np.nan).mean()
+        return self
+
+    def transform(self, X):
+        X_df = pd.DataFrame(X, columns=X.columns)
+        for col in self.cols:
+            X_df[col] = X_df[col].replace(0, np.nan).fillna(self.means[col])
+        return X_df.values
+
+
+sys.modules['__main__'].ZeroToMeanImputer = ZeroToMeanImputer
+
+
+def load_pipeline(path):
+    """Registry loader for the trained LightGBM pipeline (.pkl)."""
+    return joblib.load(path)
+
+
+def get_model():
+    """The diabetes pipeline, loaded on first use via the model registry."""
+    return registry.get(MODEL_NAME)
+
+
+# Model column order (matches diabetes_model.feature_names_in_)
+FEATURE_NAMES = [
+    'Pregnancies', 'Glucose', 'BloodPressure', 'SkinThickness',
+    'Insulin', 'BMI', 'DiabetesPedigreeFunction', 'Age'
+]
+
+# Request / upload field names, in the same order as FEATURE_NAMES (blood pressure is derived)
+INPUT_FIELDS = [
+    'pregnancies', 'glucose', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'skin_thickness', 'insulin', 'bmi', 'diabetes_pedigree_function', 'age'
+]
+
+
+# ⚡ NumPy-only single-row scorer, compiled from the loaded pipeline and verified against it.
+# Built by the registry's on_load hook whenever the pipeline is (re)loaded, i.e. during warm-up;
+# cached per model version, so a hot-reloaded pipeline gets its own scorer.
+_fast_scorer = (None, None)
+
+
+def compile_fast_scorer(model, version):
+    """Registry on_load hook for the diabetes pipeline."""
+    global _fast_scorer
+    if getattr(settings, "DIABETES_FAST_PATH", True):
+        _fast_scorer = (version, compile_pipeline(model, FEATURE_NAMES))
+
+
+def get_fast_scorer():
+    if not getattr(settings, "DIABETES_FAST_PATH", True):
+        return None
+    model = get_model()
+    version = registry.version(MODEL_NAME)
+    if _fast_scorer[0] != version:
+        compile_fast_scorer(model, version)  # registered without the hook (e.g. in tests)
+    return _fast_scorer[1]
+
+
+def feature_row(data):
+    """One validated record as a plain list in FEATURE_NAMES order (no pandas)."""
+    mean_bp = (float(data['blood_pressure_systolic']) + float(data['blood_pressure_diastolic'])) / 2
+    return [
+        float(data['pregnancies']),
+        float(data['glucose']),
+        mean_bp,
+        float(data['skin_thickness']),
+        float(data['insulin']),
+        float(data['bmi']),
+        float(data['diabetes_pedigree_function']),
+        float(data['age'])
+    ]
+
+
+def build_features(records):
+    """Build the model input DataFrame for a list of validated records (dicts or a DataFrame)."""
+    df = pd.DataFrame(records, columns=INPUT_FIELDS).astype(float)
+    mean_bp = (df['blood_pressure_systolic'] + df['blood_pressure_diastolic']) / 2
+    return pd.DataFrame({
+        'Pregnancies': df['pregnancies'],
+        'Glucose': df['glucose'],
+        'BloodPressure': mean_bp,
+        'SkinThickness': df['skin_thickness'],
+        'Insulin': df['insulin'],
+        'BMI': df['bmi'],
+        'DiabetesPedigreeFunction': df['diabetes_pedigree_function'],
+        'Age': df['age'],
+    }, columns=FEATURE_NAMES)
+
+
+def score_features(features):
+    """Score every row in one vectorized pass, returning (labels, positive-class probabilities)."""
+    diabetes_model = get_model()
+    if hasattr(diabetes_model, "predict_proba"):
+        proba = diabetes_model.predict_proba(features)
+        predictions = diabetes_model.classes_[proba.argmax(axis=1)]
+        probas = proba[:, 1]
+    else:
+        predictions = diabetes_model.predict(features)
+        probas = predictions.astype(float)
+
+    labels = np.where(predictions == 1, "Diabetic", "Non-Diabetic")
+    return labels.tolist(), probas
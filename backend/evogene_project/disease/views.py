@@ -4,54 +4,15 @@ from rest_framework import status, permissions
 from django.contrib.auth import get_user_model
 from .models import DiabetesPrediction
 from .serializers import DiabetesPredictionSerializer
-from sklearn.base import BaseEstimator, TransformerMixin
+from .utils import INPUT_FIELDS, build_features, feature_row, get_fast_scorer, get_model, score_features
+from evogene_project.model_registry import ModelNotAvailable
 import pandas as pd
-import joblib
-import numpy as np
-import os
-import sys
-pd.set_option('future.no_silent_downcasting', True)
+import time
+from django.conf import settings
 
 User = get_user_model()
 
 
-# 👇 Your custom transformer (exactly as used in training)
-class ZeroToMeanImputer(BaseEstimator, TransformerMixin):
-    def __init__(self, cols=None):
-        self.cols = cols
-        self.means = {}
-
-    def fit(self, X, y=None):
-        X_df = pd.DataFrame(X, columns=X.columns)
-        for col in self.cols:
-            self.means[col] = X_df[col].replace(0, np.nan).mean()
-        return self
-
-    def transform(self, X):
-        X_df = pd.DataFrame(X, columns=X.columns)
-        for col in self.cols:
-            X_df[col] = X_df[col].replace(0, np.nan).fillna(self.means[col])
-        return X_df.values
-
-
-sys.modules['__main__'].ZeroToMeanImputer = ZeroToMeanImputer
-
-
-# 🧩 Path to your trained model (.pkl)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, 'models', 'diabetes_lgbm_ct_pipeline.pkl')
-print(f"[DEBUG] Looking for model at: {MODEL_PATH}")
-
-# Load model once at startup
-try:
-    diabetes_model = joblib.load(MODEL_PATH)
-    print("[INFO] Diabetes prediction model loaded successfully ✅")
-    print(diabetes_model.feature_names_in_)
-except Exception as e:
-    print(f"[ERROR] Could not load ML model: {e}")
-    diabetes_model = None
-
-
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def predict_diabetes(request):
@@ -63,43 +24,24 @@ def predict_diabetes(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    if not diabetes_model:
+    try:
+        get_model()
+    except ModelNotAvailable:
         return Response({"error": "ML model not loaded"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     try:
         # ✅ Clean + cast incoming data
         data = serializer.validated_data
-        feature_names = [
-        'Pregnancies', 'Glucose', 'BloodPressure', 'SkinThickness',
-        'Insulin', 'BMI', 'DiabetesPedigreeFunction', 'Age'
-        ]
+        fast_scorer = get_fast_scorer()
 
-        mean_bp = (float(data['blood_pressure_systolic']) + float(data['blood_pressure_diastolic'])) / 2
-
-    # Wrap in a DataFrame instead of NumPy array
-        features = pd.DataFrame([[
-            float(data['pregnancies']),
-            float(data['glucose']),
-            mean_bp,
-            float(data['skin_thickness']),
-            float(data['insulin']),
-            float(data['bmi']),
-            float(data['diabetes_pedigree_function']),
-            float(data['age'])
-        ]], columns=feature_names)
-
-
-        # ✅ Model prediction
-        prediction = diabetes_model.predict(features)[0]
-
-        # Check if model supports probability output
-        if hasattr(diabetes_model, "predict_proba"):
-            proba = float(diabetes_model.predict_proba(features)[0][1])
+        # ✅ Model prediction (one predict_proba pass gives both label and probability)
+        if fast_scorer is not None:
+            prediction, proba = fast_scorer.predict_one(feature_row(data))
+            result = "Diabetic" if prediction == 1 else "Non-Diabetic"
         else:
-            proba = float(prediction)
-
-        # ✅ Convert prediction to human-readable
-        result = "Diabetic" if prediction == 1 else "Non-Diabetic"
+            labels, probas = score_features(build_features([data]))
+            proba = float(probas[0])
+            result = labels[0]
 
         # ✅ Save record in DB
         diabetes_record = DiabetesPrediction.objects.create(
@@ -127,3 +69,121 @@ def predict_diabetes(request):
     except Exception as e:
         print(f"[ERROR] Prediction failed: {e}")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _read_upload(upload):
+    """Read a CSV or Parquet upload into a list of raw INPUT_FIELDS records (validated by the serializer)."""
+    name = upload.name.lower()
+    if name.endswith(('.parquet', '.pq')):
+        df = pd.read_parquet(upload)
+    else:
+        # Values stay strings, so "34.7" as an age or "" is reported by the serializer, not coerced
+        df = pd.read_csv(upload, dtype=str, keep_default_na=False)
+
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    missing = [c for c in INPUT_FIELDS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return df[INPUT_FIELDS].astype(object).where(df[INPUT_FIELDS].notna(), None).to_dict('records')
+
+
+def _row_errors(errors):
+    """
+    Serializer errors of the invalid rows only, numbered from 1 (the header is not a row).
+
+    ListSerializer reports a list with one entry per row, or (newer DRF) a dict of
+    just the failing row indexes.
+    """
+    rows = errors.items() if isinstance(errors, dict) else enumerate(errors)
+    return sorted(({"row": int(i) + 1, "errors": row} for i, row in rows if row), key=lambda r: r["row"])
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def predict_diabetes_batch(request):
+    """
+    Batch diabetes prediction: a JSON list of records (or {"records": [...]}),
+    or a CSV/Parquet upload in the `file` field. All rows are scored in one
+    predict_proba pass and saved with bulk_create.
+    """
+    try:
+        get_model()
+    except ModelNotAvailable:
+        return Response({"error": "ML model not loaded"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    started = time.perf_counter()
+
+    # ✅ Parse input
+    upload = request.FILES.get('file')
+    if upload is not None:
+        try:
+            payload = _read_upload(upload)
+        except ImportError as e:
+            return Response({"error": f"Parquet support not installed: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": f"Invalid upload: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        payload = request.data.get('records') if isinstance(request.data, dict) else request.data
+
+    if isinstance(payload, list):
+        if len(payload) == 0:
+            return Response({"error": "No records provided"}, status=status.HTTP_400_BAD_REQUEST)
+        max_rows = getattr(settings, "DIABETES_BATCH_MAX_ROWS", 100000)
+        if len(payload) > max_rows:
+            return Response({"error": f"Too many rows ({len(payload)} > {max_rows})"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # ✅ Validate every row with the same serializer as single predictions
+    serializer = DiabetesPredictionSerializer(data=payload, many=True)
+    if not serializer.is_valid():
+        if upload is None:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        invalid = _row_errors(serializer.errors)
+        return Response({
+            "error": f"Invalid rows in upload ({len(invalid)} of {len(payload)})",
+            "rows": invalid[:100],
+        }, status=status.HTTP_400_BAD_REQUEST)
+    records = pd.DataFrame(serializer.validated_data, columns=INPUT_FIELDS)
+
+    try:
+        # ✅ One vectorized scoring pass
+        labels, probas = score_features(build_features(records))
+        scored = time.perf_counter()
+
+        # ✅ Bulk insert
+        user = request.user if request.user.is_authenticated else None
+        rows = [
+            DiabetesPrediction(
+                user=user,
+                glucose=row.glucose,
+                blood_pressure_systolic=row.blood_pressure_systolic,
+                blood_pressure_diastolic=row.blood_pressure_diastolic,
+                skin_thickness=row.skin_thickness,
+                insulin=row.insulin,
+                bmi=row.bmi,
+                age=int(row.age),
+                pregnancies=int(row.pregnancies),
+                diabetes_pedigree_function=row.diabetes_pedigree_function,
+                prediction_result=label,
+                prediction_probability=float(proba),
+            )
+            for row, label, proba in zip(records.itertuples(index=False), labels, probas)
+        ]
+        rows = DiabetesPrediction.objects.bulk_create(rows, batch_size=1000)
+        elapsed = time.perf_counter() - started
+
+        return Response({
+            "message": "Batch prediction successful",
+            "count": len(rows),
+            "diabetic_count": labels.count("Diabetic"),
+            "elapsed_s": round(elapsed, 4),
+            "scoring_s": round(scored - started, 4),
+            "rows_per_sec": round(len(rows) / elapsed, 1) if elapsed > 0 else None,
+            "results": [
+                {"record_id": row.id, "result": label, "probability": round(float(proba), 3)}
+                for row, label, proba in zip(rows, labels, probas)
+            ],
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        print(f"[ERROR] Batch prediction failed: {e}")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,199 @@
+# evogene_project/model_registry.py
+"""
+Central registry for the ML models used by the apps.
+
+Models are declared in settings.ML_MODELS (name -> path + dotted loader) or
+registered with `register()`, and loaded lazily on first `get()`, so
+management commands, migrations and tests never pay for TensorFlow or joblib
+deserialization. `warm_up()` loads them explicitly (at server start, or in
+the master process before forking workers so the pages are shared
+copy-on-write), and a changed file on disk is picked up on the next `get()`.
+An optional `on_load(model, version)` hook runs after every (re)load, for
+work derived from the model that should happen then rather than on the
+first request (e.g. compiling the diabetes fast path).
+"""
+import hashlib
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class ModelNotAvailable(RuntimeError):
+    pass
+
+
+class _Entry:
+    def __init__(self, name, path, loader, on_load=None):
+        self.name = name
+        self.path = str(path)
+        # Either a callable or a dotted path, resolved only when the model is first loaded
+        self.loader = loader
+        self.on_load = on_load
+        self.model = None
+        self.version = None
+        self.file_stamp = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self.load_count = 0
+        self.last_checked = 0.0
+        self.error = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    def register(self, name, path, loader, on_load=None):
+        """Register `loader(path) -> model` under `name`; nothing is loaded yet."""
+        self._configure()
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(name, path, loader, on_load)
+        return self._entries[name]
+
+    def get(self, name):
+        """Return the loaded model, loading it on first use or reloading it if its file changed."""
+        entry = self._entry(name)
+        if entry.model is None:
+            self._load(entry)
+        else:
+            self._maybe_reload(entry)
+        if entry.model is None:
+            raise ModelNotAvailable(f"Model '{name}' is not available: {entry.error}")
+        return entry.model
+
+    def version(self, name):
+        """Content hash of the currently loaded model file (loads it if needed)."""
+        self.get(name)
+        return self._entry(name).version
+
+    def is_loaded(self, name):
+        return self._entry(name).model is not None
+
+    def warm_up(self, names=None):
+        """Load the given models (all registered ones by default); errors are recorded, not raised."""
+        self._configure()  # names from settings.ML_MODELS are only registered here
+        for name in names if names is not None else self.names():
+            if name not in self._entries:
+                print(f"[WARN] warm_up: unknown model '{name}'")
+                continue
+            try:
+                self.get(name)
+            except ModelNotAvailable as e:
+                print(f"[ERROR] {e}")
+
+    def names(self):
+        self._configure()
+        return list(self._entries)
+
+    def health(self):
+        self._configure()
+        report = {}
+        for name, entry in self._entries.items():
+            report[name] = {
+                "loaded": entry.model is not None,
+                "path": entry.path,
+                "exists": os.path.exists(entry.path),
+                "version": entry.version,
+                "loaded_at": entry.loaded_at,
+                "load_seconds": entry.load_seconds,
+                "load_count": entry.load_count,
+                "error": entry.error,
+            }
+        return report
+
+    def ready(self, names=None):
+        """True when every required model is loaded (defaults to MODEL_PRELOAD + MODEL_WARMUP)."""
+        if names is None:
+            names = list(getattr(settings, "MODEL_PRELOAD", [])) + list(getattr(settings, "MODEL_WARMUP", []))
+        self._configure()
+        return all(name in self._entries and self._entries[name].model is not None for name in names)
+
+    # 🧩 Internals
+    def _configure(self):
+        """Register everything listed in settings.ML_MODELS (once)."""
+        if self._configured:
+            return
+        with self._lock:
+            if self._configured:
+                return
+            for name, spec in getattr(settings, "ML_MODELS", {}).items():
+                self._entries.setdefault(name, _Entry(name, spec["path"], spec["loader"], spec.get("on_load")))
+            self._configured = True
+
+    def _entry(self, name):
+        self._configure()
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise ModelNotAvailable(f"Model '{name}' is not registered")
+
+    def _load(self, entry, stamp=None):
+        with entry.lock:
+            if entry.model is not None and (stamp is None or stamp == entry.file_stamp):
+                return  # another thread got there first
+            started = time.perf_counter()
+            try:
+                stamp = stamp or _file_stamp(entry.path)
+                loader = import_string(entry.loader) if isinstance(entry.loader, str) else entry.loader
+                model = loader(entry.path)
+            except Exception as e:
+                entry.error = str(e)
+                print(f"[ERROR] Could not load model '{entry.name}': {e}")
+                return
+
+            entry.model = model
+            entry.file_stamp = stamp
+            entry.version = _file_hash(entry.path)
+            entry.loaded_at = time.time()
+            entry.load_seconds = round(time.perf_counter() - started, 3)
+            entry.load_count += 1
+            entry.last_checked = time.monotonic()
+            entry.error = None
+            print(f"[INFO] Model '{entry.name}' loaded in {entry.load_seconds}s (version {entry.version}) ✅")
+
+            if entry.on_load is not None:
+                try:
+                    hook = import_string(entry.on_load) if isinstance(entry.on_load, str) else entry.on_load
+                    hook(model, entry.version)
+                except Exception as e:
+                    print(f"[WARN] on_load hook of model '{entry.name}' failed: {e}")
+
+    def _maybe_reload(self, entry):
+        interval = getattr(settings, "MODEL_RELOAD_CHECK_SECONDS", 5)
+        if interval is None or interval < 0:
+            return
+        now = time.monotonic()
+        if now - entry.last_checked < interval:
+            return
+        entry.last_checked = now
+        try:
+            stamp = _file_stamp(entry.path)
+        except OSError:
+            return  # file is being replaced; keep serving the current model
+        if stamp != entry.file_stamp:
+            print(f"[INFO] Model file for '{entry.name}' changed on disk, reloading 🔄")
+            # On failure the previous model keeps serving and the error is reported in health()
+            self._load(entry, stamp=stamp)
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+registry = ModelRegistry()
@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
 from pathlib import Path
+from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(BASE_DIR / ".env")
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -163,3 +165,208 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'register.CustomUser'
 
+
+# 🧠 Brain tumor U-Net micro-batching
+# Concurrent analysis requests are merged into one forward pass of up to
+# BRAIN_TUMOR_BATCH_MAX_SIZE scans, waiting at most BRAIN_TUMOR_BATCH_MAX_WAIT_MS.
+BRAIN_TUMOR_BATCH_MAX_SIZE = int(os.environ.get("BRAIN_TUMOR_BATCH_MAX_SIZE", 16))
+BRAIN_TUMOR_BATCH_MAX_WAIT_MS = float(os.environ.get("BRAIN_TUMOR_BATCH_MAX_WAIT_MS", 10))
+# A request gives up on its prediction after BRAIN_TUMOR_BATCH_TIMEOUT seconds
+BRAIN_TUMOR_BATCH_TIMEOUT = float(os.environ.get("BRAIN_TUMOR_BATCH_TIMEOUT", 60))
+
+# Bulk endpoint (/api/brain-tumor/analysis/bulk/): scans per forward pass / per request
+BRAIN_TUMOR_BULK_BATCH_SIZE = int(os.environ.get("BRAIN_TUMOR_BULK_BATCH_SIZE", 32))
+BRAIN_TUMOR_BULK_MAX_FILES = int(os.environ.get("BRAIN_TUMOR_BULK_MAX_FILES", 500))
+
+# Upload limits (brain_tumor/uploads.py), checked while the body streams in: per scan image and per bulk archive
+BRAIN_TUMOR_UPLOAD_MAX_BYTES = int(os.environ.get("BRAIN_TUMOR_UPLOAD_MAX_BYTES", 32 * 1024 ** 2))
+BRAIN_TUMOR_ARCHIVE_MAX_BYTES = int(os.environ.get("BRAIN_TUMOR_ARCHIVE_MAX_BYTES", 1024 ** 3))
+# Decompressed bytes one bulk archive may unpack to (each member is also capped at BRAIN_TUMOR_UPLOAD_MAX_BYTES)
+BRAIN_TUMOR_ARCHIVE_UNPACKED_MAX_BYTES = int(os.environ.get("BRAIN_TUMOR_ARCHIVE_UNPACKED_MAX_BYTES", 2 * 1024 ** 3))
+
+# Content-addressed result cache for repeated uploads (keyed on image SHA-256 + model version)
+BRAIN_TUMOR_CACHE_ENABLED = os.environ.get("BRAIN_TUMOR_CACHE_ENABLED", "1") == "1"
+BRAIN_TUMOR_CACHE_MAX_ENTRIES = int(os.environ.get("BRAIN_TUMOR_CACHE_MAX_ENTRIES", 10000))
+
+# Preprocessing (brain_tumor/utils.py): JPEG draft-mode decoding at reduced size, PNG zlib level for masks
+BRAIN_TUMOR_JPEG_DRAFT = os.environ.get("BRAIN_TUMOR_JPEG_DRAFT", "1") == "1"
+BRAIN_TUMOR_MASK_PNG_LEVEL = int(os.environ.get("BRAIN_TUMOR_MASK_PNG_LEVEL", 1))
+
+# Post-processing (brain_tumor/regions.py): mask threshold and the smallest connected region (model-grid pixels)
+# kept in `detected_region`; masks are stored compactly and rendered to PNG on demand
+BRAIN_TUMOR_MASK_THRESHOLD = float(os.environ.get("BRAIN_TUMOR_MASK_THRESHOLD", 0.5))
+BRAIN_TUMOR_MIN_REGION_PX = int(os.environ.get("BRAIN_TUMOR_MIN_REGION_PX", 4))
+
+# On-demand mask/overlay PNGs (/api/brain-tumor/analysis/<id>/mask|overlay/, brain_tumor/renders.py):
+# largest edge a client may request, the memory + disk cache bounds, and the browser Cache-Control max-age
+BRAIN_TUMOR_RENDER_MAX_SIZE = int(os.environ.get("BRAIN_TUMOR_RENDER_MAX_SIZE", 1024))
+BRAIN_TUMOR_RENDER_CACHE_MEMORY_MB = int(os.environ.get("BRAIN_TUMOR_RENDER_CACHE_MEMORY_MB", 32))
+BRAIN_TUMOR_RENDER_CACHE_DISK_MB = int(os.environ.get("BRAIN_TUMOR_RENDER_CACHE_DISK_MB", 256))  # 0 = memory only
+BRAIN_TUMOR_RENDER_CACHE_DIR = os.environ.get("BRAIN_TUMOR_RENDER_CACHE_DIR", str(BASE_DIR / "render_cache"))
+BRAIN_TUMOR_RENDER_MAX_AGE = int(os.environ.get("BRAIN_TUMOR_RENDER_MAX_AGE", 86400))
+
+# 3-D studies (/api/brain-tumor/analysis/volume/, brain_tumor/volumes.py): slices per forward pass,
+# size limits, and the intensity window (percentiles over a few sample slices) used to map them to 8-bit
+BRAIN_TUMOR_VOLUME_BATCH_SIZE = int(os.environ.get("BRAIN_TUMOR_VOLUME_BATCH_SIZE", 32))
+BRAIN_TUMOR_VOLUME_MAX_SLICES = int(os.environ.get("BRAIN_TUMOR_VOLUME_MAX_SLICES", 1024))
+BRAIN_TUMOR_VOLUME_MAX_BYTES = int(os.environ.get("BRAIN_TUMOR_VOLUME_MAX_BYTES", 2 * 1024 ** 3))
+BRAIN_TUMOR_VOLUME_WINDOW = tuple(float(p) for p in os.environ.get("BRAIN_TUMOR_VOLUME_WINDOW", "0.5,99.5").split(","))
+BRAIN_TUMOR_VOLUME_WINDOW_SAMPLES = int(os.environ.get("BRAIN_TUMOR_VOLUME_WINDOW_SAMPLES", 16))
+
+# ⚡ U-Net inference runtime (brain_tumor/inference.py): "keras", "graph" (traced tf.function,
+# optionally XLA) or "tflite" (artifact from `manage.py export_unet --quantize float16|dynamic|int8`)
+BRAIN_TUMOR_INFERENCE = os.environ.get("BRAIN_TUMOR_INFERENCE", "keras")
+BRAIN_TUMOR_UNET_PATH = os.path.join(BASE_DIR, "models", "model_attention_layer_unet.h5")
+BRAIN_TUMOR_TFLITE_PATH = os.environ.get(
+    "BRAIN_TUMOR_TFLITE_PATH", os.path.join(BASE_DIR, "models", "model_attention_layer_unet.float16.tflite")
+)
+BRAIN_TUMOR_TFLITE_THREADS = int(os.environ.get("BRAIN_TUMOR_TFLITE_THREADS", 0))  # 0 = all cores
+BRAIN_TUMOR_XLA = os.environ.get("BRAIN_TUMOR_XLA", "0") == "1"
+
+# 🏭 Out-of-process inference pool (brain_tumor/workers.py, `manage.py run_inference_pool`).
+# 0 = the U-Net runs inside each web process; N > 0 = web processes hand tensors to N separate
+# workers through shared memory and never import TensorFlow
+BRAIN_TUMOR_INFERENCE_WORKERS = int(os.environ.get("BRAIN_TUMOR_INFERENCE_WORKERS", 0))
+BRAIN_TUMOR_INFERENCE_INTRA_THREADS = int(os.environ.get("BRAIN_TUMOR_INFERENCE_INTRA_THREADS", 0))  # 0 = cores / workers
+BRAIN_TUMOR_INFERENCE_INTER_THREADS = int(os.environ.get("BRAIN_TUMOR_INFERENCE_INTER_THREADS", 1))
+BRAIN_TUMOR_INFERENCE_CPUS = os.environ.get("BRAIN_TUMOR_INFERENCE_CPUS", "")  # e.g. "4-7"; empty = no pinning
+BRAIN_TUMOR_INFERENCE_SOCKET = os.environ.get("BRAIN_TUMOR_INFERENCE_SOCKET", "/tmp/evogene-inference.sock")
+BRAIN_TUMOR_INFERENCE_TIMEOUT = float(os.environ.get("BRAIN_TUMOR_INFERENCE_TIMEOUT", 60))
+
+
+# 🩸 Diabetes batch scoring (/api/diabetes/predict/batch/)
+DIABETES_BATCH_MAX_ROWS = int(os.environ.get("DIABETES_BATCH_MAX_ROWS", 100000))
+# Single-request scoring through the NumPy-compiled pipeline (falls back to sklearn if it can't be verified)
+DIABETES_FAST_PATH = os.environ.get("DIABETES_FAST_PATH", "1") == "1"
+
+
+# 🧠 ML model registry (evogene_project/model_registry.py)
+# Models load lazily on first use; MODEL_PRELOAD is loaded by wsgi/asgi at import time
+# (i.e. in the gunicorn master with preload_app, before workers fork), MODEL_WARMUP in
+# each worker after fork. TensorFlow is not fork-safe, so the U-Net is warmed per worker.
+ML_MODELS = {
+    "brain_tumor_unet": {
+        "path": BRAIN_TUMOR_TFLITE_PATH if BRAIN_TUMOR_INFERENCE == "tflite" else BRAIN_TUMOR_UNET_PATH,
+        "loader": {
+            "keras": "brain_tumor.utils.load_unet",
+            "graph": "brain_tumor.inference.load_graph",
+            "tflite": "brain_tumor.inference.load_tflite",
+        }[BRAIN_TUMOR_INFERENCE],
+    },
+    "diabetes_pipeline": {
+        "path": os.path.join(BASE_DIR, "models", "diabetes_lgbm_ct_pipeline.pkl"),
+        "loader": "disease.utils.load_pipeline",
+        "on_load": "disease.utils.compile_fast_scorer",  # compiled with the model, not on the first request
+    },
+}
+MODEL_PRELOAD = [m for m in os.environ.get("MODEL_PRELOAD", "diabetes_pipeline").split(",") if m]
+# With the inference pool the U-Net is loaded by its workers, not by the web workers
+MODEL_WARMUP = [m for m in os.environ.get(
+    "MODEL_WARMUP", "" if BRAIN_TUMOR_INFERENCE_WORKERS else "brain_tumor_unet"
+).split(",") if m]
+# How often (seconds) to stat model files for hot reload; negative disables it
+MODEL_RELOAD_CHECK_SECONDS = float(os.environ.get("MODEL_RELOAD_CHECK_SECONDS", 5))
+
+
+# 🧬 Evo2 variant result cache (chatbot/variant_cache.py)
+EVO2_CACHE_ENABLED = os.environ.get("EVO2_CACHE_ENABLED", "1") == "1"
+EVO2_CACHE_TTL_SECONDS = int(os.environ.get("EVO2_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+EVO2_CACHE_MAX_ENTRIES = int(os.environ.get("EVO2_CACHE_MAX_ENTRIES", 50000))
+
+# 🧠 Gemini response cache (chatbot/llm_cache.py): exact-prompt tier for extraction,
+# extracted-variant + Evo2-result tier for summaries
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 20000))
+
+# 🧵 Chat analysis task pool (chatbot/tasks.py): bounded workers + DB-backed queue
+CHAT_WORKERS = int(os.environ.get("CHAT_WORKERS", 4))
+CHAT_POOL_AUTOSTART = os.environ.get("CHAT_POOL_AUTOSTART", "1") == "1"
+CHAT_QUEUE_MAX = int(os.environ.get("CHAT_QUEUE_MAX", 100))
+CHAT_QUEUE_POLL_SECONDS = float(os.environ.get("CHAT_QUEUE_POLL_SECONDS", 1.0))
+CHAT_TASK_MAX_ATTEMPTS = int(os.environ.get("CHAT_TASK_MAX_ATTEMPTS", 3))
+CHAT_RETRY_BACKOFF_SECONDS = float(os.environ.get("CHAT_RETRY_BACKOFF_SECONDS", 2.0))
+CHAT_RETRY_AFTER_SECONDS = int(os.environ.get("CHAT_RETRY_AFTER_SECONDS", 10))
+# Running tasks renew a lease every CHAT_TASK_HEARTBEAT_SECONDS; one not renewed for
+# CHAT_TASK_STALE_SECONDS is assumed orphaned by a dead process and re-queued
+CHAT_TASK_HEARTBEAT_SECONDS = float(os.environ.get("CHAT_TASK_HEARTBEAT_SECONDS", 10))
+CHAT_TASK_STALE_SECONDS = int(os.environ.get("CHAT_TASK_STALE_SECONDS", 60))
+
+# "pool" = threaded worker pool above; "asyncio" = chatbot/pipeline_async.py on the ASGI event loop
+CHAT_PIPELINE = os.environ.get("CHAT_PIPELINE", "pool")
+CHAT_ASYNC_MAX_IN_FLIGHT = int(os.environ.get("CHAT_ASYNC_MAX_IN_FLIGHT", 500))
+CHAT_ASYNC_MAX_CONNECTIONS = int(os.environ.get("CHAT_ASYNC_MAX_CONNECTIONS", 256))
+
+# The summary streams to SSE clients token by token; the stored partial result is refreshed this often
+CHAT_SUMMARY_FLUSH_SECONDS = float(os.environ.get("CHAT_SUMMARY_FLUSH_SECONDS", 0.5))
+
+# Parse "chr12:43119628 G>A"-style prompts locally instead of asking Gemini to extract the variant
+CHAT_PRE_PARSER_ENABLED = os.environ.get("CHAT_PRE_PARSER_ENABLED", "1") == "1"
+
+# 🧬 Variant scoring backend: "http" (Evo2 deployment), "local" (offline heuristic stand-in) or
+# "replay" (recorded responses, see chatbot/scoring.py)
+EVO2_BACKEND = os.environ.get("EVO2_BACKEND", "http")
+EVO2_ENDPOINT_URL = os.environ.get(
+    "EVO2_ENDPOINT_URL",
+    "https://anmol1140w--variant-analysis-evo2-evo2model-analyze-sing-4a3d81.modal.run",
+)
+EVO2_RECORD_PATH = os.environ.get("EVO2_RECORD_PATH", "")  # append every HTTP response here for replay
+EVO2_REPLAY_PATH = os.environ.get("EVO2_REPLAY_PATH", str(BASE_DIR / "evo2_responses.jsonl"))
+EVO2_REPLAY_MISS = os.environ.get("EVO2_REPLAY_MISS", "error")  # or "local"
+
+# Batch variant analysis (/api/chat/batch/, VCF uploads): Evo2 calls in flight per task, and an
+# optional endpoint that scores EVO2_BATCH_SIZE variants per request
+CHAT_BATCH_MAX_VARIANTS = int(os.environ.get("CHAT_BATCH_MAX_VARIANTS", 200))
+CHAT_BATCH_EVO2_CONCURRENCY = int(os.environ.get("CHAT_BATCH_EVO2_CONCURRENCY", 8))
+EVO2_BATCH_ENDPOINT_URL = os.environ.get("EVO2_BATCH_ENDPOINT_URL", "")
+EVO2_BATCH_SIZE = int(os.environ.get("EVO2_BATCH_SIZE", 32))
+
+# 🛡️ Outbound call resilience for Gemini / Evo2 (chatbot/resilience.py)
+# Each task has an overall SLA; stages share what is left of it by weight
+CHAT_TASK_SLA_SECONDS = float(os.environ.get("CHAT_TASK_SLA_SECONDS", 60))
+CHAT_BATCH_SLA_SECONDS = float(os.environ.get("CHAT_BATCH_SLA_SECONDS", 300))
+CHAT_STAGE_WEIGHTS = {"extract": 1, "score": 2, "summarize": 1}
+# Per-call timeout when no task deadline applies
+CHAT_DEPENDENCY_TIMEOUTS = {
+    "gemini": float(os.environ.get("GEMINI_TIMEOUT_SECONDS", 30)),
+    "evo2": float(os.environ.get("EVO2_TIMEOUT_SECONDS", 30)),
+}
+# Attempts per Gemini / Evo2 call; errors retried here are not retried again by the task pool
+CHAT_RETRY_ATTEMPTS = int(os.environ.get("CHAT_RETRY_ATTEMPTS", 3))
+CHAT_RETRY_BACKOFF_BASE_SECONDS = float(os.environ.get("CHAT_RETRY_BACKOFF_BASE_SECONDS", 0.2))
+CHAT_RETRY_BACKOFF_MAX_SECONDS = float(os.environ.get("CHAT_RETRY_BACKOFF_MAX_SECONDS", 2.0))
+# Trip after this failure rate over the last CHAT_BREAKER_WINDOW calls (once CHAT_BREAKER_MIN_CALLS were seen)
+CHAT_BREAKER_WINDOW = int(os.environ.get("CHAT_BREAKER_WINDOW", 50))
+CHAT_BREAKER_MIN_CALLS = int(os.environ.get("CHAT_BREAKER_MIN_CALLS", 10))
+CHAT_BREAKER_FAILURE_RATE = float(os.environ.get("CHAT_BREAKER_FAILURE_RATE", 0.5))
+CHAT_BREAKER_OPEN_SECONDS = float(os.environ.get("CHAT_BREAKER_OPEN_SECONDS", 15))
+# Send a second request when one is slower than the dependency's recent p95 (idempotent calls only)
+CHAT_HEDGE_DEPENDENCIES = [d for d in os.environ.get("CHAT_HEDGE_DEPENDENCIES", "evo2").split(",") if d]
+CHAT_HEDGE_MIN_SAMPLES = int(os.environ.get("CHAT_HEDGE_MIN_SAMPLES", 20))
+CHAT_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("CHAT_HEDGE_MIN_DELAY_SECONDS", 0.05))
+CHAT_RESILIENCE_THREADS = int(os.environ.get("CHAT_RESILIENCE_THREADS", 32))
+
+# 🧬 Local reference genomes (plain FASTA + .fai) used to check REF / position before calling Evo2.
+# Assemblies without a FASTA are not validated.
+REFERENCE_GENOMES = {
+    "hg38": os.environ.get("REFERENCE_FASTA_HG38", ""),
+    "hg19": os.environ.get("REFERENCE_FASTA_HG19", ""),
+}
+REFERENCE_FLANK_BASES = int(os.environ.get("REFERENCE_FLANK_BASES", 50))
+
+# Chat task results: "database" (TaskResult table), "sqlite" (standalone file) or "files" (legacy JSON dir)
+CHAT_RESULT_STORE = os.environ.get("CHAT_RESULT_STORE", "database")
+CHAT_RESULT_SQLITE_PATH = os.environ.get("CHAT_RESULT_SQLITE_PATH", str(BASE_DIR / "task_results.sqlite3"))
+CHAT_RESULT_TTL_SECONDS = int(os.environ.get("CHAT_RESULT_TTL_SECONDS", 30 * 24 * 3600))
+CHAT_RESULT_CLEANUP_INTERVAL_SECONDS = int(os.environ.get("CHAT_RESULT_CLEANUP_INTERVAL_SECONDS", 600))
+CHAT_RESULT_QUERY_MAX = int(os.environ.get("CHAT_RESULT_QUERY_MAX", 500))
+
+# Pushed task status (SSE stream + ETag long-poll on /api/status/<id>/)
+CHAT_STATUS_POLL_SECONDS = float(os.environ.get("CHAT_STATUS_POLL_SECONDS", 1.0))
+CHAT_STATUS_KEEPALIVE_SECONDS = int(os.environ.get("CHAT_STATUS_KEEPALIVE_SECONDS", 15))
+CHAT_STATUS_STREAM_MAX_SECONDS = int(os.environ.get("CHAT_STATUS_STREAM_MAX_SECONDS", 300))
+# Under WSGI each open stream holds a server thread: cap them per process and keep each one short
+# (EventSource reconnects with Last-Event-ID); over the cap clients get 503 and fall back to the long-poll
+CHAT_STATUS_MAX_SYNC_STREAMS = int(os.environ.get("CHAT_STATUS_MAX_SYNC_STREAMS", 2))
+CHAT_STATUS_SYNC_STREAM_MAX_SECONDS = int(os.environ.get("CHAT_STATUS_SYNC_STREAM_MAX_SECONDS", 30))
+CHAT_STATUS_LONG_POLL_MAX_SECONDS = int(os.environ.get("CHAT_STATUS_LONG_POLL_MAX_SECONDS", 30))
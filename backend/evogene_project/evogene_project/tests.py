@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from .model_registry import ModelRegistry
+
+
+def _load(path):
+    return {"path": path}
+
+
+class ModelRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "model.bin")
+        with open(path, "wb") as f:
+            f.write(b"weights")
+        overrides = override_settings(
+            ML_MODELS={"diabetes_pipeline": {"path": path, "loader": "evogene_project.tests._load"}},
+            MODEL_PRELOAD=[], MODEL_WARMUP=["diabetes_pipeline"],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_warm_up_loads_models_from_settings_on_a_fresh_registry(self):
+        registry = ModelRegistry()
+        self.assertFalse(registry.ready())
+        registry.warm_up(["diabetes_pipeline"])
+        self.assertTrue(registry.is_loaded("diabetes_pipeline"))
+        self.assertTrue(registry.ready())
+
+    def test_warm_up_skips_unknown_models(self):
+        registry = ModelRegistry()
+        registry.warm_up(["diabetes_pipeline", "missing"])
+        self.assertTrue(registry.ready())
+        self.assertFalse(registry.ready(["missing"]))
@@ -19,12 +19,26 @@ from django.urls import path, include
 from django.http import JsonResponse
 from django.conf import settings
 from django.conf.urls.static import static
+from .model_registry import registry
 def home(request):
     return JsonResponse({"message": "EvoGene API is running 🚀"})
 
+
+def model_health(request):
+    """Load state / version / errors of every registered ML model."""
+    return JsonResponse({"ready": registry.ready(), "models": registry.health()})
+
+
+def model_ready(request):
+    """Readiness probe: 200 once the MODEL_PRELOAD + MODEL_WARMUP models are loaded."""
+    ready = registry.ready()
+    return JsonResponse({"ready": ready}, status=200 if ready else 503)
+
 urlpatterns = [
     path('', home), 
     path('admin/', admin.site.urls),
+    path('api/health/models/', model_health),
+    path('api/health/ready/', model_ready),
     path('api/', include('register.urls')),  
     path('api/', include('disease.urls')),
     path('api/', include('chatbot.urls')),
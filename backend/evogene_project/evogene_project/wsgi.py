@@ -17,3 +17,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'evogene_project.settings')
 
 application = get_wsgi_application()
+
+# Load the fork-safe models now: under gunicorn --preload this runs in the master,
+# so workers share the pages copy-on-write instead of each holding a copy.
+from django.conf import settings  # noqa: E402
+from .model_registry import registry  # noqa: E402
+
+registry.warm_up(settings.MODEL_PRELOAD)
+
+# Start the chat task workers (and recover tasks interrupted by the last shutdown).
+# gunicorn.conf.py turns this off and starts them in each worker after fork instead.
+if settings.CHAT_POOL_AUTOSTART:
+    from chatbot.pipeline import pool  # noqa: E402
+    pool.start()
@@ -0,0 +1,24 @@
+# gunicorn.conf.py — `gunicorn -c gunicorn.conf.py evogene_project.wsgi`
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Import the app (and settings.MODEL_PRELOAD models) once in the master before forking
+preload_app = True
+
+# Threads don't survive fork: chat task workers are started per worker in post_fork
+os.environ.setdefault("CHAT_POOL_AUTOSTART", "0")
+
+
+def post_fork(server, worker):
+    # Models that must not cross a fork (TensorFlow) are loaded in each worker instead
+    from django.conf import settings
+    from evogene_project.model_registry import registry
+
+    registry.warm_up(settings.MODEL_WARMUP)
+
+    from chatbot.pipeline import pool
+    pool.start()
@@ -10,6 +10,7 @@ import axios from "axios";
 interface Message {
   sender: "user" | "bot";
   text: string;
+  streaming?: boolean; // summary still being written
 }
 
 // 🧠 API response types
@@ -21,12 +22,86 @@ interface ChatResponse {
 
 interface StatusResponse {
   status: "processing" | "completed" | "error";
+  stage?: string;
   summary?: string;
   report?: string;
   response?: string;
   error?: string;
 }
 
+const STATUS_URL = "http://localhost:8000/api/status";
+
+const STAGE_LABELS: Record<string, string> = {
+  queued: "Queued, waiting for a free worker...",
+  extracting: "Reading the variant from your message...",
+  scoring: "Scoring the variant with Evo2...",
+  summarizing: "Writing the summary...",
+};
+
+// 📡 Resolve with the final status, reporting stage changes and the summary as it is written
+function waitForResult(
+  taskId: string,
+  onStage: (stage: string) => void,
+  onSummary: (text: string) => void
+): Promise<StatusResponse | null> {
+  return new Promise((resolve) => {
+    const source = new EventSource(`${STATUS_URL}/${taskId}/stream/`);
+    let summary = "";
+
+    source.addEventListener("stage", (event) => {
+      const data: StatusResponse = JSON.parse((event as MessageEvent).data);
+      if (data.status === "processing") {
+        onStage(data.stage || "queued");
+        // Entering "summarizing" carries whatever summary text already exists
+        if (data.summary) {
+          summary = data.summary;
+          onSummary(summary);
+        }
+      } else {
+        source.close();
+        resolve(data);
+      }
+    });
+
+    // Summary tokens: `offset` is where the new text starts, so a reconnect never duplicates it
+    source.addEventListener("token", (event) => {
+      const { text, offset }: { text: string; offset: number } = JSON.parse((event as MessageEvent).data);
+      summary = summary.slice(0, offset) + text;
+      onSummary(summary);
+    });
+
+    // Stream unavailable (proxy, old server...) → long-poll with ETags instead
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        longPoll(taskId, onStage).then(resolve);
+      }
+    };
+  });
+}
+
+async function longPoll(taskId: string, onStage: (stage: string) => void): Promise<StatusResponse | null> {
+  let etag = "";
+  const deadline = Date.now() + 5 * 60 * 1000;
+
+  while (Date.now() < deadline) {
+    try {
+      const res = await axios.get<StatusResponse>(`${STATUS_URL}/${taskId}/?wait=25`, {
+        headers: etag ? { "If-None-Match": etag } : {},
+        validateStatus: (s) => s === 200 || s === 202 || s === 304,
+      });
+      if (res.status === 304) continue;
+
+      etag = res.headers["etag"] || "";
+      if (res.data.status !== "processing") return res.data;
+      onStage(res.data.stage || "queued");
+    } catch (pollErr) {
+      console.warn("Polling error:", pollErr);
+      await new Promise((r) => setTimeout(r, 3000));
+    }
+  }
+  return null;
+}
+
 export default function ChatPage() {
   const router = useRouter();
   const [messages, setMessages] = useState<Message[]>([]);
@@ -73,44 +148,39 @@ export default function ChatPage() {
       };
       setMessages((prev) => [...prev, botProcessing]);
 
-      // Step 2️⃣ — Poll the /status endpoint
-      let done = false;
-      let attempt = 0;
-
-      while (!done && attempt < 30) {
-        await new Promise((r) => setTimeout(r, 3000)); // wait 3s
-        attempt++;
-
-        try {
-          const statusRes = await axios.get<StatusResponse>(
-            `http://localhost:8000/api/status/${taskId}/`
-          );
-          const data = statusRes.data;
-
-          if (data.status === "completed") {
-            const botReply =
-              data.summary ||
-              data.report ||
-              data.response ||
-              "✅ EvoGene Assistant: Analysis complete, but no summary returned.";
-
-            const botMsg: Message = { sender: "bot", text: botReply };
-            setMessages((prev) => [...prev, botMsg]);
-            done = true;
-          } else if (data.status === "error") {
-            const botMsg: Message = {
-              sender: "bot",
-              text: `⚠️ EvoGene Assistant: ${data.error || "Something went wrong during analysis."}`,
-            };
-            setMessages((prev) => [...prev, botMsg]);
-            done = true;
-          }
-        } catch (pollErr) {
-          console.warn("Polling error:", pollErr);
-        }
-      }
+      // Step 2️⃣ — Follow progress pushed over Server-Sent Events (long-poll fallback)
+      // Replace the previous progress line / partial summary instead of stacking them
+      const replaceLast = (msg: Message) =>
+        setMessages((prev) => {
+          const last = prev[prev.length - 1];
+          const replaceable = last?.sender === "bot" && (last.streaming || last.text.startsWith("🧬"));
+          return replaceable ? [...prev.slice(0, -1), msg] : [...prev, msg];
+        });
 
-      if (!done) {
+      const data = await waitForResult(
+        taskId,
+        (stage) => {
+          const label = STAGE_LABELS[stage];
+          if (label) replaceLast({ sender: "bot", text: `🧬 EvoGene Assistant: ${label}` });
+        },
+        (summary) => replaceLast({ sender: "bot", text: summary, streaming: true })
+      );
+
+      if (data?.status === "completed") {
+        const botReply =
+          data.summary ||
+          data.report ||
+          data.response ||
+          "✅ EvoGene Assistant: Analysis complete, but no summary returned.";
+
+        replaceLast({ sender: "bot", text: botReply });
+      } else if (data?.status === "error") {
+        const botMsg: Message = {
+          sender: "bot",
+          text: `⚠️ EvoGene Assistant: ${data.error || "Something went wrong during analysis."}`,
+        };
+        setMessages((prev) => [...prev, botMsg]);
+      } else {
         const botMsg: Message = {
           sender: "bot",
           text: "⌛ EvoGene Assistant: Still processing... try again later!",